@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Figures are only written to files
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import pandas as pd
+from functions.pipeline import run_dataset
+from functions.prefilter import PREFILTER_METHODS, DEFAULT_SETTINGS
+
+# -------------------------------------------------------
+# Headless batch analysis of one or many datasets, without Streamlit.
+#
+#   python batch.py --counts counts.csv --metadata metadata.csv --output results/
+#   python batch.py --manifest datasets.csv --output results/ --jobs 4
+#
+# The manifest is a CSV file with one dataset per row and the columns "name",
+# "counts", "metadata" and optionally "factor", "mode", "reference" and "genes"
+# (empty cells use the command line values). Each dataset is written to
+# <output>/<name>/, and a summary of all runs to <output>/batch_summary.json.
+# -------------------------------------------------------
+
+# Manifest columns that override the command line arguments per dataset
+MANIFEST_COLUMNS = ["factor", "mode", "reference", "genes"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the DGE analysis workflow without the Streamlit app.")
+
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--manifest", help="CSV file listing datasets (columns name, counts, metadata, ...).")
+    inputs.add_argument("--counts", help="Count matrix of a single dataset (CSV/TSV, optionally .gz or .zst).")
+    parser.add_argument("--metadata", help="Metadata CSV file of a single dataset.")
+    parser.add_argument("--name", default="dataset", help="Name of a single dataset (output subdirectory).")
+    parser.add_argument("--output", required=True, help="Output directory.")
+
+    parser.add_argument("--factor", help="Metadata column used as the design factor (default: first column).")
+    parser.add_argument("--mode", choices=["all pairs", "vs reference"], default="all pairs",
+                        help="Comparisons computed when no --contrast is given.")
+    parser.add_argument("--reference", help="Reference condition for --mode 'vs reference'.")
+    parser.add_argument("--contrast", nargs=2, action="append", metavar=("EXPERIMENTAL", "REFERENCE"),
+                        help="Comparison to compute; can be repeated.")
+    parser.add_argument("--genes", help="Text file with one gene per line (custom heatmap and trend table).")
+
+    parser.add_argument("--prefilter", choices=[m for m in PREFILTER_METHODS.values() if m] + ["none"],
+                        default=DEFAULT_SETTINGS["method"], help="Low-count gene prefilter method.")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_SETTINGS["min_count"])
+    parser.add_argument("--min-samples", type=int, default=DEFAULT_SETTINGS["min_samples"])
+    parser.add_argument("--padj", type=float, default=0.05, help="Adjusted p-value threshold.")
+    parser.add_argument("--lfc", type=float, default=1.0, help="Absolute log2 fold change threshold.")
+    parser.add_argument("--top-n", type=int, default=50, help="Number of genes in the top genes heatmap.")
+
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of datasets analyzed in parallel (default: all CPUs, at most one per dataset).")
+
+    args = parser.parse_args(argv)
+    if args.counts and not args.metadata:
+        parser.error("--metadata is required with --counts")
+    if args.mode == "vs reference" and not args.reference and not args.manifest:
+        parser.error("--reference is required with --mode 'vs reference'")
+    return args
+
+
+def build_datasets(args):
+    """
+    Builds the run_pipeline arguments of every dataset from the command line and the manifest.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        list of dict: Keyword arguments of functions.pipeline.run_dataset.
+    """
+    defaults = {"factor": args.factor, "mode": args.mode, "reference": args.reference, "genes": args.genes}
+
+    if args.manifest:
+        manifest = pd.read_csv(args.manifest, dtype=str).fillna("")
+        missing = {"name", "counts", "metadata"} - set(manifest.columns)
+        if missing:
+            raise SystemExit(f"Manifest is missing column(s): {', '.join(sorted(missing))}")
+        if manifest["name"].duplicated().any():
+            raise SystemExit("Dataset names in the manifest must be unique.")
+        rows = manifest.to_dict("records")
+    else:
+        rows = [{"name": args.name, "counts": args.counts, "metadata": args.metadata}]
+
+    prefilter = {
+        "method": None if args.prefilter == "none" else args.prefilter,
+        "min_count": args.min_count,
+        "min_samples": args.min_samples
+    }
+
+    datasets = []
+    for row in rows:
+        # Empty manifest cells fall back to the command line values
+        options = {column: row.get(column) or defaults[column] for column in MANIFEST_COLUMNS}
+        datasets.append({
+            "name": row["name"],
+            "counts_path": row["counts"],
+            "metadata_path": row["metadata"],
+            "output_dir": os.path.join(args.output, row["name"]),
+            "factor": options["factor"],
+            "mode": options["mode"],
+            "reference": options["reference"],
+            "contrasts": args.contrast,
+            "prefilter": prefilter,
+            "pval_threshold": args.padj,
+            "lfc_threshold": args.lfc,
+            "top_n": args.top_n,
+            "genes_path": options["genes"]
+        })
+    return datasets
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = build_datasets(args)
+    os.makedirs(args.output, exist_ok=True)
+
+    # Datasets run side by side; the CPUs are shared between them
+    n_jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(datasets)))
+    n_cpus = max(1, (os.cpu_count() or 1) // n_jobs)
+    for dataset in datasets:
+        dataset["n_cpus"] = n_cpus
+
+    if n_jobs == 1:
+        summaries = [run_dataset(dataset) for dataset in datasets]
+    else:
+        # "spawn" is used for the same reasons as in the app (threads in the parent process)
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+            summaries = list(executor.map(run_dataset, datasets))
+
+    with open(os.path.join(args.output, "batch_summary.json"), "w", encoding="utf-8") as file:
+        json.dump(summaries, file, indent=2)
+
+    failed = [summary["name"] for summary in summaries if summary["status"] == "failed"]
+    print(f"{len(summaries) - len(failed)} of {len(summaries)} datasets completed"
+          + (f"; failed: {', '.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import tracemalloc
+
+# Figures are only rendered to memory
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import pydeseq2
+from benchmarks.synthetic import synthetic_counts
+from functions import fit_cache, dge_analysis
+from functions.ingest import read_count_matrix
+from functions.normalized_counts import extract_normalized_counts, size_factor_normalization
+from functions.dge_analysis import run_dge_analysis
+from functions.expression_trends import expression_trends
+from functions.average_counts import average_counts
+from functions.pca import pca, compute_pca, plot_pca, plot_scree
+from functions.maplot import ma_plot, interactive_ma_plot
+from functions.volcano_plot import volcano_plot, interactive_volcano_plot
+from functions.clustermap import plot_heatmap
+from functions.clustermap_custom import custom_heatmap
+
+# -------------------------------------------------------
+# Benchmark of the analysis functions on synthetic negative binomial data.
+#
+#   python -m benchmarks.run_benchmarks --genes 5000 20000 --samples 6 24 --output bench.json
+#
+# Every combination of gene and sample numbers is one run. Each stage records its
+# wall time, the peak memory allocated while it runs (tracemalloc, this process
+# only) and the maximum resident set size of the process so far (Unix only).
+# -------------------------------------------------------
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Number of genes used for the custom heatmap and the trend table
+N_SELECTED_GENES = 50
+
+
+def measure(stages, stage, function, *args, memory=True, **kwargs):
+    """
+    Runs a function and appends its time and memory usage to the list of stage records.
+
+    Matplotlib figures returned by the function are rendered to PNG (as in the app)
+    and closed, so drawing time is included.
+
+    Args:
+        stages (list of dict): Records of the run, extended in place.
+        stage (str): Name of the stage.
+        function (callable): Function to benchmark.
+        memory (bool): Trace memory allocations (slows down pure Python code somewhat).
+
+    Returns:
+        The return value of the function.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+
+    result = function(*args, **kwargs)
+    figure = result[0] if isinstance(result, tuple) else result
+    if isinstance(figure, plt.Figure):
+        figure.savefig(io.BytesIO(), format="png", bbox_inches="tight", dpi=200)
+        plt.close(figure)
+
+    record = {"stage": stage, "seconds": round(time.perf_counter() - start, 4)}
+    if memory:
+        record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+        tracemalloc.stop()
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        record["max_rss_mb"] = round(max_rss / (1024 ** 2 if sys.platform == "darwin" else 1024), 2)
+
+    stages.append(record)
+    print(f"  {stage:<32} {record['seconds']:>9.3f} s" + (f" {record['peak_mb']:>10.1f} MB" if memory else ""),
+          flush=True)
+    return result
+
+
+def run_benchmark(n_genes, n_samples, n_conditions=3, de_fraction=0.1, seed=0, memory=True):
+    """
+    Benchmarks all stages of the workflow on one synthetic dataset.
+
+    Fits are not taken from the fit or contrast caches (cleared before each stage
+    that fits a model); the disk tier of the fit cache is disabled.
+
+    Args:
+        n_genes (int): Number of genes.
+        n_samples (int): Number of samples.
+        n_conditions (int): Number of conditions (at least 2).
+        de_fraction (float): Fraction of differentially expressed genes.
+        seed (int): Seed of the data generator.
+        memory (bool): Measure memory allocations of each stage.
+
+    Returns:
+        dict: "params" of the dataset and "stages" (list of records with "stage", "seconds",
+              "peak_mb" and "max_rss_mb").
+    """
+    count_matrix, metadata, true_lfc = synthetic_counts(n_genes, n_samples, n_conditions, de_fraction, seed)
+    factor = "condition"
+    levels = true_lfc.columns.tolist()
+    contrast = [factor, levels[1], levels[0]]
+    label = f"{levels[1]}_vs_{levels[0]}"
+    selected_genes = true_lfc.index[true_lfc[levels[1]] != 0][:N_SELECTED_GENES].tolist()
+
+    # Only the measured stages may fit models
+    fit_cache.CACHE_DIR = None
+    fit_cache.clear_cache()
+    dge_analysis.clear_cache()
+
+    stages = []
+    csv = count_matrix.to_csv().encode("utf-8")
+    count_matrix = measure(stages, "ingest", read_count_matrix, io.BytesIO(csv), memory=memory)
+
+    normalized_counts = measure(stages, "extract_normalized_counts", extract_normalized_counts,
+                                count_matrix, metadata, factor, memory=memory)
+    fit_cache.clear_cache()
+    dge_analysis.clear_cache()
+
+    results, dds = measure(stages, "run_dge_analysis", run_dge_analysis, count_matrix, contrast, metadata, factor,
+                           memory=memory)
+
+    # Contrast results of run_dge_analysis would be reused; only the fit is shared with the app
+    dge_analysis.clear_cache()
+    measure(stages, "expression_trends", expression_trends, selected_genes, levels, factor, 0.05, 1.0, dds,
+            memory=memory)
+    mean_counts = measure(stages, "average_counts", average_counts, normalized_counts, metadata, factor,
+                          memory=memory)
+
+    measure(stages, "pca", pca, normalized_counts, metadata, factor, memory=memory)
+    pca_result = measure(stages, "compute_pca", compute_pca,
+                         size_factor_normalization(count_matrix, transform="vst"), memory=memory)
+    measure(stages, "plot_pca", plot_pca, pca_result, metadata, factor, memory=memory)
+    measure(stages, "plot_scree", plot_scree, pca_result, memory=memory)
+
+    measure(stages, "ma_plot", ma_plot, results, 0.05, label, memory=memory)
+    measure(stages, "ma_plot (density)", ma_plot, results, 0.05, label, density=True, memory=memory)
+    measure(stages, "volcano_plot", volcano_plot, results, 0.05, 1.0, label, memory=memory)
+    measure(stages, "volcano_plot (density)", volcano_plot, results, 0.05, 1.0, label, density=True,
+            memory=memory)
+    measure(stages, "interactive_ma_plot", interactive_ma_plot, results, label, memory=memory)
+    measure(stages, "interactive_volcano_plot", interactive_volcano_plot, results, label, memory=memory)
+    measure(stages, "plot_heatmap", plot_heatmap, results, mean_counts, 50, True, True, "adjusted p-value", label,
+            memory=memory)
+    measure(stages, "custom_heatmap", custom_heatmap, selected_genes, mean_counts, True, True, memory=memory)
+    measure(stages, "custom_heatmap (samples)", custom_heatmap, selected_genes, normalized_counts, True, True,
+            conditions=metadata[factor], memory=memory)
+
+    return {
+        "params": {
+            "genes": n_genes,
+            "samples": n_samples,
+            "conditions": n_conditions,
+            "de_fraction": de_fraction,
+            "seed": seed
+        },
+        "stages": stages
+    }
+
+
+def environment():
+    """
+    Describes the machine and library versions, so results of different runs can be compared.
+    """
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pydeseq2": pydeseq2.__version__
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DGE analysis functions on synthetic data.")
+    parser.add_argument("--genes", type=int, nargs="+", default=[20000], help="Numbers of genes.")
+    parser.add_argument("--samples", type=int, nargs="+", default=[12], help="Numbers of samples.")
+    parser.add_argument("--conditions", type=int, default=3,
+                        help="Number of conditions (at least 2; trend tables compare all of them).")
+    parser.add_argument("--de-fraction", type=float, default=0.1, help="Fraction of differentially expressed genes.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generator.")
+    parser.add_argument("--no-memory", action="store_true", help="Only measure time (no allocation tracing).")
+    parser.add_argument("--output", help="JSON file for the results (default: print to stdout).")
+    args = parser.parse_args(argv)
+
+    if args.conditions < 2:
+        parser.error("--conditions must be at least 2")
+
+    runs = []
+    for n_genes, n_samples in itertools.product(args.genes, args.samples):
+        print(f"{n_genes} genes x {n_samples} samples", flush=True)
+        runs.append(run_benchmark(n_genes, n_samples, args.conditions, args.de_fraction, args.seed,
+                                  memory=not args.no_memory))
+
+    report = {"environment": environment(), "runs": runs}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+
+def synthetic_counts(n_genes=20000, n_samples=12, n_conditions=2, de_fraction=0.1, seed=0):
+    """
+    Generates a synthetic RNA-seq count matrix from a negative binomial model.
+
+    Mean expression is log-normal across genes, dispersions follow the DESeq2-like
+    trend 0.05 + 1 / mean, and each sample gets a log-normal size factor. A fraction
+    of the genes is differentially expressed: their mean changes by a random
+    log2 fold change (|LFC| between 1 and 3) in every condition except the first.
+
+    Args:
+        n_genes (int): Number of genes.
+        n_samples (int): Number of samples (split as evenly as possible between conditions).
+        n_conditions (int): Number of conditions.
+        de_fraction (float): Fraction of differentially expressed genes.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        tuple:
+            - pd.DataFrame: Count matrix (genes x samples, uint32).
+            - pd.DataFrame: Metadata with column "condition" (samples as index).
+            - pd.DataFrame: True log2 fold changes of each condition against the first (genes x conditions).
+    """
+    rng = np.random.default_rng(seed)
+
+    genes = [f"gene_{i:06d}" for i in range(1, n_genes + 1)]
+    samples = [f"sample_{i:03d}" for i in range(1, n_samples + 1)]
+    levels = [f"C{i}" for i in range(1, n_conditions + 1)]
+    conditions = np.array(levels)[np.arange(n_samples) % n_conditions]
+
+    # Baseline expression and dispersion of each gene
+    base_mean = rng.lognormal(mean=5.0, sigma=2.0, size=n_genes)
+    dispersion = 0.05 + 1.0 / base_mean
+
+    # True log2 fold changes (0 for the first condition and non-DE genes)
+    lfc = np.zeros((n_genes, n_conditions))
+    de_genes = rng.random(n_genes) < de_fraction
+    n_de = int(de_genes.sum())
+    lfc[de_genes, 1:] = rng.choice([-1, 1], size=(n_de, n_conditions - 1)) * rng.uniform(1, 3, (n_de, n_conditions - 1))
+
+    size_factors = rng.lognormal(mean=0.0, sigma=0.2, size=n_samples)
+    condition_codes = np.arange(n_samples) % n_conditions
+    mu = base_mean[:, None] * 2.0 ** lfc[:, condition_codes] * size_factors[None, :]
+
+    # Negative binomial with mean mu and variance mu + dispersion * mu^2
+    n = 1.0 / dispersion[:, None]
+    counts = rng.negative_binomial(n, n / (n + mu))
+
+    count_matrix = pd.DataFrame(counts.astype(np.uint32), index=pd.Index(genes, name="GeneID"), columns=samples)
+    metadata = pd.DataFrame({"condition": conditions}, index=pd.Index(samples, name="SampleID"))
+    true_lfc = pd.DataFrame(lfc, index=genes, columns=levels)
+
+    return count_matrix, metadata, true_lfc
@@ -1,13 +1,111 @@
+import time
 import streamlit as st
-from functions.dge_analysis import run_dge_analysis  # Custom function to run DGE using PyDESeq2
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from functions.dge_analysis import run_batch_dge, build_contrasts, run_dge_job, cache_contrast_results  # Custom functions to run DGE using PyDESeq2
+from functions.fit_cache import get_fitted_dds, add_fitted_dds, is_fit_cached, restore_unpickled_dds, reusable_fit  # Shared cache of fitted DESeq2 datasets
+from functions.jobs import submit_job, job_status, job_result, cancel_job, forget_job, JOB_CPUS  # Background job runner
 from functions.average_counts import average_counts  # Function to compute average normalized counts
-from functions.dge_summary import summarize_dge      # Function to summarize DGE results
+from functions.dge_summary import summarize_dge, PVALUE_FORMAT  # Function to summarize DGE results
 from functions.normalized_counts import extract_normalized_counts # Function to calculcate normalized counts
+from functions.results_viewer import results_viewer  # Paginated table of results
+from functions.prefilter import filtered_counts, prefilter_sidebar, fit_time_saved  # Low-count gene prefilter
+from functions.instrumentation import recording  # Timing and memory instrumentation
+from functions.diagnostics import session_recorder, record_background_job  # Diagnostics of the analysis steps
+from functions.dataset_store import session_share, session_share_all  # Data shared by all sessions
+from functions.run_store import save_run  # Saved analyses that can be reopened later
+from functions.saved_runs import run_owner  # Owner recorded with saved analyses
 
 st.set_page_config(layout="wide")
 
 st.title("Differential Gene Expression Analysis")
 
+
+def store_dge_results(dds, batch_results, count_matrix, metadata, factor, contrasts, prefilter_summary):
+    """
+    Saves the results of a finished DGE analysis to session state and to the run store.
+    """
+    # Fits and tables with the same content are shared with other sessions (read-only)
+    dds = session_share(dds, "dds")
+    batch_results = session_share_all(batch_results, "batch_results")
+
+    label = next(iter(batch_results))
+    st.session_state["dds"] = dds
+    st.session_state["prefilter_summary"] = prefilter_summary
+    st.session_state["batch_results"] = batch_results
+    st.session_state["results"] = batch_results[label]
+    st.session_state["comparison_label"] = label
+    # Factor of this analysis; the factor selected in the sidebar may change before the next run
+    st.session_state["dge_factor"] = factor
+
+    # Reuse the fitted dataset instead of running DESeq2 a second time
+    normalized_counts = extract_normalized_counts(count_matrix, metadata, factor, dds=dds)
+
+    # Normalized counts of individual samples (for sample-level heatmaps) and their averages per condition
+    st.session_state["normalized_counts"] = session_share(normalized_counts, "normalized_counts")
+    st.session_state["average_counts"] = session_share(average_counts(normalized_counts, metadata, factor), "average_counts")
+    st.session_state["dge_done"] = True
+
+    # Saved under a unique run ID, so the analysis can be reopened later without refitting
+    try:
+        st.session_state["run_id"] = save_run(dds, batch_results, count_matrix, metadata, factor, contrasts,
+                                              prefilter_summary, name=st.session_state.get("count_matrix_name"),
+                                              owner=run_owner())
+    except (OSError, ValueError) as e:
+        st.session_state["run_id"] = None
+        st.warning(f"The analysis could not be saved: {e}")
+
+
+@st.fragment(run_every=1)
+def show_dge_job():
+    """
+    Shows the progress of the background DGE job and collects its results when finished.
+    """
+    job = st.session_state["dge_job"]
+    status = job_status(job["id"])
+
+    if status is None or status["status"] == "cancelled":
+        del st.session_state["dge_job"]
+        st.rerun()
+
+    if status["status"] == "done":
+        result = job_result(job["id"])
+
+        # Share the new fit and its comparisons with other sessions through the caches
+        dds = restore_unpickled_dds(result["dds"])
+        dds = add_fitted_dds(job["count_matrix"], job["metadata"], job["factor"], dds)
+        cache_contrast_results(dds, job["contrasts"], result["batch_results"])
+
+        record_background_job(status, dds, result.get("comparison_seconds"))
+        # Fragment reruns do not run run.py, so the recorder is activated here
+        with recording(session_recorder()):
+            store_dge_results(dds, result["batch_results"], job["count_matrix"], job["metadata"], job["factor"],
+                              job["contrasts"], job["prefilter_summary"])
+        del st.session_state["dge_job"]
+        st.rerun()
+
+    if status["status"] == "failed":
+        st.error("DGE Analysis failed.")
+        with st.expander("Show error details"):
+            st.code(status["error"])
+        if st.button("Dismiss"):
+            forget_job(job["id"])
+            del st.session_state["dge_job"]
+            st.rerun()
+        return
+
+    if status["status"] == "queued":
+        st.info(f"DGE Analysis is waiting for a free worker (position {status['queue_position']} in the queue).")
+    else:
+        elapsed = time.time() - status["started"]
+        st.progress(status["progress"], text=f"Running DGE Analysis: {status['stage']} ({elapsed:.0f} s)")
+
+    if st.button("Cancel analysis"):
+        cancel_job(job["id"])
+        forget_job(job["id"])
+        del st.session_state["dge_job"]
+        st.rerun()
+
+
 if not st.session_state["dge_done"] and "metadata" in st.session_state:
     st.markdown("*To run the analysis, please select the parameters in the sidebar and click the 'Run DGE Analysis' button.*")
 
@@ -26,52 +124,117 @@ if "count_matrix" in st.session_state and "metadata" in st.session_state:
         help="This column will be used to divide samples into comparison groups (e.g. treatment vs control)."
     )
     unique_levels = metadata[selected_factor].unique().tolist()
+
+    # Comparison mode: one pair, or many contrasts computed from a single model fit
+    comparison_modes = {
+        "Single comparison": None,
+        "All pairs": "all pairs",
+        "All vs reference": "vs reference"
+    }
+    comparison_mode = st.sidebar.radio(
+        "Comparison mode",
+        list(comparison_modes),
+        help="Batch modes fit the model once and compute all selected comparisons from it in parallel."
+    )
+
     reference = st.sidebar.selectbox(
         "Select reference condition",
         unique_levels,
+        disabled=comparison_mode == "All pairs",
         help="The reference condition serves as the baseline group for differential expression comparison."
     )
     experimental = st.sidebar.selectbox(
         "Select experimental condition",
         unique_levels,
+        disabled=comparison_mode != "Single comparison",
         help="The experimental condition will be compared against the reference group."
     )
     st.session_state["factor"] = selected_factor
 
-    # Run DGE analysis on button click
-    if st.sidebar.button("Run DGE Analysis"):
-        with st.spinner("Running DGE Analysis..."):
+    # Remove low-count genes before fitting (same settings as on the Overview page)
+    count_matrix, prefilter_summary = filtered_counts(count_matrix, prefilter_sidebar())
 
-            comparison_label = f"{experimental}_vs_{reference}".replace(" ", "_")
-            filename = f"dge_{comparison_label}.csv"
-            st.session_state["comparison_label"] = comparison_label
+    job_running = "dge_job" in st.session_state
 
-            results, dds = run_dge_analysis(
-                count_matrix,
-                [selected_factor, str(experimental), str(reference)],
-                metadata,
+    # Run DGE analysis on button click
+    if st.sidebar.button("Run DGE Analysis", disabled=job_running):
+        if comparison_modes[comparison_mode] is None:
+            contrasts = [[selected_factor, str(experimental), str(reference)]]
+        else:
+            # All contrasts are computed from the same fitted dataset
+            contrasts = build_contrasts(
                 selected_factor,
-                "dge_results.csv"
+                unique_levels,
+                comparison_modes[comparison_mode],
+                reference
             )
-            st.session_state["dds"] = dds
-            st.session_state["results"] = results
 
-            normalized_counts = extract_normalized_counts(
-                st.session_state["count_matrix"],
-                st.session_state["metadata"],
-                selected_factor
-            )
-
-            # Compute average normalized counts
-            averaged_counts = average_counts(normalized_counts, metadata, selected_factor)
-            st.session_state["average_counts"] = averaged_counts
+        if not contrasts:
+            # E.g. the condition column has only one group
+            st.warning("There is nothing to compare: the selected condition column needs at least two groups.")
+        elif is_fit_cached(count_matrix, metadata, selected_factor):
+            # The model was already fitted, only the comparisons are computed
+            with st.spinner("Running DGE Analysis..."):
+                dds = get_fitted_dds(count_matrix, metadata, selected_factor)
+                batch_results = run_batch_dge(dds, contrasts)
+                store_dge_results(dds, batch_results, count_matrix, metadata, selected_factor, contrasts,
+                                  prefilter_summary)
+                st.success("DGE Analysis Completed!")
+        else:
+            # Fit the model in a background worker process, so the page stays responsive.
+            # After a metadata edit, parts of an earlier fit of the same counts are reused.
+            st.session_state["dge_job"] = {
+                "id": submit_job(
+                    run_dge_job,
+                    (count_matrix, metadata, selected_factor, contrasts,
+                     reusable_fit(count_matrix, metadata, selected_factor), JOB_CPUS),
+                    owner=get_script_run_ctx().session_id,
+                    description=f"DGE analysis ({selected_factor})"
+                ),
+                "count_matrix": count_matrix,
+                "metadata": metadata,
+                "factor": selected_factor,
+                "contrasts": contrasts,
+                "prefilter_summary": prefilter_summary
+            }
+            st.rerun()
 
-            st.success("DGE Analysis Completed!")
-            st.session_state["dge_done"] = True
+    if job_running:
+        show_dge_job()
 
     # Display results if analysis has been run
     if st.session_state.get("dge_done"):
+        # Choose which comparison is shown here and on the Visualization page
+        batch_results = st.session_state.get("batch_results", {})
+        if len(batch_results) > 1:
+            labels = list(batch_results)
+            selected_label = st.selectbox(
+                "Show comparison",
+                labels,
+                index=labels.index(st.session_state["comparison_label"]),
+                format_func=lambda label: label.replace("_", " "),
+                help="All comparisons were computed from a single model fit."
+            )
+            st.session_state["comparison_label"] = selected_label
+            st.session_state["results"] = batch_results[selected_label]
+
         st.write(f"### DGE Results ({st.session_state['comparison_label'].replace('_', ' ')})")
+        if st.session_state.get("run_id"):
+            st.caption(f"Saved as run {st.session_state['run_id']} (can be reopened on the Home page).")
+
+        # Effect of the low-count gene prefilter on this analysis
+        removed = st.session_state["prefilter_summary"]["genes_removed"]
+        if removed:
+            saved = fit_time_saved(st.session_state["dds"], removed)
+            st.caption(
+                f"Prefilter removed {removed} of {st.session_state['prefilter_summary']['genes_before']} genes"
+                + (f", saving about {saved:.1f} s of model fitting." if saved is not None else ".")
+            )
+
+        # Parts of the model taken from an earlier fit of the same counts (e.g. after a metadata edit)
+        reused = st.session_state["dds"].uns.get("reused")
+        if reused:
+            st.caption(f"Reused from an earlier fit of the same count matrix: {' and '.join(reused)}.")
 
         # Download button for full DGE results as CSV
         st.download_button(
@@ -81,14 +244,15 @@ if "count_matrix" in st.session_state and "metadata" in st.session_state:
             mime="text/csv"
         )
 
-        # Format p-values for display
-        data = st.session_state["results"].copy()
-        data["pvalue"] = data["pvalue"].apply(lambda x: f"{x:.2e}")
-        data["padj"] = data["padj"].apply(lambda x: f"{x:.2e}")
+        # P-values are formatted by the table widget, only for the rows shown
+        pvalue_columns = {
+            "pvalue": st.column_config.NumberColumn(format=PVALUE_FORMAT),
+            "padj": st.column_config.NumberColumn(format=PVALUE_FORMAT)
+        }
 
-        # Expandable table of raw DGE results
+        # Expandable table of raw DGE results (only the visible page is sent to the browser)
         with st.expander("Show/hide results", expanded=False):
-            st.dataframe(data, height=400)
+            results_viewer(st.session_state["results"], key="all_results", column_config=pvalue_columns)
 
         st.write(f"### DGE Summary ({st.session_state['comparison_label'].replace('_', ' ')})")
 
@@ -123,10 +287,10 @@ if "count_matrix" in st.session_state and "metadata" in st.session_state:
         st.dataframe(summary, hide_index=True)
 
         with st.expander("Show/hide upregulated genes", expanded=False):
-            st.dataframe(upregulated, use_container_width=True)
+            results_viewer(upregulated, key="upregulated", column_config=pvalue_columns)
 
         with st.expander("Show/hide downregulated genes", expanded=False):
-            st.dataframe(downregulated, use_container_width=True)
+            results_viewer(downregulated, key="downregulated", column_config=pvalue_columns)
 
 else:
     st.warning("No data uploaded yet. Please upload count matrix and metadata on the Home page.")
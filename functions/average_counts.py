@@ -1,3 +1,9 @@
+import numpy as np
+import pandas as pd
+from functions.instrumentation import instrumented
+
+
+@instrumented
 def average_counts(normalized_counts, metadata, factor):
     """
     Computes the average normalized gene expression for each condition group.
@@ -10,7 +16,20 @@ def average_counts(normalized_counts, metadata, factor):
     Returns:
         pd.DataFrame: A DataFrame with average expression values per condition
     """
-    # Group samples by condition and compute the mean expression for each gene
-    average_counts = normalized_counts.groupby(metadata[factor].astype(str), axis=1).mean()
+    # Condition of each sample (column), levels sorted as in groupby
+    conditions = metadata.loc[normalized_counts.columns, factor].astype(str)
+    codes, levels = pd.factorize(conditions, sort=True)
+
+    # Averaging matrix (samples x conditions): mean per condition as one matrix product,
+    # without transposing the count matrix
+    values = normalized_counts.to_numpy()
+    weights = np.zeros((len(codes), len(levels)), dtype=values.dtype)
+    weights[np.arange(len(codes)), codes] = 1 / np.bincount(codes)[codes]
+
+    average_counts = pd.DataFrame(
+        values @ weights,
+        index=normalized_counts.index,
+        columns=pd.Index(levels, name=factor)
+    )
 
     return average_counts
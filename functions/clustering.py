@@ -0,0 +1,170 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import pdist
+from matplotlib.patches import Patch
+from functions.hashing import hash_dataframe, combine_hashes
+
+try:
+    # Optional: faster implementation of the same clustering algorithms
+    import fastcluster
+except ImportError:
+    fastcluster = None
+
+# -------------------------------------------------------
+# Process-wide cache of hierarchical clustering linkages for heatmaps.
+# Linkages are keyed by the clustered data (gene set and values), the method and
+# the metric, so reruns that only change labels or figure settings reuse them.
+# -------------------------------------------------------
+
+# Number of linkage matrices kept in memory
+MAX_CACHED_LINKAGES = int(os.environ.get("DGE_LINKAGE_CACHE_SIZE", 32))
+
+# Up to this number of genes/samples every row/column is labeled; above it, seaborn shows a subset of labels
+MAX_LABELED_GENES = 100
+MAX_LABELED_SAMPLES = 60
+
+_cache = OrderedDict()   # key -> linkage matrix, in LRU order
+_cache_lock = threading.Lock()
+
+_z_scores = {}   # id(expression table) -> (weak reference, z-scores of all genes)
+
+
+def z_score_rows(data):
+    """
+    Standardizes each row (gene) to mean 0 and standard deviation 1, as seaborn's z_score=0.
+
+    Rows with constant values are set to 0 instead of NaN.
+
+    Args:
+        data (pd.DataFrame): Expression values (genes x conditions or samples).
+
+    Returns:
+        pd.DataFrame: Z-scores with the same index and columns.
+    """
+    values = data.to_numpy(dtype=np.float64)
+    std = values.std(axis=1, ddof=1, keepdims=True)
+    scores = np.divide(values - values.mean(axis=1, keepdims=True), std, out=np.zeros_like(values), where=std > 0)
+    return pd.DataFrame(scores, index=data.index, columns=data.columns)
+
+
+def gene_z_scores(expression):
+    """
+    Returns the z-scores of all genes of an expression table, computing them once per table object.
+
+    Z-scores are computed per gene, so heatmaps of any gene subset select rows of this matrix.
+
+    Args:
+        expression (pd.DataFrame): Average or normalized counts (genes x conditions or samples).
+
+    Returns:
+        pd.DataFrame: Z-scores (float32) with the same index and columns.
+    """
+    cached = _z_scores.get(id(expression))
+    if cached is not None and cached[0]() is expression:
+        return cached[1]
+
+    z_scores = z_score_rows(expression).astype(np.float32)
+    _z_scores[id(expression)] = (weakref.ref(expression, lambda _, i=id(expression): _z_scores.pop(i, None)), z_scores)
+    return z_scores
+
+
+def cached_linkage(data, axis=0, method="average", metric="euclidean"):
+    """
+    Computes (or reuses) the hierarchical clustering linkage of the rows or columns of a table.
+
+    Only the condensed distance matrix (n * (n - 1) / 2 values) is stored, never the
+    full square matrix; fastcluster is used when installed, otherwise SciPy.
+
+    Args:
+        data (pd.DataFrame): Values to cluster (e.g. z-scores, genes x conditions).
+        axis (int): 0 to cluster rows, 1 to cluster columns.
+        method (str): Linkage method (default "average", i.e. UPGMA).
+        metric (str): Distance metric.
+
+    Returns:
+        np.ndarray: Linkage matrix as returned by scipy.cluster.hierarchy.linkage.
+    """
+    key = combine_hashes(hash_dataframe(data), str(axis), method, metric)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    values = data.to_numpy(dtype=np.float64)
+    if axis == 1:
+        values = values.T
+
+    distances = pdist(values, metric=metric)
+    if fastcluster is not None:
+        linkage = fastcluster.linkage(distances, method=method, preserve_input=False)
+    else:
+        linkage = hierarchy.linkage(distances, method=method)
+
+    with _cache_lock:
+        _cache[key] = linkage
+        while len(_cache) > MAX_CACHED_LINKAGES:
+            _cache.popitem(last=False)
+
+    return linkage
+
+
+def clustered_heatmap(z_scores, row_cluster, col_cluster, conditions=None):
+    """
+    Draws a heatmap of z-scores with cached row and column clustering.
+
+    The color mesh is rasterized, so heatmaps of thousands of genes and many samples
+    render quickly; large tables label only a subset of genes and samples.
+
+    Args:
+        z_scores (pd.DataFrame): Z-scores of the genes to show (genes x conditions or samples).
+        row_cluster (bool): Whether to cluster rows (genes).
+        col_cluster (bool): Whether to cluster columns (conditions or samples).
+        conditions (pd.Series, optional): Condition of each sample (column), shown as a color bar above
+            the heatmap. Default is None (columns are conditions).
+
+    Returns:
+        seaborn.matrix.ClusterGrid: The clustered heatmap.
+    """
+    # Linkages need at least two rows/columns
+    row_linkage = cached_linkage(z_scores, axis=0) if row_cluster and len(z_scores) > 1 else None
+    col_linkage = cached_linkage(z_scores, axis=1) if col_cluster and z_scores.shape[1] > 1 else None
+
+    col_colors = None
+    if conditions is not None:
+        conditions = conditions.loc[z_scores.columns].astype(str)
+        levels = sorted(conditions.unique())
+        palette = dict(zip(levels, sns.color_palette("tab10" if len(levels) <= 10 else "husl", len(levels))))
+        col_colors = conditions.map(palette)
+
+    g = sns.clustermap(
+        z_scores,
+        cmap="coolwarm",
+        xticklabels=True if z_scores.shape[1] <= MAX_LABELED_SAMPLES else "auto",
+        yticklabels=True if len(z_scores) <= MAX_LABELED_GENES else "auto",
+        row_cluster=row_linkage is not None,
+        col_cluster=col_linkage is not None,
+        row_linkage=row_linkage,
+        col_linkage=col_linkage,
+        col_colors=col_colors,
+        rasterized=True,
+        cbar_kws={"label": "Z-score"}
+    )
+
+    if col_colors is not None:
+        # Legend of the condition color bar
+        g.fig.legend(
+            handles=[Patch(color=color, label=level) for level, color in palette.items()],
+            title=conditions.name,
+            loc="upper left",
+            bbox_to_anchor=(1.0, 0.8),
+            frameon=False
+        )
+
+    return g
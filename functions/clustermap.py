@@ -1,18 +1,26 @@
-import seaborn as sns
+from functions.clustering import clustered_heatmap, gene_z_scores
+from functions.instrumentation import instrumented
 
+# Largest number of genes offered for the top genes heatmap
+MAX_HEATMAP_GENES = 5000
 
-def plot_heatmap(results, average_counts, top_n, row_cl, col_cl, ranking, comp_label):
+
+@instrumented
+def plot_heatmap(results, expression, top_n, row_cl, col_cl, ranking, comp_label, conditions=None):
     """
     Generates a heatmap of the top N most differentially expressed genes,
     selected by either log2 fold change or adjusted p-value.
 
     Args:
         results (pd.DataFrame): PyDESeq2 results with columns "padj" and "log2FoldChange".
-        average_counts (pd.DataFrame): Averaged normalized expression values (genes x conditions).
+        expression (pd.DataFrame): Averaged normalized expression values (genes x conditions),
+            or normalized counts of individual samples (genes x samples).
         top_n (int): Number of top genes to include.
         row_cl (bool): Whether to apply row clustering (genes).
         col_cl (bool): Whether to apply column clustering (conditions).
         ranking (str): Criterion for gene selection - "log2 Fold Change" or "adjusted p-value".
+        comp_label (str): Comparison label shown in the title.
+        conditions (pd.Series, optional): Condition of each sample, if the columns are individual samples.
 
     Returns:
         matplotlib.figure.Figure or None:
@@ -38,27 +46,18 @@ def plot_heatmap(results, average_counts, top_n, row_cl, col_cl, ranking, comp_l
         # Select genes with the lowest adjusted p-values
         top_genes = significant_genes.nsmallest(top_n, "padj").index
 
-    # Retrieve the expression values for the selected genes
-    heatmap_data = average_counts.loc[top_genes]
+    # Retrieve the z-scores of the selected genes (computed once for all genes)
+    heatmap_data = gene_z_scores(expression).loc[top_genes]
 
-    # Create heatmap
-    g = sns.clustermap(
-        heatmap_data,
-        z_score=0,
-        cmap="coolwarm",
-        xticklabels=True,
-        yticklabels=True,
-        row_cluster=row_cl,
-        col_cluster=col_cl,
-        cbar_kws={"label": "Z-score"}
-    )
+    # Create heatmap (clustering linkages are cached)
+    g = clustered_heatmap(heatmap_data, row_cl, col_cl, conditions=conditions)
 
     # Adjust the font size of gene labels based on number of genes
     n_genes = heatmap_data.shape[0]
     fontsize = max(4, 12 - n_genes // 10)
 
     # Set axis labels and the plot title
-    g.ax_heatmap.set_xlabel("Condition")
+    g.ax_heatmap.set_xlabel("Condition" if conditions is None else "Sample")
     g.ax_heatmap.set_ylabel("Gene")
     g.fig.suptitle(f"Heatmap of Top Differentially Expressed Genes ({comp_label.replace('_', ' ')})", y=1.02)
     # Apply dynamically calculated font size to gene labels
@@ -1,23 +1,26 @@
-import seaborn as sns
-import pandas as pd
+from functions.clustering import clustered_heatmap, gene_z_scores
+from functions.instrumentation import instrumented
 
 
-def custom_heatmap(selected_genes, average_counts, row_cluster, col_cluster):
+@instrumented
+def custom_heatmap(selected_genes, expression, row_cluster, col_cluster, conditions=None):
     """
     Generates a heatmap of selected genes.
 
     Args:
         selected_genes (list of str): List of gene names to include in the heatmap.
-        average_counts (pd.DataFrame): DataFrame of average expression values (genes x conditions).
+        expression (pd.DataFrame): DataFrame of average expression values (genes x conditions),
+            or normalized counts of individual samples (genes x samples).
         row_cluster (bool): Whether to cluster rows (genes).
         col_cluster (bool): Whether to cluster columns (samples/conditions).
+        conditions (pd.Series, optional): Condition of each sample, if the columns are individual samples.
 
     Returns:
         matplotlib.figure.Figure: The generated heatmap figure, or None if no valid genes are found.
     """
 
     # Identify genes provided by the user that are not present in the expression matrix (due to typos or missing entries)
-    missing_genes = list(set(selected_genes) - set(average_counts.index))
+    missing_genes = list(set(selected_genes) - set(expression.index))
 
     # Check if any genes are provided
     if not selected_genes:
@@ -25,7 +28,7 @@ def custom_heatmap(selected_genes, average_counts, row_cluster, col_cluster):
 
 
     # Subset the data to include only genes found in the DataFrame index
-    data = average_counts.loc[average_counts.index.intersection(selected_genes)]
+    data = gene_z_scores(expression).loc[expression.index.intersection(selected_genes)]
 
     # Return None if no matching genes are found in the dataset
     if data.empty:
@@ -35,20 +38,11 @@ def custom_heatmap(selected_genes, average_counts, row_cluster, col_cluster):
     n_genes = data.shape[0]
     fontsize = max(4, 12 - n_genes // 10)
 
-    # Create the clustered heatmap with z-score normalization across genes (rows)
-    g = sns.clustermap(
-        data,
-        z_score=0,
-        cmap="coolwarm",
-        xticklabels=True,
-        yticklabels=True,
-        row_cluster=row_cluster,
-        col_cluster=col_cluster,
-        cbar_kws={"label": "Z-score"}
-    )
+    # Create the clustered heatmap of z-scores across genes (rows); linkages are cached
+    g = clustered_heatmap(data, row_cluster, col_cluster, conditions=conditions)
 
     # Set axis labels and the title of the plot
-    g.ax_heatmap.set_xlabel("Condition")
+    g.ax_heatmap.set_xlabel("Condition" if conditions is None else "Sample")
     g.ax_heatmap.set_ylabel("Gene")
     g.fig.suptitle("Heatmap of Selected Genes", y=1.02)
     # Apply dynamically calculated font size to gene labels
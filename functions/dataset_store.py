@@ -0,0 +1,222 @@
+import os
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+from functions.hashing import hash_dataframe, combine_hashes
+from functions.memory_usage import object_nbytes
+
+# -------------------------------------------------------
+# Process-wide, reference-counted store of the data held by sessions.
+# Tables with the same content are stored once and shared (read-only) by all
+# sessions; a session references them through named slots (e.g. "count_matrix").
+# Entries no session references are kept for reuse until their total size
+# exceeds MAX_UNREFERENCED_MB, then the least recently used are evicted.
+# -------------------------------------------------------
+
+# Maximum memory (MB) of stored entries that no session references
+MAX_UNREFERENCED_MB = float(os.environ.get("DGE_STORE_MB", 512))
+
+_entries = OrderedDict()   # key -> {"value", "refs", "nbytes"}, in LRU order
+_slots = {}                # owner ID -> {slot: keys of the entries referenced by the slot}
+_keys = {}                 # id(value) -> (weak reference, key), so a table is hashed only once
+_owner_ids = itertools.count(1)
+_released_owners = []      # owners whose token was collected, released at the next store operation
+_lock = threading.Lock()
+
+
+class StoreOwner:
+    """
+    Token identifying one owner (session) of store references.
+
+    All references of the owner are released when the token is garbage collected,
+    e.g. when Streamlit discards the state of a closed session.
+    """
+    __slots__ = ("owner_id", "__weakref__")
+
+    def __init__(self):
+        self.owner_id = next(_owner_ids)
+        # Finalizers can run during garbage collection inside a store operation,
+        # so the owner is only queued here (list.append is atomic)
+        weakref.finalize(self, _released_owners.append, self.owner_id)
+
+
+def share(value, owner, slot):
+    """
+    Stores a value (or reuses the stored value with the same content) and references it from a slot.
+
+    The previous value of the slot is released. Stored DataFrames and Series are made
+    read-only, because they are shared between sessions.
+
+    Args:
+        value: DataFrame, Series, fitted DeseqDataSet or other object to store.
+        owner (StoreOwner): Owner of the reference.
+        slot (str): Name of the reference, e.g. "count_matrix".
+
+    Returns:
+        The stored object, which should be used instead of value.
+    """
+    return share_all({None: value}, owner, slot)[None]
+
+
+def share_all(values, owner, slot):
+    """
+    Stores several values (e.g. the result tables of all comparisons) under one slot.
+
+    Args:
+        values (dict): Name -> value to store.
+        owner (StoreOwner): Owner of the references.
+        slot (str): Name of the reference; replaces all values previously stored under it.
+
+    Returns:
+        dict: Name -> stored object, in the order of values.
+    """
+    keys = {name: _key(value) for name, value in values.items()}
+
+    with _lock:
+        _release_collected_owners()
+        shared = {}
+        for name, value in values.items():
+            entry = _entries.get(keys[name])
+            if entry is None:
+                _make_read_only(value)
+                entry = {"value": value, "refs": 0, "nbytes": object_nbytes(value)}
+                _entries[keys[name]] = entry
+            _entries.move_to_end(keys[name])
+            shared[name] = entry["value"]
+
+        owner_slots = _slots.setdefault(owner.owner_id, {})
+        previous = owner_slots.get(slot, [])
+        owner_slots[slot] = list(keys.values())
+        for key in owner_slots[slot]:
+            _entries[key]["refs"] += 1
+        for key in previous:
+            _entries[key]["refs"] -= 1
+
+        _evict()
+        return shared
+
+
+def release(owner, slot):
+    """
+    Releases the values referenced by a slot of an owner.
+
+    Args:
+        owner (StoreOwner): Owner of the reference.
+        slot (str): Name of the reference.
+    """
+    with _lock:
+        _release_collected_owners()
+        for key in _slots.get(owner.owner_id, {}).pop(slot, []):
+            _entries[key]["refs"] -= 1
+        _evict()
+
+
+def store_usage():
+    """
+    Summarizes the memory held by the store.
+
+    Returns:
+        dict: "entries", "referenced_mb" (used by at least one session) and "unreferenced_mb".
+    """
+    with _lock:
+        _release_collected_owners()
+        referenced = sum(entry["nbytes"] for entry in _entries.values() if entry["refs"] > 0)
+        unreferenced = sum(entry["nbytes"] for entry in _entries.values() if entry["refs"] <= 0)
+        return {
+            "entries": len(_entries),
+            "referenced_mb": referenced / 1024 ** 2,
+            "unreferenced_mb": unreferenced / 1024 ** 2
+        }
+
+
+def stored_ids():
+    """
+    Returns the IDs of the stored objects, e.g. to report memory shared with other sessions separately.
+
+    Returns:
+        set of int: id() of every stored value.
+    """
+    with _lock:
+        return {id(entry["value"]) for entry in _entries.values()}
+
+
+def session_share(value, slot):
+    """
+    Shares a value from the current Streamlit session (see share).
+
+    Args:
+        value: Value to store.
+        slot (str): Name of the reference in this session, e.g. "count_matrix".
+
+    Returns:
+        The stored object, to be kept in session state instead of value.
+    """
+    return share(value, _session_owner(), slot)
+
+
+def session_share_all(values, slot):
+    """
+    Shares several values from the current Streamlit session (see share_all).
+    """
+    return share_all(values, _session_owner(), slot)
+
+
+def _session_owner():
+    # The token lives in session state, so it is collected together with the session
+    if "store_owner" not in st.session_state:
+        st.session_state["store_owner"] = StoreOwner()
+    return st.session_state["store_owner"]
+
+
+def _key(value):
+    cached = _keys.get(id(value))
+    if cached is not None and cached[0]() is value:
+        return cached[1]
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        dtypes = value.dtypes.tolist() if isinstance(value, pd.DataFrame) else [value.dtype]
+        key = combine_hashes(type(value).__name__, hash_dataframe(value), dtypes)
+    elif getattr(value, "uns", None) is not None and "fit_key" in value.uns:
+        # Fitted datasets from the fit cache are identified by their inputs
+        key = combine_hashes("DeseqDataSet", value.uns["fit_key"])
+    else:
+        # Not deduplicated, only reference-counted
+        key = combine_hashes("object", id(value))
+
+    try:
+        _keys[id(value)] = (weakref.ref(value, lambda _, i=id(value): _keys.pop(i, None)), key)
+    except TypeError:
+        pass
+    return key
+
+
+def _make_read_only(value):
+    # Shared tables must not be modified in place by one session; pandas keeps its
+    # column arrays in the internal block manager, which has no public accessor
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        for array in value._mgr.arrays:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+
+def _release_collected_owners():
+    # Release all references of sessions that no longer exist
+    while _released_owners:
+        for keys in _slots.pop(_released_owners.pop(), {}).values():
+            for key in keys:
+                _entries[key]["refs"] -= 1
+    _evict()
+
+
+def _evict():
+    # Drop the least recently used unreferenced entries above the memory limit
+    unreferenced = [key for key, entry in _entries.items() if entry["refs"] <= 0]
+    total = sum(_entries[key]["nbytes"] for key in unreferenced)
+    for key in unreferenced:
+        if total <= MAX_UNREFERENCED_MB * 1024 ** 2:
+            break
+        total -= _entries.pop(key)["nbytes"]
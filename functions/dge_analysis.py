@@ -1,8 +1,29 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
 from pydeseq2.ds import DeseqStats
-from pydeseq2.dds import DeseqDataSet
+from pydeseq2.default_inference import DefaultInference
+from functions.fit_cache import get_fitted_dds, fit_dds, restore_unpickled_dds
+from functions.jobs import hidden_main_module
 import pandas as pd
+from functions.instrumentation import instrumented
 
-def run_dge_analysis(count_matrix, contrast, metadata, factor, output_path):
+# Number of per-contrast result tables kept in the process-wide cache
+MAX_CACHED_CONTRASTS = int(os.environ.get("DGE_CONTRAST_CACHE_SIZE", 64))
+
+# Smallest number of contrasts computed in worker processes; fewer contrasts are computed in this
+# process, because starting "spawn" workers (and sending them the fitted dataset) takes longer
+MIN_POOL_CONTRASTS = int(os.environ.get("DGE_POOL_MIN_CONTRASTS", 3))
+
+_contrast_cache = OrderedDict()  # (fit key, contrast) -> results DataFrame, in LRU order
+_contrast_cache_lock = threading.Lock()
+
+@instrumented
+def run_dge_analysis(count_matrix, contrast, metadata, factor, output_path=None):
     """
     Runs differential gene expression (DGE) analysis using PyDESeq2.
 
@@ -11,34 +32,217 @@ def run_dge_analysis(count_matrix, contrast, metadata, factor, output_path):
         contrast (list of str): Contrast to evaluate, e.g. ["condition", "treated", "control"].
         metadata (pd.DataFrame): Metadata table with experimental conditions.
         factor (str): Column in metadata to use as the design factor.
-        output_path (str): File path where DGE results will be saved as CSV.
+        output_path (str, optional): File path where DGE results will be saved as CSV. Default is None (not saved);
+                                     finished analyses are stored under a unique run ID with functions.run_store.
 
     Returns:
         pd.DataFrame: DGE results including log2FoldChange, p-values, etc.
-        DeseqDataSet: Fitted DESeq2 dataset object.
+        DeseqDataSet: Fitted DESeq2 dataset object (shared through the fit cache, do not modify).
     """
 
-    # Transpose to match PyDESeq2 expectations (samples as rows)
-    count_matrix = count_matrix.T
+    # Fit DESeq2 (or reuse a cached fit of the same counts, factor and conditions)
+    dds = get_fitted_dds(count_matrix, metadata, factor)
 
-    # Ensure categorical factor is string-type
-    metadata[factor] = metadata[factor].astype(str)
+    # Extract statistics for selected contrast (reused if it was computed before)
+    results = run_batch_dge(dds, [contrast])[comparison_label(contrast[1], contrast[2])]
 
-    # Create and run DESeq2 analysis
-    dds = DeseqDataSet(
-        counts=count_matrix,
-        metadata=metadata,
-        design_factors=[factor]
-    )
-    dds.deseq2()
+    # Save results to file (if requested)
+    if output_path is not None:
+        results.to_csv(output_path)
+
+    return results, dds
+
+
+def comparison_label(experimental, reference):
+    """
+    Builds the label used to identify a comparison, e.g. "treated_vs_control".
+
+    Args:
+        experimental (str): Experimental condition.
+        reference (str): Reference condition.
+
+    Returns:
+        str: Comparison label.
+    """
+    return f"{experimental}_vs_{reference}".replace(" ", "_")
+
+
+def build_contrasts(factor, levels, mode, reference=None):
+    """
+    Builds the list of contrasts for a batch DGE analysis.
+
+    Args:
+        factor (str): Column in metadata used as the design factor.
+        levels (list of str): Condition levels of the factor.
+        mode (str): "all pairs" (every pair of levels) or "vs reference" (every level against the reference).
+        reference (str, optional): Reference level, required for "vs reference" mode.
+
+    Returns:
+        list of list of str: Contrasts, e.g. [["condition", "treated", "control"], ...].
+    """
+    levels = [str(level) for level in levels]
+
+    if mode == "all pairs":
+        # Later level is compared against the earlier one (e.g. T2 vs T1)
+        return [[factor, b, a] for a, b in combinations(levels, 2)]
+    elif mode == "vs reference":
+        return [[factor, level, str(reference)] for level in levels if level != str(reference)]
+
+    raise ValueError(f"Unknown contrast mode: {mode}")
+
+
+@instrumented
+def run_batch_dge(dds, contrasts, n_workers=None):
+    """
+    Runs DESeq2 statistics for several contrasts using a single fitted DeseqDataSet.
+
+    The model is fitted only once; the Wald tests (and p-value adjustment) of the
+    individual contrasts are independent and, from MIN_POOL_CONTRASTS contrasts on, are
+    computed concurrently in a process pool.
+    Result tables of datasets from the fit cache are cached per contrast, so only
+    contrasts that were not computed before are evaluated.
+
+    Args:
+        dds (DeseqDataSet): Fitted DESeq2 dataset object.
+        contrasts (list of list of str): Contrasts to evaluate, e.g. from build_contrasts.
+        n_workers (int, optional): Number of worker processes, or of CPUs used when the contrasts are
+                                   computed in this process. Default is the number of CPUs.
+
+    Returns:
+        dict: Comparison label -> pd.DataFrame with DGE results, in the order of contrasts.
+              Cached tables are shared and must not be modified.
+    """
+    # Only fits from the fit cache have a stable identity that can be used as a key
+    fit_key = dds.uns.get("fit_key")
+    results = {tuple(contrast): _get_cached_contrast(fit_key, contrast) for contrast in contrasts}
+    missing = [list(contrast) for contrast, result in results.items() if result is None]
+
+    n_cpus = n_workers or os.cpu_count() or 1
+    n_workers = min(n_cpus, len(missing))
+
+    if n_workers <= 1 or len(missing) < MIN_POOL_CONTRASTS:
+        # Not worth starting worker processes
+        computed = [_contrast_results(dds, contrast, n_cpus=n_cpus) for contrast in missing]
+    else:
+        # The fitted dataset is sent to each worker once (initializer), not once per contrast.
+        # "spawn" is used because forking the multi-threaded Streamlit server is not safe.
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(dds,)
+        ) as executor:
+            # Worker processes are started when the contrasts are submitted
+            with hidden_main_module():
+                futures = executor.map(_worker_contrast_results, missing)
+            computed = list(futures)
+
+    for contrast, result in zip(missing, computed):
+        results[tuple(contrast)] = result
+        _store_cached_contrast(fit_key, contrast, result)
 
-    # Extract statistics for selected contrast
-    stat_res = DeseqStats(dds, contrast=contrast)
+    return {
+        comparison_label(contrast[1], contrast[2]): result
+        for contrast, result in results.items()
+    }
+
+
+def run_dge_job(count_matrix, metadata, factor, contrasts, reuse=None, n_cpus=None, report=None):
+    """
+    Fits DESeq2 and computes the given contrasts; meant to run as a background job.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Metadata table with experimental conditions.
+        factor (str): Column in metadata to use as the design factor.
+        contrasts (list of list of str): Contrasts to evaluate.
+        reuse (dict, optional): Results of an earlier fit of the same counts (see fit_cache.reusable_fit).
+        n_cpus (int, optional): Number of CPUs used for the fit and the comparisons (e.g. jobs.JOB_CPUS).
+                                Default is all CPUs.
+        report (callable, optional): Called as report(progress, stage) with progress in [0, 1].
+
+    Returns:
+        dict: {"dds": fitted DeseqDataSet, "batch_results": comparison label -> results DataFrame,
+               "comparison_seconds": time spent on the comparisons}.
+    """
+    def report_fit(progress, stage):
+        # The model fit takes most of the time
+        if report is not None:
+            report(0.9 * progress, stage)
+
+    dds = fit_dds(count_matrix, metadata, factor, report=report_fit, n_cpus=n_cpus, reuse=reuse)
+
+    if report is not None:
+        report(0.9, "Computing comparisons")
+    start = time.perf_counter()
+    batch_results = run_batch_dge(dds, contrasts, n_workers=n_cpus)
+
+    return {"dds": dds, "batch_results": batch_results, "comparison_seconds": time.perf_counter() - start}
+
+
+def cache_contrast_results(dds, contrasts, batch_results):
+    """
+    Stores result tables computed elsewhere (e.g. in a background job) in the contrast cache.
+
+    Args:
+        dds (DeseqDataSet): Fitted DESeq2 dataset object from the fit cache.
+        contrasts (list of list of str): Evaluated contrasts.
+        batch_results (dict): Comparison label -> results DataFrame, as returned by run_batch_dge.
+    """
+    for contrast in contrasts:
+        label = comparison_label(contrast[1], contrast[2])
+        if label in batch_results:
+            _store_cached_contrast(dds.uns.get("fit_key"), contrast, batch_results[label])
+
+
+def clear_cache():
+    """
+    Removes all result tables from the contrast cache.
+    """
+    with _contrast_cache_lock:
+        _contrast_cache.clear()
+
+
+def _get_cached_contrast(fit_key, contrast):
+    if fit_key is None:
+        return None
+    with _contrast_cache_lock:
+        key = (fit_key, tuple(contrast))
+        if key in _contrast_cache:
+            _contrast_cache.move_to_end(key)
+            return _contrast_cache[key]
+    return None
+
+
+def _store_cached_contrast(fit_key, contrast, result):
+    if fit_key is None:
+        return
+    with _contrast_cache_lock:
+        _contrast_cache[(fit_key, tuple(contrast))] = result
+        while len(_contrast_cache) > MAX_CACHED_CONTRASTS:
+            _contrast_cache.popitem(last=False)
+
+
+def _contrast_results(dds, contrast, n_cpus=None):
+    stat_res = DeseqStats(
+        dds,
+        contrast=contrast,
+        inference=DefaultInference(n_cpus=n_cpus),
+        quiet=True
+    )
     stat_res.summary()
-    results = stat_res.results_df
+    return stat_res.results_df
+
+
+# Fitted dataset of the current worker process (set by _init_worker)
+_worker_dds = None
+
+
+def _init_worker(dds):
+    global _worker_dds
+    _worker_dds = restore_unpickled_dds(dds)
 
-    # Save results to file
-    results.to_csv(output_path)
-    print(f"DGE results saved to: {output_path}")
 
-    return results, dds
\ No newline at end of file
+def _worker_contrast_results(contrast):
+    # One CPU per worker, the parallelism comes from running contrasts side by side
+    return _contrast_results(_worker_dds, contrast, n_cpus=1)
@@ -1,12 +1,19 @@
 import pandas as pd
+from functions.results_index import significant_positions
+from functions.instrumentation import instrumented
 
+# Display format of p-values (applied by the table widget, only to the rows shown)
+PVALUE_FORMAT = "%.2e"
+
+
+@instrumented
 def summarize_dge(results, pval_threshold=0.05, lfc_threshold=1.0):
     """
     Summarizes differential gene expression (DGE) results by counting
     upregulated, downregulated, and non-significant genes.
 
-    Also returns separate DataFrames of upregulated and downregulated genes,
-    with formatted p-values.
+    Also returns separate DataFrames of upregulated and downregulated genes.
+    P-values are kept numeric; they are formatted for display with PVALUE_FORMAT.
 
     Args:
         results (pd.DataFrame): DGE result table from PyDESeq2 with columns "log2FoldChange", "padj", and "pvalue".
@@ -18,41 +25,17 @@ def summarize_dge(results, pval_threshold=0.05, lfc_threshold=1.0):
         pd.DataFrame: Table of upregulated genes (log2FC > threshold, padj < threshold).
         pd.DataFrame: Table of downregulated genes (log2FC < -threshold, padj < threshold).
     """
+    up_positions, down_positions = significant_positions(results, pval_threshold, lfc_threshold)
 
-    # Count significantly upregulated genes
-    upregulated_count = results[
-        (results["log2FoldChange"] > lfc_threshold) &
-        (results["padj"] < pval_threshold)
-    ].shape[0]
-
-    # Count significantly downregulated genes
-    downregulated_count = results[
-        (results["log2FoldChange"] < -lfc_threshold) &
-        (results["padj"] < pval_threshold)
-    ].shape[0]
+    upregulated = results.iloc[up_positions]
+    downregulated = results.iloc[down_positions]
 
     # Calculate non-significant genes
-    not_significant_count = results.shape[0] - upregulated_count - downregulated_count
-
-    # Extract and format upregulated genes
-    upregulated = results[
-        (results["log2FoldChange"] > lfc_threshold) &
-        (results["padj"] < pval_threshold)
-    ].copy()
-    upregulated["pvalue"] = upregulated["pvalue"].apply(lambda x: f"{x:.2e}")
-    upregulated["padj"] = upregulated["padj"].apply(lambda x: f"{x:.2e}")
-
-    # Extract and format downregulated genes
-    downregulated = results[
-        (results["log2FoldChange"] < -lfc_threshold) &
-        (results["padj"] < pval_threshold)
-    ].copy()
-    downregulated["pvalue"] = downregulated["pvalue"].apply(lambda x: f"{x:.2e}")
-    downregulated["padj"] = downregulated["padj"].apply(lambda x: f"{x:.2e}")
+    not_significant_count = results.shape[0] - len(up_positions) - len(down_positions)
 
     # Create summary DataFrame
     summary_df = pd.DataFrame(
-        [[upregulated_count, downregulated_count, not_significant_count]],
+        [[len(up_positions), len(down_positions), not_significant_count]],
         columns=["Upregulated genes", "Downregulated genes", "Not significant"]
     )
 
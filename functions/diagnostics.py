@@ -0,0 +1,92 @@
+import pandas as pd
+import streamlit as st
+from functions.instrumentation import new_recorder, add_record, clear_records, records_list, export_json
+
+# Number of most recent records shown in the diagnostics panel (all are exported)
+SHOWN_RECORDS = 200
+
+
+def session_recorder():
+    """
+    Returns the timing recorder of the current session, creating it on first use.
+
+    Returns:
+        dict: Recorder from functions.instrumentation.new_recorder.
+    """
+    if "diagnostics" not in st.session_state:
+        st.session_state["diagnostics"] = new_recorder()
+    return st.session_state["diagnostics"]
+
+
+def record_background_job(status, dds, comparison_seconds=None):
+    """
+    Adds the timings of a finished background DGE job to the session recorder.
+
+    The job runs in a worker process, so its stages are taken from the fitted dataset.
+
+    Args:
+        status (dict): Job information from functions.jobs.job_status.
+        dds (DeseqDataSet): Dataset fitted by the job.
+        comparison_seconds (float, optional): Time the job spent on the comparisons (Wald tests).
+    """
+    recorder = session_recorder()
+    # Nested steps are recorded before the step containing them, as for steps measured in this process
+    for stage, seconds in dds.uns.get("fit_stage_seconds", {}).items():
+        add_record({"name": f"DESeq2: {stage}", "depth": 1, "seconds": round(seconds, 4)}, recorder)
+    if comparison_seconds is not None:
+        add_record({"name": "Comparisons (Wald tests)", "depth": 1, "seconds": round(comparison_seconds, 4)}, recorder)
+    add_record({"name": "Background DGE job", "seconds": round(status["finished"] - status["started"], 4)},
+               recorder)
+
+
+def diagnostics_panel():
+    """
+    Shows the recorded timings and memory of this session, with options and JSON export.
+    """
+    recorder = session_recorder()
+
+    recorder["enabled"] = st.toggle(
+        "Record timings",
+        value=recorder["enabled"],
+        key="diagnostics_enabled",
+        help="Measure the time and process memory (RSS) of each analysis step."
+    )
+    recorder["profile"] = st.toggle(
+        "Profile with cProfile",
+        value=recorder["profile"],
+        key="diagnostics_profile",
+        help="Add a report of the most expensive Python functions to each top-level step (slower)."
+    )
+
+    records = records_list(recorder)
+    if not records:
+        st.caption("No steps recorded yet.")
+        return
+
+    table = pd.DataFrame([
+        {
+            # Nested steps are indented under the step that called them
+            "Step": " " * record["depth"] + record["name"],
+            "Seconds": record["seconds"],
+            "Peak RSS (MB)": record.get("peak_rss_mb"),
+            "Started": record["started"][11:19]
+        }
+        for record in reversed(records[-SHOWN_RECORDS:])
+    ])
+    st.dataframe(table, hide_index=True, column_config={"Seconds": st.column_config.NumberColumn(format="%.3f")})
+
+    profiles = [record for record in reversed(records) if "profile" in record]
+    if profiles:
+        with st.popover("cProfile reports"):
+            for record in profiles[:5]:
+                st.write(f"**{record['name']}** ({record['started'][11:19]})")
+                st.code(record["profile"])
+
+    export_col, clear_col = st.columns(2)
+    with export_col:
+        st.download_button("Export JSON", data=export_json(recorder), file_name="diagnostics.json",
+                           mime="application/json")
+    with clear_col:
+        if st.button("Clear", key="diagnostics_clear"):
+            clear_records(recorder)
+            st.rerun()
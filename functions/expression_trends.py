@@ -1,12 +1,17 @@
-from pydeseq2.ds import DeseqStats
+import numpy as np
 import pandas as pd
+from functions.dge_analysis import run_batch_dge, comparison_label
+from functions.instrumentation import instrumented
 
+@instrumented
 def expression_trends(genes, condition_order, factor, padj_threshold, l2fc_threshold, dds):
     """
     Computes expression trends for selected genes across user-defined consecutive conditions.
 
     For each consecutive condition pair (e.g., t2 vs t1, t3 vs t2), the function performs a pairwise
     differential expression analysis using PyDESeq2 results and evaluates the regulation status of each gene.
+    All pairs are computed from the same fitted dataset in parallel, and result tables of pairs
+    evaluated before are reused.
     Genes are categorized as upregulated ("1"), downregulated ("-1"), unchanged ("0"), or not available ("NA")
     based on log2 fold change and adjusted p-value thresholds.
 
@@ -26,35 +31,35 @@ def expression_trends(genes, condition_order, factor, padj_threshold, l2fc_thres
     # Initialize result DataFrame with genes as rows
     trends = pd.DataFrame(index=genes)
 
-    # Loop over consecutive condition pairs
-    for i in range(1, len(condition_order)):
-        cond1, cond2 = condition_order[i - 1], condition_order[i]
+    # Consecutive condition pairs, e.g. [factor, "t2", "t1"]
+    contrasts = [
+        [factor, str(condition_order[i]), str(condition_order[i - 1])]
+        for i in range(1, len(condition_order))
+    ]
+
+    # Compute differential expression for all pairs at once (cached pairs are not recomputed)
+    pair_results = run_batch_dge(dds, contrasts)
+
+    for _, cond2, cond1 in contrasts:
+        results = pair_results[comparison_label(cond2, cond1)]
         pair_label = f"{cond2} vs {cond1}"  # e.g., t2 vs t1
 
-        # Compute differential expression for the given condition pair
-        stat_res = DeseqStats(dds, contrast=[factor, str(cond2), str(cond1)])
-        stat_res.summary()
-        results = stat_res.results_df
-
-        gene_trends = []
-        for gene in genes:
-            # If gene is not present in result table, label as "NA"
-            if gene not in results.index:
-                gene_trends.append("NA")
-                continue
-
-            row = results.loc[gene]
-
-            # Determine regulation status based on statistical thresholds
-            if row["padj"] < padj_threshold:
-                if row["log2FoldChange"] > l2fc_threshold:
-                    gene_trends.append("1")   # Upregulated
-                elif row["log2FoldChange"] < -l2fc_threshold:
-                    gene_trends.append("-1")  # Downregulated
-                else:
-                    gene_trends.append("0")   # Statistically significant but small effect
-            else:
-                gene_trends.append("0")       # Not statistically significant
+        # Align results to the selected genes (missing genes become NaN rows)
+        selected = results.reindex(genes)
+        padj = selected["padj"].to_numpy()
+        lfc = selected["log2FoldChange"].to_numpy()
+
+        # Determine regulation status based on statistical thresholds
+        significant = padj < padj_threshold
+        gene_trends = np.select(
+            [
+                ~selected.index.isin(results.index),                # Gene not present in result table
+                significant & (lfc > l2fc_threshold),               # Upregulated
+                significant & (lfc < -l2fc_threshold)               # Downregulated
+            ],
+            ["NA", "1", "-1"],
+            default="0"                                             # Not significant or small effect
+        )
 
         # Add current condition pair as a new column
         trends[pair_label] = gene_trends
@@ -0,0 +1,153 @@
+import io
+import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from functions.hashing import hash_dataframe, combine_hashes
+from functions.instrumentation import timed
+
+# -------------------------------------------------------
+# Process-wide cache of rendered figures.
+# Plots are rendered once per (plotting function, data, parameters) and stored as
+# image bytes, so a rerun caused by another widget does not redraw unchanged plots.
+# Interactive plots are stored the same way as HTML pages.
+# -------------------------------------------------------
+
+# Maximum memory used by cached images (in MB)
+MAX_CACHE_MB = float(os.environ.get("DGE_FIGURE_CACHE_MB", 256))
+
+_cache = OrderedDict()   # key -> (image bytes or HTML page or None, other return values), in LRU order
+_cache_lock = threading.Lock()
+_data_keys = {}          # id(DataFrame) -> (weak reference, content hash)
+
+
+def cached_figure(plot_function, *args, image_format="png", **kwargs):
+    """
+    Returns a plot rendered as image bytes, rendering it only if it is not cached.
+
+    DataFrame arguments are identified by their content hash (computed once per
+    object), arrays by the hash of their data, other arguments by their value.
+
+    Args:
+        plot_function (callable): Function returning a matplotlib Figure (or None), or a tuple
+                                  whose first element is a Figure (or None).
+        *args: Positional arguments for the plotting function.
+        image_format (str): "png" or "svg".
+        **kwargs: Keyword arguments for the plotting function.
+
+    Returns:
+        bytes or None, or a tuple: The image in place of the figure, other return values unchanged.
+    """
+    key = combine_hashes(
+        plot_function.__module__,
+        plot_function.__qualname__,
+        image_format,
+        _key_part(args),
+        _key_part(sorted(kwargs.items()))
+    )
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            image, rest = _cache[key]
+            return (image, *rest) if rest is not None else image
+
+    result = plot_function(*args, **kwargs)
+    fig, rest = (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+    with timed(f"figure_cache.render ({plot_function.__name__})"):
+        image = _render(fig, image_format) if fig is not None else None
+
+    with _cache_lock:
+        _cache[key] = (image, rest)
+        _evict()
+
+    return (image, *rest) if rest is not None else image
+
+
+def cached_html(page_function, *args, **kwargs):
+    """
+    Returns an HTML page (e.g. an interactive plot), building it only if it is not cached.
+
+    Arguments are identified as in cached_figure. The same string object is returned
+    for the same inputs, so an unchanged page is not rebuilt on reruns (and Streamlit
+    can reuse the message it already sent to the browser).
+
+    Args:
+        page_function (callable): Function returning the HTML page as a string.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        str: HTML page.
+    """
+    key = combine_hashes(
+        page_function.__module__,
+        page_function.__qualname__,
+        "html",
+        _key_part(args),
+        _key_part(sorted(kwargs.items()))
+    )
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key][0]
+
+    with timed(f"figure_cache.render ({page_function.__name__})"):
+        html = page_function(*args, **kwargs)
+
+    with _cache_lock:
+        _cache[key] = (html, None)
+        _evict()
+
+    return html
+
+
+def clear_cache():
+    """
+    Removes all rendered figures from the cache.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def _render(fig, image_format):
+    # Same settings as st.pyplot; the figure is closed so pyplot does not keep it alive
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=image_format, bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def _key_part(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return _data_key(value)
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k!r}:{_key_part(v)}" for k, v in sorted(value.items())) + "}"
+    if isinstance(value, (list, tuple)):
+        return "(" + ",".join(_key_part(item) for item in value) + ")"
+    return repr(value)
+
+
+def _data_key(data):
+    # Hash each object only once; the weak reference detects reuse of an id after deletion
+    cached = _data_keys.get(id(data))
+    if cached is not None and cached[0]() is data:
+        return cached[1]
+
+    key = hash_dataframe(data)
+    _data_keys[id(data)] = (weakref.ref(data, lambda _, i=id(data): _data_keys.pop(i, None)), key)
+    return key
+
+
+def _evict():
+    # Drop least recently used images until the cache fits into the memory limit
+    max_bytes = MAX_CACHE_MB * 1024 ** 2
+    while len(_cache) > 1 and sum(len(image or b"") for image, _ in _cache.values()) > max_bytes:
+        _cache.popitem(last=False)
@@ -0,0 +1,427 @@
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from formulaic_contrasts import FormulaicContrasts
+from pydeseq2.dds import DeseqDataSet
+from pydeseq2.default_inference import DefaultInference
+from functions.hashing import hash_dataframe, combine_hashes
+from functions.memory_usage import object_nbytes
+from functions.instrumentation import instrumented, timed
+
+# -------------------------------------------------------
+# Process-wide cache of fitted DESeq2 datasets.
+# The module is imported once per Streamlit server process, so all sessions share it.
+# -------------------------------------------------------
+
+# Maximum memory used by cached fits (in MB)
+MAX_CACHE_MB = float(os.environ.get("DGE_FIT_CACHE_MB", 2048))
+
+# Optional on-disk tier (disabled if not set)
+CACHE_DIR = os.environ.get("DGE_FIT_CACHE_DIR")
+
+# Per-gene results of the dispersion stages. They depend on the design only through the grouping
+# of the samples, so they can be reused when e.g. conditions are renamed
+DISPERSION_ARRAYS = ("non_zero", "_MoM_dispersions", "genewise_dispersions", "_genewise_converged",
+                     "fitted_dispersions", "MAP_dispersions", "_MAP_converged", "dispersions", "_outlier_genes")
+DISPERSION_UNS = ("disp_function_type", "trend_coeffs", "mean_disp", "_squared_logres", "prior_disp_var")
+
+_cache = OrderedDict()   # key -> {"dds", "normalized_counts", "nbytes", "counts_key", "groups",
+                         #         "size_factors_fit"}, in LRU order
+_cache_lock = threading.Lock()
+_key_locks = {}          # key -> [Lock, number of threads holding or waiting for it], so the same fit
+                         # is never computed twice at once
+
+
+def fit_key(count_matrix, metadata, factor):
+    """
+    Computes the cache key of a DESeq2 fit.
+
+    Only the inputs the fit depends on are hashed: the count matrix, the design
+    factor name and the values of that metadata column.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+
+    Returns:
+        str: Cache key.
+    """
+    return _fit_key(hash_dataframe(count_matrix), metadata, factor)
+
+
+def _fit_key(counts_key, metadata, factor):
+    # Cache key from the hash of the count matrix, which callers compute only once
+    return combine_hashes(
+        counts_key,
+        hash_dataframe(metadata[factor].astype(str)),
+        factor
+    )
+
+
+@instrumented
+def get_fitted_dds(count_matrix, metadata, factor):
+    """
+    Returns a fitted DeseqDataSet, reusing a cached fit when the inputs are unchanged.
+
+    Lookup order: memory, disk (if DGE_FIT_CACHE_DIR is set), new fit.
+    The returned dataset is shared between sessions and must not be modified.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+
+    Returns:
+        DeseqDataSet: Fitted DESeq2 dataset object.
+    """
+    return _get_entry(count_matrix, metadata, factor)["dds"]
+
+
+@instrumented
+def get_normalized_counts(count_matrix, metadata, factor):
+    """
+    Returns normalized counts of a (cached) DESeq2 fit.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+
+    Returns:
+        pd.DataFrame: Normalized count matrix (genes x samples).
+    """
+    entry = _get_entry(count_matrix, metadata, factor)
+    if entry["normalized_counts"] is None:
+        dds = entry["dds"]
+        # Single precision is sufficient for plots and averages
+        normalized_counts = pd.DataFrame(
+            dds.layers["normed_counts"].T.astype(np.float32),
+            index=dds.var_names,
+            columns=dds.obs_names
+        )
+        with _cache_lock:
+            # Another session may have added them in the meantime
+            if entry["normalized_counts"] is None:
+                entry["normalized_counts"] = normalized_counts
+                entry["nbytes"] += normalized_counts.memory_usage(deep=False).sum()
+                _evict()
+    return entry["normalized_counts"]
+
+
+@instrumented
+def fit_dds(count_matrix, metadata, factor, report=None, n_cpus=None, reuse=None):
+    """
+    Fits a DESeq2 model without using the cache.
+
+    The PyDESeq2 pipeline is run stage by stage (same stages as dds.deseq2()),
+    so progress can be reported, e.g. from a background job. Stages whose results
+    are passed in reuse (see reusable_fit) are skipped.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+        report (callable, optional): Called as report(progress, stage) with progress in [0, 1].
+        n_cpus (int, optional): Number of CPUs used by the fit. Default is all CPUs.
+        reuse (dict, optional): Results of an earlier fit of the same counts, from reusable_fit.
+
+    Returns:
+        DeseqDataSet: Fitted DESeq2 dataset object.
+    """
+    # Work on a copy, so the caller's metadata is not modified
+    metadata = metadata.copy()
+    metadata[factor] = metadata[factor].astype(str)
+
+    # Transposing single-dtype counts (e.g. uint32) gives a view, not a copy
+    dds = DeseqDataSet(
+        counts=count_matrix.T,
+        metadata=metadata,
+        design_factors=[factor],
+        inference=DefaultInference(n_cpus=n_cpus)
+    )
+
+    start = time.perf_counter()
+    stage_seconds = {}
+    for progress, stage, step in _fit_stages(dds, reuse):
+        if report is not None:
+            report(progress, stage)
+        stage_start = time.perf_counter()
+        with timed(f"DESeq2: {stage}"):
+            step()
+        stage_seconds[stage] = time.perf_counter() - stage_start
+
+    # Used e.g. to estimate the time saved by gene prefiltering, and shown in the diagnostics
+    # (also for fits run in a background worker process)
+    dds.uns["fit_seconds"] = time.perf_counter() - start
+    dds.uns["fit_stage_seconds"] = stage_seconds
+    if reuse is not None:
+        dds.uns["reused"] = ["size factors"] + (["dispersions"] if reuse["dispersions"] is not None else [])
+
+    if report is not None:
+        report(1.0, "Fit completed")
+
+    return dds
+
+
+def reusable_fit(count_matrix, metadata, factor, counts_key=None):
+    """
+    Collects the results of a cached fit of the same count matrix that a new fit can reuse.
+
+    Size factors fitted by median-of-ratios only depend on the counts. If every gene has
+    a zero count, PyDESeq2 fits them iteratively with the design instead, so nothing is
+    reused. The dispersions also depend on the design, but only through the grouping of
+    the samples: they are reused if the samples are grouped the same way (e.g. conditions
+    were renamed, or another metadata column with the same groups is used) and the
+    earlier fit did not replace Cook's outliers (which modifies the dispersions of the
+    replaced genes).
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+        counts_key (str, optional): hash_dataframe(count_matrix), if already computed.
+
+    Returns:
+        dict: {"size_factors": array, "dispersions": per-gene arrays and trend/prior parameters,
+               or None if they cannot be reused}, or None if no fit of the same counts is cached
+              or its size factors depend on the design.
+    """
+    counts_key = hash_dataframe(count_matrix) if counts_key is None else counts_key
+    groups = _sample_groups(count_matrix, metadata, factor)
+    with _cache_lock:
+        candidates = [entry for entry in reversed(_cache.values())
+                      if entry["counts_key"] == counts_key and entry["size_factors_fit"] == "ratio"]
+    if not candidates:
+        return None
+
+    for entry in candidates:
+        dds = entry["dds"]
+        if entry["groups"] == groups and not ("replaced" in dds.varm and dds.varm["replaced"].any()):
+            dispersions = {
+                "varm": {key: dds.varm[key].copy() for key in DISPERSION_ARRAYS},
+                "uns": {key: dds.uns[key] for key in DISPERSION_UNS if key in dds.uns}
+            }
+            return {"size_factors": dds.obsm["size_factors"].copy(), "dispersions": dispersions}
+
+    return {"size_factors": candidates[0]["dds"].obsm["size_factors"].copy(), "dispersions": None}
+
+
+def _size_factors_fit(count_matrix, fit_type):
+    # Size factor method PyDESeq2 actually uses: median-of-ratios ("ratio") needs at least
+    # one gene without zero counts, otherwise it switches to the design-dependent "iterative"
+    if fit_type == "ratio" and not count_matrix.to_numpy().all(axis=1).any():
+        return "iterative"
+    return fit_type
+
+
+def _sample_groups(count_matrix, metadata, factor):
+    # Group of each sample, numbered in order of first appearance (independent of the condition names)
+    return tuple(pd.factorize(metadata.loc[count_matrix.columns, factor].astype(str))[0].tolist())
+
+
+def _fit_stages(dds, reuse=None):
+    # (progress when the stage starts, description, method), in the order of dds.deseq2()
+    if reuse is None:
+        stages = [(0.00, "Fitting size factors", lambda: dds.fit_size_factors(
+            fit_type=dds.size_factors_fit_type, control_genes=dds.control_genes))]
+    else:
+        stages = [(0.00, "Reusing size factors", lambda: _set_size_factors(dds, reuse["size_factors"]))]
+
+    if reuse is None or reuse["dispersions"] is None:
+        stages += [
+            (0.02, "Fitting gene-wise dispersions", dds.fit_genewise_dispersions),
+            (0.40, "Fitting dispersion trend", dds.fit_dispersion_trend),
+            (0.43, "Fitting dispersion prior", dds.fit_dispersion_prior),
+            (0.45, "Fitting MAP dispersions", dds.fit_MAP_dispersions),
+        ]
+    else:
+        stages.append((0.02, "Reusing dispersions", lambda: _set_dispersions(dds, reuse["dispersions"])))
+
+    stages += [
+        (0.80, "Fitting log fold changes", dds.fit_LFC),
+        (0.93, "Calculating Cook's distances", dds.calculate_cooks),
+    ]
+    if dds.refit_cooks:
+        stages.append((0.95, "Refitting Cook's outliers", dds.refit))
+    stages.append((0.99, "Flagging Cook's outliers", dds.cooks_outlier))
+    return stages
+
+
+def _set_size_factors(dds, size_factors):
+    # Same results as dds.fit_size_factors() for the same counts
+    dds.obsm["size_factors"] = size_factors
+    dds.layers["normed_counts"] = dds.X / size_factors[:, None]
+    dds.varm["_normed_means"] = dds.layers["normed_counts"].mean(0)
+
+
+def _set_dispersions(dds, dispersions):
+    # Same results as the dispersion stages for the same counts and grouping of samples
+    for key, value in dispersions["varm"].items():
+        dds.varm[key] = value.copy()
+    dds.uns.update(dispersions["uns"])
+    dds.non_zero_idx = np.arange(dds.n_vars)[dds.varm["non_zero"]]
+    dds.non_zero_genes = dds.var_names[dds.varm["non_zero"]]
+
+
+def add_fitted_dds(count_matrix, metadata, factor, dds):
+    """
+    Stores a DESeq2 fit computed elsewhere (e.g. in a background job) in the cache.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples) used for the fit.
+        metadata (pd.DataFrame): Sample metadata (samples as index) used for the fit.
+        factor (str): Design factor used for the fit.
+        dds (DeseqDataSet): Fitted DESeq2 dataset object.
+
+    Returns:
+        DeseqDataSet: The cached dataset (an already cached fit of the same inputs takes precedence).
+    """
+    counts_key = hash_dataframe(count_matrix)
+    key = _fit_key(counts_key, metadata, factor)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]["dds"]
+
+        dds.uns["fit_key"] = key
+        _cache[key] = _new_entry(count_matrix, metadata, factor, dds, counts_key)
+        _evict()
+
+    _save_to_disk(key, dds)
+    return dds
+
+
+def is_fit_cached(count_matrix, metadata, factor):
+    """
+    Checks whether a fit of the given inputs is available without refitting.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        metadata (pd.DataFrame): Sample metadata (samples as index).
+        factor (str): Column in metadata to use as the design factor.
+
+    Returns:
+        bool: True if the fit is in memory or in the on-disk tier.
+    """
+    key = fit_key(count_matrix, metadata, factor)
+    with _cache_lock:
+        if key in _cache:
+            return True
+    return bool(CACHE_DIR) and os.path.exists(_disk_path(key))
+
+
+def restore_unpickled_dds(dds):
+    """
+    Makes a DeseqDataSet unpickled in a new process usable for contrasts again.
+
+    The design materializer used by PyDESeq2 contrasts is registered when the
+    design is first built, which has not happened in a fresh process
+    (e.g. a worker process or after a server restart).
+
+    Args:
+        dds (DeseqDataSet): Unpickled DESeq2 dataset object.
+
+    Returns:
+        DeseqDataSet: The same object, ready to be used with DeseqStats.
+    """
+    if isinstance(dds.design, str):
+        dds.formulaic_contrasts = FormulaicContrasts(dds.obs, dds.design)
+    return dds
+
+
+def clear_cache():
+    """
+    Removes all fits from the in-memory cache (the disk tier is kept).
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def _get_entry(count_matrix, metadata, factor):
+    counts_key = hash_dataframe(count_matrix)
+    key = _fit_key(counts_key, metadata, factor)
+
+    with _cache_lock:
+        key_lock = _key_locks.setdefault(key, [threading.Lock(), 0])
+        key_lock[1] += 1
+
+    try:
+        # Only one session computes a given fit, the others wait and reuse it
+        with key_lock[0]:
+            with _cache_lock:
+                if key in _cache:
+                    _cache.move_to_end(key)
+                    return _cache[key]
+
+            dds = _load_from_disk(key)
+            if dds is None:
+                # E.g. after a metadata edit, parts of a fit of the same counts are reused
+                dds = fit_dds(count_matrix, metadata, factor,
+                              reuse=reusable_fit(count_matrix, metadata, factor, counts_key))
+                # Stable identity of the fit, used e.g. to cache per-contrast results
+                dds.uns["fit_key"] = key
+                _save_to_disk(key, dds)
+
+            entry = _new_entry(count_matrix, metadata, factor, dds, counts_key)
+            with _cache_lock:
+                _cache[key] = entry
+                _evict()
+    finally:
+        # The lock is removed when no thread holds or waits for it (also after a failed fit)
+        with _cache_lock:
+            key_lock[1] -= 1
+            if key_lock[1] == 0:
+                del _key_locks[key]
+
+    return entry
+
+
+def _new_entry(count_matrix, metadata, factor, dds, counts_key):
+    return {
+        "dds": dds,
+        "normalized_counts": None,
+        "nbytes": object_nbytes(dds),
+        # Used to find fits whose results can be reused (see reusable_fit)
+        "counts_key": counts_key,
+        "groups": _sample_groups(count_matrix, metadata, factor),
+        "size_factors_fit": _size_factors_fit(count_matrix, dds.size_factors_fit_type)
+    }
+
+
+def _evict():
+    # Drop least recently used fits until the cache fits into the memory limit
+    max_bytes = MAX_CACHE_MB * 1024 ** 2
+    while len(_cache) > 1 and sum(e["nbytes"] for e in _cache.values()) > max_bytes:
+        _cache.popitem(last=False)
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, f"dds_{key}.pkl")
+
+
+def _load_from_disk(key):
+    if not CACHE_DIR or not os.path.exists(_disk_path(key)):
+        return None
+    try:
+        with open(_disk_path(key), "rb") as f:
+            return restore_unpickled_dds(pickle.load(f))
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save_to_disk(key, dds):
+    if not CACHE_DIR:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temporary file first, so other processes never read a partial file
+    tmp_path = f"{_disk_path(key)}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(dds, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _disk_path(key))
@@ -0,0 +1,48 @@
+import hashlib
+import pandas as pd
+
+
+def hash_dataframe(df):
+    """
+    Computes a content hash of a DataFrame or Series.
+
+    The hash covers the values, the index and the column names, so two tables
+    with the same content always produce the same key, regardless of the
+    object identity or the session they come from.
+
+    Args:
+        df (pd.DataFrame or pd.Series): Table to hash.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    hasher = hashlib.sha256()
+
+    # Row-wise 64-bit hashes of values and index, computed in vectorized form
+    hasher.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+    # Column names are not part of the row hashes
+    if isinstance(df, pd.DataFrame):
+        hasher.update(repr(list(df.columns)).encode("utf-8"))
+    else:
+        hasher.update(repr(df.name).encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def combine_hashes(*parts):
+    """
+    Combines several hashes or plain values into a single key.
+
+    Args:
+        *parts: Hash strings or any values with a stable string representation.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode("utf-8"))
+        hasher.update(b"\0")
+
+    return hasher.hexdigest()
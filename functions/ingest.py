@@ -0,0 +1,264 @@
+import os
+import io
+import gzip
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from functions.detect_delimiter import detect_delimiter
+from functions.instrumentation import instrumented
+
+# -------------------------------------------------------
+# Ingest cache for uploaded count matrices.
+# Each uploaded file is parsed once and stored as a compressed Parquet file keyed
+# by the hash of its content. Later loads (reruns, other sessions, server restarts)
+# read the Parquet file instead of parsing the CSV again.
+# Files are decompressed (gzip, zstd) and parsed in chunks, so large files never
+# have to be held in memory as text or as a full int64 table.
+# -------------------------------------------------------
+
+# Directory with parsed count matrices
+CACHE_DIR = os.environ.get("DGE_INGEST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dge_ingest_cache"))
+
+# Number of parsed matrices kept in memory (shared by all sessions)
+MAX_LOADED = int(os.environ.get("DGE_INGEST_MAX_LOADED", 4))
+
+# Number of content hashes of uploaded files remembered (so a rerun does not hash the file again)
+MAX_FILE_HASHES = int(os.environ.get("DGE_INGEST_MAX_HASHES", 256))
+
+# Number of rows (genes) parsed at a time
+CHUNK_ROWS = int(os.environ.get("DGE_INGEST_CHUNK_ROWS", 50000))
+
+# Version of the parsed format, part of the cache file name (bumped when parsing changes)
+_FORMAT_VERSION = 2
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_loaded = OrderedDict()  # content hash -> DataFrame, in LRU order
+_file_hashes = OrderedDict()  # uploaded file ID -> content hash, in LRU order
+_lock = threading.Lock()
+
+
+@instrumented
+def load_count_matrix(file):
+    """
+    Loads an uploaded count matrix, parsing the file only the first time its content is seen.
+
+    The file may be plain or gzip/zstd-compressed CSV/TSV. Genes with zero counts
+    in all samples are removed; their number is stored in
+    count_matrix.attrs["removed_zero_rows"].
+
+    Args:
+        file (UploadedFile): Uploaded count matrix file (genes x samples, gene IDs in the first column).
+
+    Returns:
+        pd.DataFrame: Count matrix (genes x samples). The same object is returned for the same
+                      content and is shared between sessions, so it must not be modified.
+    """
+    key = file_content_hash(file)
+
+    with _lock:
+        if key in _loaded:
+            _loaded.move_to_end(key)
+            return _loaded[key]
+
+    path = os.path.join(CACHE_DIR, f"counts_v{_FORMAT_VERSION}_{key}.parquet")
+    if os.path.exists(path):
+        # Parsed before: read the typed columnar file instead of parsing the text again
+        count_matrix = compact_counts(pd.read_parquet(path))
+    else:
+        count_matrix = read_count_matrix(file)
+        file.seek(0)
+        _write_parquet(count_matrix, path)
+
+    with _lock:
+        _loaded[key] = count_matrix
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+
+    return count_matrix
+
+
+@instrumented
+def read_count_matrix(file, chunk_rows=None):
+    """
+    Parses a (possibly compressed) count matrix in chunks.
+
+    Each chunk is converted to the compact count dtype and its all-zero rows are
+    dropped before the next chunk is read. Integer counts are copied chunk by chunk
+    into one uint32 array, sized by the first chunk and doubled when full, so peak
+    memory stays within about twice the size of the final matrix. The file is
+    decompressed only once.
+
+    Args:
+        file (file-like): Binary file object (plain, gzip or zstd), positioned at the start.
+        chunk_rows (int, optional): Number of rows parsed at a time (default CHUNK_ROWS).
+
+    Returns:
+        pd.DataFrame: Count matrix (genes x samples) without all-zero rows.
+
+    Raises:
+        ValueError: If the file contains no genes, or only genes with zero counts in all samples.
+    """
+    values = None   # uint32 counts, filled chunk by chunk
+    index = []      # gene IDs of the filled rows, per chunk
+    filled = 0
+    chunks = []     # tables with other dtypes (e.g. fractional counts), concatenated at the end
+    columns = None
+    removed = 0
+    with _open_decompressed(file) as stream:
+        # The delimiter is detected on the first block of the decompressed text
+        delimiter = _detect_stream_delimiter(stream)
+        try:
+            reader = pd.read_csv(stream, index_col=0, delimiter=delimiter, chunksize=chunk_rows or CHUNK_ROWS)
+            for chunk in reader:
+                n_read = len(chunk)
+                chunk = compact_counts(chunk)
+                nonzero = chunk.to_numpy().any(axis=1)
+                removed += int((~nonzero).sum())
+                chunk = chunk[nonzero]
+                columns = chunk.columns
+
+                if chunks or not (chunk.dtypes == np.uint32).all():
+                    if values is not None:
+                        # Counts that are not all integers: continue with the generic tables
+                        chunks.append(pd.DataFrame(values[:filled], index=_join_index(index), columns=columns))
+                        values = None
+                    chunks.append(chunk)
+                    continue
+
+                if values is None:
+                    # A first chunk shorter than chunk_rows is the whole file
+                    values = np.empty((n_read, len(columns)), dtype=np.uint32)
+                if filled + len(chunk) > len(values):
+                    values.resize((max(2 * len(values), filled + len(chunk)), len(columns)), refcheck=False)
+                values[filled:filled + len(chunk)] = chunk.to_numpy()
+                index.append(chunk.index)
+                filled += len(chunk)
+        except pd.errors.EmptyDataError:
+            raise ValueError("The count matrix file is empty.")
+
+    if chunks:
+        count_matrix = compact_counts(pd.concat(chunks)) if len(chunks) > 1 else chunks[0]
+    elif values is not None:
+        # Shrinks the array in place (the unused rows were all-zero genes or the header)
+        values.resize((filled, len(columns)), refcheck=False)
+        count_matrix = pd.DataFrame(values, index=_join_index(index), columns=columns, copy=False)
+    else:
+        count_matrix = pd.DataFrame()
+
+    if count_matrix.empty:
+        raise ValueError("The count matrix contains no genes with counts (the file has no rows, "
+                         "or all genes have zero counts in all samples).")
+
+    count_matrix.attrs["removed_zero_rows"] = removed
+    return count_matrix
+
+
+def compact_counts(count_matrix):
+    """
+    Stores raw counts as 32-bit unsigned integers when all values allow it.
+
+    Read counts are non-negative integers far below 2^32, so this halves the memory
+    of the default int64 (or float64) representation without losing information.
+    Tables with other values (e.g. negative or fractional) are returned unchanged.
+
+    Args:
+        count_matrix (pd.DataFrame): Count matrix (genes x samples).
+
+    Returns:
+        pd.DataFrame: Count matrix with uint32 columns if possible, otherwise the input.
+    """
+    values = count_matrix.to_numpy()
+    if not np.issubdtype(values.dtype, np.number) or values.dtype == np.uint32:
+        return count_matrix
+    if values.size and (values.min() < 0 or values.max() > np.iinfo(np.uint32).max):
+        return count_matrix
+    if np.issubdtype(values.dtype, np.floating) and not np.array_equal(values, np.floor(values)):
+        return count_matrix
+
+    return pd.DataFrame(
+        values.astype(np.uint32),
+        index=count_matrix.index,
+        columns=count_matrix.columns
+    )
+
+
+def file_content_hash(file, chunk_size=16 * 1024 ** 2):
+    """
+    Computes the SHA-256 hash of a file's content, reading it in chunks.
+
+    The hashes of the last MAX_FILE_HASHES uploaded files (with a Streamlit file ID) are remembered,
+    so these files are hashed only once.
+
+    Args:
+        file (file-like): Binary file object supporting read() and seek().
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    file_id = getattr(file, "file_id", None)
+    if file_id is not None:
+        with _lock:
+            if file_id in _file_hashes:
+                _file_hashes.move_to_end(file_id)
+                return _file_hashes[file_id]
+
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        hasher.update(chunk)
+    file.seek(0)
+
+    key = hasher.hexdigest()
+    if file_id is not None:
+        with _lock:
+            _file_hashes[file_id] = key
+            while len(_file_hashes) > MAX_FILE_HASHES:
+                _file_hashes.popitem(last=False)
+    return key
+
+
+def _open_decompressed(file):
+    # Returns a binary stream of the decompressed content, based on the magic bytes
+    file.seek(0)
+    magic = file.read(4)
+    file.seek(0)
+
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    if magic.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading zstd-compressed files requires the 'zstandard' package.")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file, closefd=False))
+    # Uncompressed: the uploaded file itself, which must stay open for hashing and reruns
+    return nullcontext(file)
+
+
+def _detect_stream_delimiter(stream):
+    # Seekable streams (plain and gzip files) are rewound after sniffing; the others (zstd)
+    # are buffered, so the first block is peeked at without consuming it
+    if stream.seekable():
+        return detect_delimiter(stream)
+    return detect_delimiter(io.BytesIO(stream.peek(2048)[:2048]))
+
+
+def _join_index(parts):
+    # Gene IDs of all chunks as one index
+    return parts[0].append(parts[1:]) if parts else pd.Index([])
+
+
+def _write_parquet(count_matrix, path):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temporary file first, so other sessions never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    count_matrix.to_parquet(tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
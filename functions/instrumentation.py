@@ -0,0 +1,240 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import platform
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+# -------------------------------------------------------
+# Lightweight timing and memory instrumentation of the analysis functions.
+# A recorder collects the sections (timed() blocks and @instrumented functions)
+# run while it is active; without an active recorder they cost almost nothing.
+# RSS is the memory of the whole server process, shared by all sessions.
+# -------------------------------------------------------
+
+# Number of records kept per recorder (oldest are dropped)
+MAX_RECORDS = 1000
+
+# Interval of RSS sampling while a section runs
+RSS_SAMPLE_SECONDS = 0.02
+
+# Number of functions listed in a cProfile report
+PROFILE_LINES = 30
+
+_active = ContextVar("instrumentation", default=None)   # (recorder, run state) of the current script run
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def new_recorder(profile=False):
+    """
+    Creates an empty recorder.
+
+    Args:
+        profile (bool): Capture a cProfile report of each top-level section.
+
+    Returns:
+        dict: Recorder with "records" (most recent last), "profile" and "enabled".
+    """
+    return {"records": deque(maxlen=MAX_RECORDS), "profile": profile, "enabled": True, "lock": threading.Lock()}
+
+
+@contextmanager
+def recording(recorder):
+    """
+    Activates a recorder for the code run in this context (e.g. one Streamlit script run).
+
+    Args:
+        recorder (dict): Recorder from new_recorder.
+    """
+    if not recorder["enabled"]:
+        yield
+        return
+
+    # Sections currently running; shared with the RSS sampler thread of the running top-level section
+    state = {"open": []}
+    token = _active.set((recorder, state))
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    Records the wall time and process memory (RSS) of a block in the active recorder.
+
+    Args:
+        name (str): Name of the section shown in the diagnostics.
+    """
+    active = _active.get()
+    if active is None:
+        yield
+        return
+    recorder, state = active
+
+    depth = len(state["open"])
+    rss_start = current_rss()
+    section = {"rss": rss_start, "peak": rss_start}
+    state["open"].append(section)
+
+    # One sampler per top-level section, so reruns that run no analysis step start no thread
+    stop = None
+    if depth == 0 and section["rss"] is not None:
+        stop = threading.Event()
+        threading.Thread(target=_sample_rss, args=(state, stop), daemon=True).start()
+
+    profiler = None
+    if recorder["profile"] and depth == 0:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            profiler = None
+
+    started = datetime.now()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        if stop is not None:
+            stop.set()
+        state["open"].remove(section)
+
+        rss_end = current_rss()
+        peak = _max_rss(section["peak"], rss_end)
+        record = {
+            "name": name,
+            "depth": depth,
+            "started": started.isoformat(timespec="milliseconds"),
+            "seconds": round(seconds, 4),
+            "rss_start_mb": _mb(section["rss"]),
+            "peak_rss_mb": _mb(peak),
+            "rss_end_mb": _mb(rss_end)
+        }
+        if profiler is not None:
+            record["profile"] = _profile_report(profiler)
+        add_record(record, recorder)
+
+
+def instrumented(function):
+    """
+    Decorator recording each call of a function as a section named "<module>.<function>".
+    """
+    name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _active.get() is None:
+            return function(*args, **kwargs)
+        with timed(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def add_record(record, recorder=None):
+    """
+    Adds a record to a recorder, e.g. timings measured in a background worker process.
+
+    Args:
+        record (dict): Record with at least "name" and "seconds".
+        recorder (dict, optional): Recorder to add to. Default is the active recorder (no-op if none).
+    """
+    if recorder is None:
+        active = _active.get()
+        if active is None:
+            return
+        recorder = active[0]
+    record = {"depth": 0, "started": datetime.now().isoformat(timespec="milliseconds"), **record}
+    with recorder["lock"]:
+        recorder["records"].append(record)
+
+
+def clear_records(recorder):
+    """
+    Removes all records of a recorder.
+    """
+    with recorder["lock"]:
+        recorder["records"].clear()
+
+
+def records_list(recorder):
+    """
+    Returns a copy of the records of a recorder, oldest first.
+    """
+    with recorder["lock"]:
+        return list(recorder["records"])
+
+
+def export_json(recorder):
+    """
+    Serializes the records with a description of the environment, e.g. for performance bug reports.
+
+    Args:
+        recorder (dict): Recorder from new_recorder.
+
+    Returns:
+        str: JSON document with "environment" and "records".
+    """
+    environment = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "exported": datetime.now().isoformat(timespec="seconds")
+    }
+    return json.dumps({"environment": environment, "records": records_list(recorder)}, indent=2)
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes, or None where it cannot be read cheaply.
+    """
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _sample_rss(state, stop):
+    # Updates the peak RSS of the open sections until the top-level section ends
+    while not stop.wait(RSS_SAMPLE_SECONDS):
+        sections = list(state["open"])
+        if sections:
+            rss = current_rss()
+            for section in sections:
+                section["peak"] = _max_rss(section["peak"], rss)
+
+
+def _max_rss(*values):
+    # Largest RSS sample; samples that could not be read are None
+    return max((value for value in values if value is not None), default=None)
+
+
+def _mb(value):
+    return None if value is None else round(value / 1024 ** 2, 1)
+
+
+def _profile_report(profiler):
+    # Most expensive functions by cumulative time, as text
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return stream.getvalue()
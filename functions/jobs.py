@@ -0,0 +1,335 @@
+import os
+import sys
+import types
+import signal
+import threading
+import time
+import traceback
+import uuid
+import multiprocessing
+from contextlib import contextmanager
+
+# -------------------------------------------------------
+# Process-wide background job runner.
+# Long computations (e.g. DESeq2 fits) run in separate worker processes, so the
+# Streamlit script thread stays responsive. The job table is shared by all sessions
+# of the server process; at most MAX_WORKERS jobs run at the same time and queued
+# jobs are started fairly across sessions. Each running job has a collector thread
+# that receives the messages of its worker as soon as they are sent.
+# -------------------------------------------------------
+
+# Maximum number of jobs running at the same time
+MAX_WORKERS = int(os.environ.get("DGE_JOB_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+# Number of CPUs a job should use, so jobs running side by side do not oversubscribe the machine
+JOB_CPUS = max(1, (os.cpu_count() or 1) // MAX_WORKERS)
+
+# Seconds a finished, failed or cancelled job is kept for its session before it is removed
+# (e.g. when the session was closed before collecting the result)
+JOB_TTL = float(os.environ.get("DGE_JOB_TTL", 3600))
+
+_jobs = {}   # job id -> job dict
+_lock = threading.Lock()
+
+_main_lock = threading.Lock()
+_main_users = 0        # number of threads inside hidden_main_module
+_main_module = None    # __main__ module replaced while _main_users > 0
+
+# "spawn" is used because forking the multi-threaded Streamlit server is not safe
+_context = multiprocessing.get_context("spawn")
+
+
+def submit_job(target, args=(), owner=None, description=""):
+    """
+    Queues a function to run in a background worker process.
+
+    The function must be importable (defined at module level) and accept a
+    keyword argument `report`, a callable report(progress, stage) for progress updates.
+
+    Args:
+        target (callable): Function to run.
+        args (tuple): Positional arguments for the function.
+        owner (str, optional): Identifier of the submitting session (used for fair scheduling).
+        description (str): Short human-readable description of the job.
+
+    Returns:
+        str: Job ID.
+    """
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "owner": owner,
+            "description": description,
+            "status": "queued",     # queued, running, done, failed, cancelled
+            "progress": 0.0,
+            "stage": "Waiting for a free worker",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None,
+            "_target": target,
+            "_args": args,
+            "_process": None,
+            "_conn": None,
+        }
+        starting = _schedule()
+    _start(starting)
+    return job_id
+
+
+def job_status(job_id):
+    """
+    Returns the current state of a job.
+
+    Args:
+        job_id (str): Job ID returned by submit_job.
+
+    Returns:
+        dict or None: Job information ("status", "progress", "stage", "error", timestamps,
+                      "queue_position"), or None if the job does not exist.
+    """
+    info = None
+    with _lock:
+        starting = _update()
+        job = _jobs.get(job_id)
+        if job is not None:
+            info = {key: value for key, value in job.items() if not key.startswith("_") and key != "result"}
+            queued = sorted((j for j in _jobs.values() if j["status"] == "queued"), key=lambda j: j["submitted"])
+            info["queue_position"] = [j["id"] for j in queued].index(job_id) + 1 if job["status"] == "queued" else 0
+    _start(starting)
+    return info
+
+
+def job_result(job_id):
+    """
+    Returns the result of a finished job and removes the job from the job table.
+
+    Results that are not collected within JOB_TTL seconds after the job finished are discarded.
+
+    Args:
+        job_id (str): Job ID returned by submit_job.
+
+    Returns:
+        Any: Return value of the job function, or None if the job is not done.
+    """
+    result = None
+    with _lock:
+        starting = _update()
+        job = _jobs.get(job_id)
+        if job is not None and job["status"] == "done":
+            del _jobs[job_id]
+            result = job["result"]
+    _start(starting)
+    return result
+
+
+def cancel_job(job_id):
+    """
+    Cancels a queued or running job (a running worker process is terminated).
+
+    Args:
+        job_id (str): Job ID returned by submit_job.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+
+        process = job["_process"]
+        if process is not None:
+            _terminate(process)
+
+        job["status"] = "cancelled"
+        job["stage"] = "Cancelled"
+        job["finished"] = time.time()
+        starting = _schedule()
+    _start(starting)
+
+    # Waiting for the worker to exit does not block the other sessions
+    if process is not None:
+        process.join(timeout=5)
+
+
+def forget_job(job_id):
+    """
+    Removes a finished, failed or cancelled job from the job table.
+
+    Args:
+        job_id (str): Job ID returned by submit_job.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job["status"] not in ("queued", "running"):
+            del _jobs[job_id]
+
+
+@contextmanager
+def hidden_main_module():
+    """
+    Context manager for starting "spawn" worker processes from a Streamlit app.
+
+    A spawned process re-runs the __main__ module first. Streamlit installs the
+    app script as __main__, so it is temporarily replaced by an empty module
+    while processes are started. The replacement is shared by the threads of all
+    sessions: the app script is restored when the last of them leaves the block.
+    """
+    global _main_users, _main_module
+    with _main_lock:
+        if _main_users == 0:
+            _main_module = sys.modules.get("__main__")
+            sys.modules["__main__"] = types.ModuleType("__main__")
+        _main_users += 1
+    try:
+        yield
+    finally:
+        with _main_lock:
+            _main_users -= 1
+            if _main_users == 0:
+                sys.modules["__main__"] = _main_module
+                _main_module = None
+
+
+def _update():
+    # Removes expired jobs, then picks queued jobs for free workers (see _schedule)
+    now = time.time()
+    for job_id in [job["id"] for job in _jobs.values() if job["finished"] and now - job["finished"] > JOB_TTL]:
+        del _jobs[job_id]
+    return _schedule()
+
+
+def _collect(job):
+    # Runs in the collector thread of a job; receives the worker messages until the worker exits,
+    # so the worker never blocks on sending its result
+    conn, process = job["_conn"], job["_process"]
+    status, result, error = "failed", None, None
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "progress":
+                with _lock:
+                    job["progress"], job["stage"] = message[1], message[2]
+            elif message[0] == "done":
+                status, result = "done", message[1]
+                break
+            elif message[0] == "error":
+                error = message[1]
+                break
+    except (EOFError, OSError):
+        # The worker died without sending a result (e.g. killed because of memory)
+        pass
+    except Exception:
+        # The message could not be unpickled in this process
+        error = traceback.format_exc()
+    finally:
+        conn.close()
+
+    process.join(timeout=5)
+    if status == "failed" and error is None:
+        error = f"Worker process exited unexpectedly (exit code {process.exitcode})."
+
+    with _lock:
+        # A cancelled job keeps its state
+        if job["status"] == "running":
+            job["result"], job["error"] = result, error
+            _finish(job, status, "Completed" if status == "done" else "Failed")
+        starting = _schedule()
+    _start(starting)
+
+
+def _finish(job, status, stage):
+    job["status"] = status
+    job["stage"] = stage
+    job["finished"] = time.time()
+    if status == "done":
+        job["progress"] = 1.0
+
+
+def _schedule():
+    # Called with the lock held: marks queued jobs as running while workers are free and returns them.
+    # Their worker processes are started by _start after the lock is released
+    running = [job for job in _jobs.values() if job["status"] == "running"]
+    starting = []
+
+    while len(running) < MAX_WORKERS:
+        queued = [job for job in _jobs.values() if job["status"] == "queued"]
+        if not queued:
+            break
+
+        # Fair share: prefer sessions with the fewest running jobs, then the oldest job
+        running_per_owner = {}
+        for job in running:
+            running_per_owner[job["owner"]] = running_per_owner.get(job["owner"], 0) + 1
+        job = min(queued, key=lambda j: (running_per_owner.get(j["owner"], 0), j["submitted"]))
+
+        job.update(status="running", stage="Starting", started=time.time())
+        running.append(job)
+        starting.append(job)
+
+    return starting
+
+
+def _start(jobs):
+    # Starts the worker processes of the jobs returned by _schedule. Runs without the lock, because
+    # with "spawn" the job arguments (count matrix, metadata, ...) are pickled to the worker while it starts
+    for job in jobs:
+        parent_conn, child_conn = _context.Pipe(duplex=False)
+        process = _context.Process(
+            target=_run_job,
+            args=(child_conn, job["_target"], job["_args"]),
+            daemon=False   # the job may start its own worker processes
+        )
+        try:
+            with hidden_main_module():
+                process.start()
+        except Exception:
+            parent_conn.close()
+            with _lock:
+                if job["status"] == "running":
+                    job["error"] = traceback.format_exc()
+                    _finish(job, "failed", "Failed")
+            continue
+        finally:
+            child_conn.close()
+
+        with _lock:
+            # The job may have been cancelled while its worker was starting
+            cancelled = job["status"] != "running"
+            if not cancelled:
+                job.update(_process=process, _conn=parent_conn)
+        if cancelled:
+            _terminate(process)
+            process.join(timeout=5)
+            parent_conn.close()
+            continue
+
+        threading.Thread(target=_collect, args=(job,), name=f"job-collector-{job['id'][:8]}", daemon=True).start()
+
+
+def _terminate(process):
+    # Kill the whole process group, so processes started by the job are stopped too
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except (ProcessLookupError, PermissionError):
+        process.terminate()
+
+
+def _run_job(conn, target, args):
+    # Runs in the worker process
+    if hasattr(os, "setsid"):
+        os.setsid()
+
+    def report(progress, stage):
+        conn.send(("progress", progress, stage))
+
+    try:
+        result = target(*args, report=report)
+        conn.send(("done", result))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
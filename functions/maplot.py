@@ -1,7 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from functions.scatter_genes import scatter_genes
+from functions.webgl_scatter import webgl_scatter_html
+from functions.instrumentation import instrumented
 
-def ma_plot(results, pval_threshold, comp_label):
+@instrumented
+def ma_plot(results, pval_threshold, comp_label, density=False):
     """
     Creates an MA plot to visualize differential gene expression results.
 
@@ -13,6 +17,7 @@ def ma_plot(results, pval_threshold, comp_label):
     Args:
         results (pd.DataFrame): PyDeSeq2 result table with columns "baseMean", "log2FoldChange", and "padj".
         pval_threshold (float): Adjusted p-value threshold to define significance
+        density (bool): Draw not significant genes as a density image (faster for many genes).
 
     Returns:
         matplotlib.figure.Figure: MA plot figure.
@@ -31,11 +36,12 @@ def ma_plot(results, pval_threshold, comp_label):
     fig, ax = plt.subplots(figsize=(8, 6))
 
     # Scatter plot: log baseMean on X, log2FC on Y
-    ax.scatter(
+    scatter_genes(
+        ax,
         np.log1p(results["baseMean"]),
         results["log2FoldChange"],
-        c=colors,
-        alpha=0.6
+        colors,
+        density=density
     )
 
     # Label axes and title
@@ -56,3 +62,26 @@ def ma_plot(results, pval_threshold, comp_label):
     ax.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1, 0.5))
 
     return fig
+
+
+@instrumented
+def interactive_ma_plot(results, comp_label):
+    """
+    Creates an interactive (WebGL) MA plot with hover tooltips, zoom and a client-side padj threshold.
+
+    Args:
+        results (pd.DataFrame): PyDeSeq2 result table with columns "baseMean", "log2FoldChange", and "padj".
+        comp_label (str): Comparison label shown in the title.
+
+    Returns:
+        str: HTML page to be shown with st.components.v1.html.
+    """
+    return webgl_scatter_html(
+        results,
+        x=np.log1p(results["baseMean"]),
+        y=results["log2FoldChange"],
+        mode="ma",
+        title=f"MA Plot ({comp_label.replace('_', ' ')})",
+        x_label="Log Base Mean",
+        y_label="log2 Fold Change"
+    )
@@ -0,0 +1,63 @@
+import sys
+import numpy as np
+import pandas as pd
+from anndata import AnnData
+
+
+def object_nbytes(obj):
+    """
+    Estimates the memory used by an object stored in session state.
+
+    Args:
+        obj: DataFrame, Series, NumPy array, DeseqDataSet/AnnData, dict, list or any other object.
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, AnnData):
+        # Counts plus all numeric layers and annotations (e.g. of a fitted DeseqDataSet)
+        nbytes = object_nbytes(obj.X)
+        for mapping in (obj.layers, obj.obsm, obj.varm):
+            nbytes += sum(object_nbytes(value) for value in mapping.values())
+        return nbytes
+    if isinstance(obj, dict):
+        return sum(object_nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(object_nbytes(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+def session_memory_usage(session_state, shared_ids=()):
+    """
+    Summarizes the memory used by the objects in a session state.
+
+    Objects referenced under several keys (e.g. the selected results table, which is
+    also part of the batch results) are counted only once.
+
+    Args:
+        session_state (Mapping): Streamlit session state (or any mapping).
+        shared_ids (set of int, optional): id() of objects shared with other sessions (see
+                                           dataset_store.stored_ids); a dict is shared if all its values are.
+
+    Returns:
+        pd.DataFrame: Table with columns "Object", "Size (MB)" and "Shared", largest objects first.
+    """
+    seen = set()
+    rows = []
+    for key, value in session_state.items():
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, dict) and value:
+            shared = all(id(item) in shared_ids for item in value.values())
+        else:
+            shared = id(value) in shared_ids
+        rows.append([str(key), object_nbytes(value) / 1024 ** 2, shared])
+
+    usage = pd.DataFrame(rows, columns=["Object", "Size (MB)", "Shared"])
+    return usage.sort_values("Size (MB)", ascending=False, ignore_index=True)
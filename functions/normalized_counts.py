@@ -1,39 +1,159 @@
+import numpy as np
 import pandas as pd
-from pydeseq2.dds import DeseqDataSet
+from functions.fit_cache import get_normalized_counts
+from functions.instrumentation import instrumented
 
-def extract_normalized_counts(count_matrix, metadata, design_factor):
+@instrumented
+def extract_normalized_counts(count_matrix, metadata, design_factor, dds=None):
     """
     Runs PyDESeq2 normalization and returns normalized count matrix.
-    Automatically uses the first column of metadata as the design factor.
+
+    If an already fitted DeseqDataSet is passed, normalized counts are read
+    directly from it and no new DESeq2 fit is performed. Otherwise the fit is
+    taken from the shared fit cache when the same inputs were fitted before.
 
     Args:
         count_matrix (pd.DataFrame): Raw count matrix (genes x samples)
         metadata (pd.DataFrame): Sample metadata (samples as index)
+        design_factor (str): Column in metadata to use as the design factor.
+        dds (DeseqDataSet, optional): Fitted DESeq2 dataset to reuse. Default is None.
 
     Returns:
         pd.DataFrame: Normalized count matrix (genes x samples)
     """
-    # Transpose to shape expected by PyDESeq2 (samples x genes)
-    count_matrix = count_matrix.T
+    # Reuse the existing fit if provided (e.g. from run_dge_analysis)
+    if dds is not None:
+        return normalized_counts_from_dds(dds)
 
-    # Automatically select the first column as the design factor
-    metadata[design_factor] = metadata[design_factor].astype(str)
+    # Fit DESeq2 (or reuse a cached fit of the same data)
+    return get_normalized_counts(count_matrix, metadata, design_factor)
 
-    # Create DESeq2 dataset object
-    dds = DeseqDataSet(
-        counts=count_matrix,
-        metadata=metadata,
-        design_factors=[design_factor]
-    )
 
-    # Run DESeq2 normalization
-    dds.deseq2()
+def normalized_counts_from_dds(dds):
+    """
+    Extracts the normalized count matrix from a fitted DeseqDataSet.
+
+    Args:
+        dds (DeseqDataSet): DESeq2 dataset with fitted size factors.
 
-    # Extract normalized counts and transpose back (genes x samples)
+    Returns:
+        pd.DataFrame: Normalized count matrix (genes x samples)
+    """
+    # Extract normalized counts and transpose back (genes x samples),
+    # single precision is sufficient for plots and averages
     normalized_counts = pd.DataFrame(
-        (dds.layers["normed_counts"]).T,
+        (dds.layers["normed_counts"]).T.astype(np.float32),
         index=dds.var_names,
         columns=dds.obs_names
     )
 
     return normalized_counts
+
+
+def size_factors(count_matrix):
+    """
+    Computes DESeq2 median-of-ratios size factors directly with NumPy.
+
+    Only genes with non-zero counts in every sample are used as reference, as in
+    PyDESeq2. If no such gene exists, the positive counts of each gene are used
+    instead (DESeq2 "poscounts" method).
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples)
+
+    Returns:
+        np.ndarray: Size factor for each sample (in column order)
+
+    Raises:
+        ValueError: If a sample has no positive counts in any gene, so its size factor is undefined.
+    """
+    counts = count_matrix.to_numpy()
+
+    # Reference genes: expressed in all samples (finite geometric mean)
+    expressed = (counts > 0).all(axis=1)
+
+    if expressed.any():
+        log_counts = np.log(counts[expressed].astype(np.float64))
+        log_ratios = log_counts - log_counts.mean(axis=1, keepdims=True)
+        return np.exp(np.median(log_ratios, axis=0))
+
+    # Fallback: geometric mean over positive counts only ("poscounts")
+    positive = counts > 0
+    log_counts = np.zeros(counts.shape, dtype=np.float64)
+    np.log(counts, out=log_counts, where=positive)
+    logmeans = log_counts.sum(axis=1) / counts.shape[1]
+    # As in DESeq2, only genes with a zero geometric mean (no positive count) are left out
+    logmeans[~positive.any(axis=1)] = -np.inf
+    usable = np.isfinite(logmeans)[:, None] & positive
+
+    if not usable.any(axis=0).all():
+        empty = count_matrix.columns[~usable.any(axis=0)].tolist()
+        raise ValueError(f"Size factors cannot be computed: no gene has positive counts in sample(s) {empty}.")
+
+    sf = np.array([
+        np.exp(np.median(log_counts[usable[:, j], j] - logmeans[usable[:, j]]))
+        for j in range(counts.shape[1])
+    ])
+
+    # Normalize to a geometric mean of 1, as DESeq2 does for poscounts
+    return sf / np.exp(np.mean(np.log(sf)))
+
+
+@instrumented
+def size_factor_normalization(count_matrix, transform=None):
+    """
+    Normalizes raw counts with median-of-ratios size factors only.
+
+    Unlike extract_normalized_counts, no dispersions or fold changes are fitted,
+    which makes it suitable for quick exploratory plots such as PCA.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples)
+        transform (str, optional): Transformation applied after normalization:
+            None, "log" (log2(x + 1)) or "vst" (variance stabilizing transformation). Default is None.
+
+    Returns:
+        pd.DataFrame: Normalized (and optionally transformed) count matrix (genes x samples)
+    """
+    # Divide every sample (column) by its size factor (single precision is sufficient for PCA)
+    normalized = count_matrix.to_numpy(dtype=np.float32) / size_factors(count_matrix).astype(np.float32)
+
+    if transform == "log":
+        normalized = np.log2(normalized + 1, dtype=np.float32)
+    elif transform == "vst":
+        normalized = _vst(normalized)
+    elif transform is not None:
+        raise ValueError(f"Unknown transform: {transform}")
+
+    return pd.DataFrame(normalized, index=count_matrix.index, columns=count_matrix.columns)
+
+
+def _vst(normalized):
+    """
+    Variance stabilizing transformation for a constant (mean) dispersion trend.
+
+    The common dispersion is estimated blindly (without design) as the mean of
+    gene-wise method-of-moments dispersions, which corresponds to DESeq2's
+    vst with fitType="mean".
+
+    Args:
+        normalized (np.ndarray): Normalized counts (genes x samples)
+
+    Returns:
+        np.ndarray: VST values on log2-like scale (genes x samples)
+    """
+    means = normalized.mean(axis=1)
+    variances = normalized.var(axis=1, ddof=1)
+
+    # Method-of-moments dispersion for expressed genes
+    expressed = means > 0
+    dispersions = (variances[expressed] - means[expressed]) / means[expressed] ** 2
+    dispersions = dispersions[dispersions > 1e-7]
+    a0 = dispersions.mean() if dispersions.size else 1e-2
+
+    vst = np.sqrt(a0 * normalized, dtype=normalized.dtype)
+    np.arcsinh(vst, out=vst)
+    vst *= 2
+    vst -= np.log(a0) + np.log(4)
+    vst /= np.log(2)
+    return vst
@@ -1,8 +1,76 @@
+import numpy as np
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 from adjustText import adjust_text
 from sklearn.preprocessing import StandardScaler
 import pandas as pd
+from functions.instrumentation import instrumented
+
+# Above this number of genes, PCA uses randomized SVD instead of the full decomposition
+RANDOMIZED_MIN_GENES = 2000
+
+# Up to this number of labels, labels are placed with adjustText (iterative, slow for many labels);
+# more labels are placed on a grid in linear time
+ADJUST_TEXT_MAX_LABELS = 50
+
+# Samples farther than this from their group median (in robust standard deviations) are outliers
+OUTLIER_DISTANCE = 3.0
+
+# Label fontsize in points
+LABEL_FONTSIZE = 9
+
+# Marker size (area in points^2)
+MARKER_SIZE = 80
+
+@instrumented
+def compute_pca(normalized_counts, n_top_genes=500, n_components=10):
+    """
+    Computes a PCA of the samples from the most variable genes.
+
+    Only the leading components are computed; for many genes a randomized SVD is
+    used, which is much faster than the full decomposition and gives the same
+    leading components up to sign. The result can be plotted for any pair of
+    components and any metadata coloring without recomputing.
+
+    Args:
+        normalized_counts (pd.DataFrame): Normalized expression matrix (genes x samples).
+        n_top_genes (int or None): Number of genes with the highest variance used for the PCA (None for all genes).
+        n_components (int): Maximum number of principal components to compute.
+
+    Returns:
+        dict: "scores" (pd.DataFrame, samples x components "PC1", "PC2", ...),
+              "explained_variance_ratio" (np.ndarray) and "n_genes" (number of genes used).
+    """
+    values = normalized_counts.to_numpy()
+
+    # Select the most variable genes (rows)
+    if n_top_genes is not None and n_top_genes < values.shape[0]:
+        variances = values.var(axis=1)
+        top = np.argpartition(variances, -n_top_genes)[-n_top_genes:]
+        values = values[np.sort(top)]
+
+    # Standardize data (samples x genes view of the array, no transposed DataFrame copy)
+    scaler = StandardScaler()
+    scaled = scaler.fit_transform(values.T)
+
+    n_components = min(n_components, *scaled.shape)
+    pca = PCA(
+        n_components=n_components,
+        svd_solver="randomized" if scaled.shape[1] > RANDOMIZED_MIN_GENES else "full",
+        random_state=0
+    )
+    components = pca.fit_transform(scaled)
+
+    return {
+        "scores": pd.DataFrame(
+            components,
+            columns=[f"PC{i + 1}" for i in range(n_components)],
+            index=normalized_counts.columns
+        ),
+        "explained_variance_ratio": pca.explained_variance_ratio_,
+        "n_genes": scaled.shape[1]
+    }
+
 
 def pca(normalized_counts, metadata, color_by):
     """
@@ -17,21 +85,32 @@ def pca(normalized_counts, metadata, color_by):
     Returns:
         matplotlib.figure.Figure: A figure containing the PCA scatter plot.
     """
+    return plot_pca(compute_pca(normalized_counts, n_top_genes=None), metadata, color_by)
 
-    # Transpose to shape: samples x genes
-    normalized_counts = normalized_counts.T
 
-    # Standardize data
-    scaler = StandardScaler()
-    scaled = scaler.fit_transform(normalized_counts)
+@instrumented
+def plot_pca(pca_result, metadata, color_by, pc_x=1, pc_y=2, labels="auto", selected_samples=None):
+    """
+    Plots two principal components of a computed PCA, with points colored by a metadata column.
 
-    # Perform PCA to reduce to 2 principal components
-    pca = PCA(n_components=2)
-    components = pca.fit_transform(scaled)
+    Args:
+        pca_result (dict): Result of compute_pca.
+        metadata (pd.DataFrame): Sample metadata with grouping information.
+        color_by (str): Column name in metadata used for coloring points.
+        pc_x (int): Number of the component on the X axis (starting at 1).
+        pc_y (int): Number of the component on the Y axis (starting at 1).
+        labels (str): Samples labeled with their name: "all", "outliers", "selected", "none", or "auto"
+                      (all samples up to ADJUST_TEXT_MAX_LABELS samples, otherwise outliers).
+        selected_samples (list of str, optional): Samples labeled with labels="selected".
+
+    Returns:
+        matplotlib.figure.Figure: A figure containing the PCA scatter plot.
+    """
+    x_label, y_label = f"PC{pc_x}", f"PC{pc_y}"
 
     # Build PCA result DataFrame with sample names and group info
-    pca_df = pd.DataFrame(components, columns=["PC1", "PC2"], index=normalized_counts.index)
-    pca_df[color_by] = metadata.loc[normalized_counts.index, color_by]
+    pca_df = pca_result["scores"][[x_label, y_label]].copy()
+    pca_df[color_by] = metadata.loc[pca_df.index, color_by]
 
     # Plotting
     fig, ax = plt.subplots(figsize=(8, 6))
@@ -39,40 +118,125 @@ def pca(normalized_counts, metadata, color_by):
     unique_groups = pca_df[color_by].unique()
     colors = plt.cm.tab20.colors  # Use a color palette with up to 20 distinct colors
 
-    texts = []
-
     # Scatter each group with label
     for i, group in enumerate(unique_groups):
         group_df = pca_df[pca_df[color_by] == group]
         ax.scatter(
-            group_df["PC1"],
-            group_df["PC2"],
+            group_df[x_label],
+            group_df[y_label],
             label=str(group),
             color=colors[i % len(colors)],
-            s=80
+            s=MARKER_SIZE
         )
 
-        # Add sample labels to each point
-        for j in range(len(group_df)):
-            texts.append(
-                ax.text(
-                    group_df["PC1"].iloc[j],
-                    group_df["PC2"].iloc[j],
-                    group_df.index[j],
-                    fontsize=9
-                )
-            )
-
-    # Automatically adjust text to reduce overlaps
-    adjust_text(texts, arrowprops=dict(arrowstyle='-', color='gray'))
+    # Add sample labels
+    if labels == "auto":
+        labels = "all" if len(pca_df) <= ADJUST_TEXT_MAX_LABELS else "outliers"
+    if labels == "all":
+        labeled = pca_df
+    elif labels == "outliers":
+        labeled = pca_df[_outliers(pca_df, x_label, y_label, color_by)]
+    elif labels == "selected":
+        labeled = pca_df[pca_df.index.isin(selected_samples or [])]
+    else:
+        labeled = pca_df.iloc[:0]
 
     # Axis labels and title
-    ax.set_xlabel("PC1")
-    ax.set_ylabel("PC2")
+    variance = pca_result["explained_variance_ratio"]
+    ax.set_xlabel(f"{x_label} ({variance[pc_x - 1]:.1%} variance)")
+    ax.set_ylabel(f"{y_label} ({variance[pc_y - 1]:.1%} variance)")
     ax.set_title("PCA of Gene Expression")
 
     # Legend positioned outside the plot
     ax.legend(loc='center left', bbox_to_anchor=(1, 0.5), title=color_by)
     fig.tight_layout()
 
+    # Labels are placed last, on the final layout (positions are computed in pixels)
+    if len(labeled) <= ADJUST_TEXT_MAX_LABELS:
+        texts = [
+            ax.text(x, y, name, fontsize=LABEL_FONTSIZE)
+            for name, x, y in zip(labeled.index, labeled[x_label], labeled[y_label])
+        ]
+        # Automatically adjust text to reduce overlaps
+        if texts:
+            adjust_text(texts, arrowprops=dict(arrowstyle='-', color='gray'))
+    else:
+        _grid_labels(ax, pca_df[[x_label, y_label]].to_numpy(), labeled[[x_label, y_label]].to_numpy(), labeled.index)
+
     return fig
+
+
+@instrumented
+def plot_scree(pca_result):
+    """
+    Plots the variance explained by each computed principal component (scree plot).
+
+    Args:
+        pca_result (dict): Result of compute_pca.
+
+    Returns:
+        matplotlib.figure.Figure: A figure with explained variance per component and its cumulative sum.
+    """
+    variance = pca_result["explained_variance_ratio"] * 100
+    labels = list(pca_result["scores"].columns)
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.bar(labels, variance, color="steelblue", label="Explained variance")
+    ax.plot(labels, np.cumsum(variance), color="black", marker="o", label="Cumulative")
+
+    ax.set_xlabel("Principal component")
+    ax.set_ylabel("Explained variance (%)")
+    ax.set_title(f"Scree Plot ({pca_result['n_genes']} genes)")
+    ax.set_ylim(0, 105)
+    ax.legend(loc="center right")
+    fig.tight_layout()
+
+    return fig
+
+
+def _outliers(pca_df, x_label, y_label, color_by):
+    # Distance of each sample from the median of its group, in robust standard deviations (MAD) per axis
+    coordinates = pca_df[[x_label, y_label]]
+    residuals = coordinates - coordinates.groupby(pca_df[color_by]).transform("median")
+    scale = 1.4826 * (residuals - residuals.median()).abs().median()
+    scale = scale.where(scale > 0, coordinates.std()).replace(0, 1)
+    distance = np.sqrt(((residuals / scale) ** 2).sum(axis=1))
+    return distance.to_numpy() > OUTLIER_DISTANCE
+
+
+def _grid_labels(ax, points, label_points, names):
+    # Places labels next to their points on an occupancy grid (one pass, linear in the number of labels).
+    # Each label takes the first free position around its point; labels without free space are skipped.
+    ax.autoscale_view()
+    pixels_per_point = ax.figure.dpi / 72
+    cell = 0.5 * LABEL_FONTSIZE * pixels_per_point
+    marker_radius = np.sqrt(MARKER_SIZE) / 2 * pixels_per_point
+
+    def cells(x0, y0, x1, y1):
+        return {(i, j)
+                for i in range(int(np.floor(x0 / cell)), int(np.floor(x1 / cell)) + 1)
+                for j in range(int(np.floor(y0 / cell)), int(np.floor(y1 / cell)) + 1)}
+
+    # Cells covered by the markers
+    occupied = set()
+    for px, py in ax.transData.transform(points):
+        occupied |= cells(px - marker_radius, py - marker_radius, px + marker_radius, py + marker_radius)
+
+    # (offset in points, horizontal alignment, vertical alignment): right, left, above, below, diagonals
+    positions = [((7, 0), "left", "center"), ((-7, 0), "right", "center"),
+                 ((0, 7), "center", "bottom"), ((0, -7), "center", "top"),
+                 ((5, 5), "left", "bottom"), ((-5, 5), "right", "bottom"),
+                 ((5, -5), "left", "top"), ((-5, -5), "right", "top")]
+
+    for (x, y), (px, py), name in zip(label_points, ax.transData.transform(label_points), names):
+        width = 0.6 * LABEL_FONTSIZE * len(str(name)) * pixels_per_point
+        height = LABEL_FONTSIZE * pixels_per_point
+        for (dx, dy), ha, va in positions:
+            x0 = px + dx * pixels_per_point - {"left": 0, "center": width / 2, "right": width}[ha]
+            y0 = py + dy * pixels_per_point - {"bottom": 0, "center": height / 2, "top": height}[va]
+            covered = cells(x0, y0, x0 + width, y0 + height)
+            if not covered & occupied:
+                occupied |= covered
+                ax.annotate(str(name), (x, y), xytext=(dx, dy), textcoords="offset points",
+                            ha=ha, va=va, fontsize=LABEL_FONTSIZE)
+                break
@@ -0,0 +1,204 @@
+import os
+import time
+import pandas as pd
+import matplotlib.pyplot as plt
+from natsort import natsorted
+from functions.ingest import read_count_matrix
+from functions.detect_delimiter import detect_delimiter
+from functions.validate_metadata import validate_metadata
+from functions.prefilter import prefilter_genes, DEFAULT_SETTINGS
+from functions.fit_cache import fit_dds
+from functions.dge_analysis import run_batch_dge, build_contrasts
+from functions.normalized_counts import normalized_counts_from_dds, size_factor_normalization
+from functions.average_counts import average_counts
+from functions.dge_summary import summarize_dge
+from functions.maplot import ma_plot
+from functions.volcano_plot import volcano_plot
+from functions.scatter_genes import DENSITY_MIN_GENES
+from functions.clustermap import plot_heatmap
+from functions.clustermap_custom import custom_heatmap
+from functions.expression_trends import expression_trends
+from functions.pca import compute_pca, plot_pca
+
+# -------------------------------------------------------
+# Complete analysis of one dataset without Streamlit (used by batch.py):
+# ingest, metadata validation, prefilter, DESeq2 fit, contrasts, summaries,
+# plots and trend tables, written to an output directory.
+# -------------------------------------------------------
+
+
+def load_metadata(path):
+    """
+    Reads a metadata CSV file (sample names in the first column), detecting the delimiter.
+
+    Args:
+        path (str): Path to the metadata file.
+
+    Returns:
+        pd.DataFrame: Metadata with sample names as index.
+    """
+    with open(path, "rb") as file:
+        delimiter = detect_delimiter(file)
+        return pd.read_csv(file, index_col=0, delimiter=delimiter)
+
+
+def run_pipeline(counts_path, metadata_path, output_dir, factor=None, mode="all pairs", reference=None,
+                 contrasts=None, prefilter=None, pval_threshold=0.05, lfc_threshold=1.0, top_n=50,
+                 genes_path=None, condition_order=None, n_cpus=None, log=print):
+    """
+    Runs the whole DGE workflow for one dataset and writes results and figures to a directory.
+
+    Written files:
+        summary.csv, normalized_counts.csv, average_counts.csv, pca.png and, per comparison,
+        <comparison>/results.csv, upregulated.csv, downregulated.csv, ma_plot.png,
+        volcano_plot.png and heatmap.png. With a gene list also custom_heatmap.png and trend_table.csv.
+
+    Args:
+        counts_path (str): Count matrix file (CSV/TSV, optionally gzip or zstd compressed).
+        metadata_path (str): Metadata CSV file.
+        output_dir (str): Directory for the results (created if needed).
+        factor (str, optional): Metadata column used as the design factor. Default is the first column.
+        mode (str): "all pairs" or "vs reference", used when contrasts are not given.
+        reference (str, optional): Reference level for "vs reference" mode.
+        contrasts (list of list of str, optional): Explicit [experimental, reference] pairs.
+        prefilter (dict, optional): Arguments of prefilter_genes. Default is DEFAULT_SETTINGS.
+        pval_threshold (float): Maximum adjusted p-value for significant genes.
+        lfc_threshold (float): Minimum absolute log2 fold change for significant genes.
+        top_n (int): Number of genes in the top genes heatmap.
+        genes_path (str, optional): Text file with one gene per line for the custom heatmap and trend table.
+        condition_order (list of str, optional): Condition order of the trend table. Default is natural sort.
+        n_cpus (int, optional): Number of CPUs used for the fit and the comparisons. Default is all CPUs.
+        log (callable): Called with progress messages.
+
+    Returns:
+        dict: Summary of the run ("genes", "samples", "genes_removed", "comparisons", "seconds").
+
+    Raises:
+        ValueError: If the metadata is invalid or the factor/contrasts do not match it.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    # --- Input ---
+    with open(counts_path, "rb") as file:
+        count_matrix = read_count_matrix(file)
+    metadata = load_metadata(metadata_path)
+    log(f"Loaded {count_matrix.shape[0]} genes x {count_matrix.shape[1]} samples")
+
+    errors = []
+    if not validate_metadata(count_matrix, metadata, report=errors.append):
+        raise ValueError(errors[0])
+
+    factor = factor or metadata.columns[0]
+    if factor not in metadata.columns:
+        raise ValueError(f"Condition column '{factor}' not found in metadata.")
+    levels = metadata[factor].astype(str).unique().tolist()
+
+    if contrasts:
+        contrasts = [[factor, str(experimental), str(ref)] for experimental, ref in contrasts]
+    else:
+        contrasts = build_contrasts(factor, levels, mode, reference)
+    unknown = {level for contrast in contrasts for level in contrast[1:]} - set(levels)
+    if unknown:
+        raise ValueError(f"Unknown condition(s) in contrasts: {', '.join(sorted(unknown))}")
+
+    # --- Model fit and comparisons ---
+    count_matrix, prefilter_summary = prefilter_genes(count_matrix, **(prefilter or DEFAULT_SETTINGS))
+    log(f"Prefilter removed {prefilter_summary['genes_removed']} of {prefilter_summary['genes_before']} genes")
+
+    dds = fit_dds(count_matrix, metadata, factor, n_cpus=n_cpus)
+    log(f"DESeq2 fit completed in {dds.uns['fit_seconds']:.1f} s")
+    batch_results = run_batch_dge(dds, contrasts, n_workers=n_cpus)
+
+    normalized_counts = normalized_counts_from_dds(dds)
+    mean_counts = average_counts(normalized_counts, metadata, factor)
+    normalized_counts.to_csv(os.path.join(output_dir, "normalized_counts.csv"))
+    mean_counts.to_csv(os.path.join(output_dir, "average_counts.csv"))
+
+    # --- Per-comparison tables and plots ---
+    summaries = []
+    for label, results in batch_results.items():
+        comparison_dir = os.path.join(output_dir, label)
+        os.makedirs(comparison_dir, exist_ok=True)
+
+        summary, upregulated, downregulated = summarize_dge(results, pval_threshold, lfc_threshold)
+        summaries.append(summary.assign(Comparison=label))
+        results.to_csv(os.path.join(comparison_dir, "results.csv"))
+        upregulated.to_csv(os.path.join(comparison_dir, "upregulated.csv"))
+        downregulated.to_csv(os.path.join(comparison_dir, "downregulated.csv"))
+
+        density = len(results) > DENSITY_MIN_GENES
+        _save_figure(ma_plot(results, pval_threshold, label, density=density),
+                     os.path.join(comparison_dir, "ma_plot.png"))
+        _save_figure(volcano_plot(results, pval_threshold, lfc_threshold, label, density=density),
+                     os.path.join(comparison_dir, "volcano_plot.png"))
+        heatmap = plot_heatmap(results, mean_counts, top_n, True, True, "adjusted p-value", label)
+        if heatmap is not None:
+            _save_figure(heatmap, os.path.join(comparison_dir, "heatmap.png"))
+        log(f"{label}: {len(upregulated)} up, {len(downregulated)} down")
+
+    summary_table = pd.concat(summaries, ignore_index=True).set_index("Comparison")
+    summary_table.to_csv(os.path.join(output_dir, "summary.csv"))
+
+    # --- Sample PCA (same defaults as the Data Overview page) ---
+    pca_result = compute_pca(size_factor_normalization(count_matrix, transform="vst"))
+    _save_figure(plot_pca(pca_result, metadata, factor), os.path.join(output_dir, "pca.png"))
+
+    # --- Custom gene list: heatmap and trend table ---
+    if genes_path:
+        with open(genes_path, encoding="utf-8") as file:
+            genes = [g.strip() for g in file if g.strip()]
+        fig, missing_genes = custom_heatmap(genes, mean_counts, True, False)
+        if missing_genes:
+            log(f"Genes not found and ignored: {', '.join(missing_genes)}")
+        if fig is not None:
+            _save_figure(fig, os.path.join(output_dir, "custom_heatmap.png"))
+        table = expression_trends(
+            genes=genes,
+            condition_order=condition_order or natsorted(levels),
+            factor=factor,
+            padj_threshold=pval_threshold,
+            l2fc_threshold=lfc_threshold,
+            dds=dds
+        )
+        table.to_csv(os.path.join(output_dir, "trend_table.csv"))
+
+    return {
+        "genes": int(count_matrix.shape[0]),
+        "samples": int(count_matrix.shape[1]),
+        "genes_removed": int(prefilter_summary["genes_removed"]),
+        "comparisons": list(batch_results),
+        "seconds": round(time.perf_counter() - start, 2)
+    }
+
+
+def run_dataset(dataset):
+    """
+    Runs run_pipeline for one dataset of a batch; meant to run in a worker process.
+
+    Args:
+        dataset (dict): Keyword arguments of run_pipeline plus "name" (used in log messages).
+
+    Returns:
+        dict: "name", "status" ("done" or "failed"), and the run summary or "error".
+    """
+    dataset = dict(dataset)
+    name = dataset.pop("name")
+
+    def log(message):
+        print(f"[{name}] {message}", flush=True)
+
+    try:
+        summary = run_pipeline(**dataset, log=log)
+    except Exception as e:
+        log(f"Failed: {e}")
+        return {"name": name, "status": "failed", "error": str(e)}
+
+    log(f"Done in {summary['seconds']:.1f} s")
+    return {"name": name, "status": "done", **summary}
+
+
+def _save_figure(fig, path):
+    # Same rendering as the figures shown in the app
+    fig.savefig(path, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
@@ -0,0 +1,163 @@
+import weakref
+from collections import OrderedDict
+import numpy as np
+import streamlit as st
+from functions.instrumentation import instrumented
+
+# Available prefilter methods (label shown in the sidebar -> method name)
+PREFILTER_METHODS = {
+    "Minimum total count": "total",
+    "Minimum count in N samples": "samples",
+    "None": None
+}
+
+# Settings used until the user changes them (DESeq2 vignette: total count of at least 10)
+DEFAULT_SETTINGS = {"method": "total", "min_count": 10, "min_samples": 3}
+
+# Number of prefilter settings whose filtered matrix is kept per session
+MAX_FILTERED = 4
+
+
+@instrumented
+def prefilter_genes(count_matrix, method="total", min_count=10, min_samples=3):
+    """
+    Removes genes with too few reads to be tested before normalization and model fitting.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        method (str or None): "total" keeps genes with a total count of at least min_count,
+                              "samples" keeps genes with at least min_count reads in at least
+                              min_samples samples, None keeps all genes.
+        min_count (int): Minimum (total or per-sample) count.
+        min_samples (int): Minimum number of samples (method "samples" only).
+
+    Returns:
+        tuple:
+            - pd.DataFrame: Filtered count matrix (the input itself if no gene was removed).
+            - dict: Summary with "genes_before" and "genes_removed".
+    """
+    counts = count_matrix.to_numpy()
+    if method == "total":
+        keep = counts.sum(axis=1, dtype=np.int64) >= min_count
+    elif method == "samples":
+        keep = (counts >= min_count).sum(axis=1) >= min_samples
+    elif method is None:
+        keep = np.ones(len(count_matrix), dtype=bool)
+    else:
+        raise ValueError(f"Unknown prefilter method: {method}")
+
+    summary = {"genes_before": len(count_matrix), "genes_removed": int((~keep).sum())}
+    if keep.all():
+        return count_matrix, summary
+    return count_matrix[keep], summary
+
+
+def fit_time_saved(dds, genes_removed):
+    """
+    Estimates the DESeq2 fitting time saved by removing genes before the fit.
+
+    Dispersion and log fold change fitting is done gene by gene, so the fit time
+    scales with the number of genes.
+
+    Args:
+        dds (DeseqDataSet): Fitted DESeq2 dataset object (with uns["fit_seconds"]).
+        genes_removed (int): Number of genes removed by the prefilter.
+
+    Returns:
+        float or None: Estimated time saved in seconds, None if the fit time is unknown.
+    """
+    fit_seconds = dds.uns.get("fit_seconds")
+    if fit_seconds is None or dds.n_vars == 0:
+        return None
+    return fit_seconds * genes_removed / dds.n_vars
+
+
+def filtered_counts(count_matrix, settings, state=None):
+    """
+    Returns the prefiltered count matrix, filtering it only when the matrix or the settings change.
+
+    The results of the last MAX_FILTERED settings are kept in the session state, so reruns
+    of the DGE and Overview pages reuse the same filtered matrix, and sessions sharing a
+    count matrix with different settings do not replace each other's results.
+
+    Args:
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples).
+        settings (dict): Keyword arguments for prefilter_genes, as returned by prefilter_sidebar.
+        state (MutableMapping, optional): Where the results are kept. Default is st.session_state.
+
+    Returns:
+        tuple: Filtered count matrix and summary, as returned by prefilter_genes.
+    """
+    state = st.session_state if state is None else state
+    settings = tuple(sorted(settings.items()))
+
+    # Results of another count matrix are dropped (the matrix is referenced weakly, so it is
+    # not counted twice in the session memory and a new matrix never matches a collected one)
+    cached = state.get("prefiltered")
+    if cached is None or cached["count_matrix"]() is not count_matrix:
+        cached = {"count_matrix": weakref.ref(count_matrix), "results": OrderedDict()}
+        state["prefiltered"] = cached
+
+    if settings in cached["results"]:
+        cached["results"].move_to_end(settings)
+        return cached["results"][settings]
+
+    result = prefilter_genes(count_matrix, **dict(settings))
+    cached["results"][settings] = result
+    while len(cached["results"]) > MAX_FILTERED:
+        cached["results"].popitem(last=False)
+    return result
+
+
+def prefilter_sidebar():
+    """
+    Shows the prefilter settings in the sidebar.
+
+    The settings are kept in session state, so the DGE and Overview pages use the same filter.
+    Streamlit removes the state of widgets that are not shown on a page, so the widgets are
+    initialized from the kept settings when they are created again (their labels and help texts
+    do not depend on the settings, since a changed label would reset the widget).
+
+    Returns:
+        dict: Keyword arguments for prefilter_genes.
+    """
+    settings = st.session_state.setdefault("prefilter", dict(DEFAULT_SETTINGS))
+    labels = list(PREFILTER_METHODS)
+    widget_values = {
+        "prefilter_method": labels[list(PREFILTER_METHODS.values()).index(settings["method"])],
+        "prefilter_min_count": settings["min_count"],
+        "prefilter_min_samples": settings["min_samples"]
+    }
+    for key, value in widget_values.items():
+        st.session_state.setdefault(key, value)
+
+    st.sidebar.write("## Gene Prefilter")
+    st.sidebar.selectbox(
+        "Remove low-count genes",
+        labels,
+        key="prefilter_method",
+        help="Genes with too few reads cannot be significant. Removing them before fitting "
+             "reduces the DESeq2 fit time. The same filter is used on the Overview and DGE pages."
+    )
+    settings["method"] = PREFILTER_METHODS[st.session_state["prefilter_method"]]
+
+    if settings["method"] is not None:
+        st.sidebar.number_input(
+            "Minimum count",
+            min_value=0,
+            step=1,
+            key="prefilter_min_count",
+            help="Minimum total count of a gene (Minimum total count), or minimum count of a gene "
+                 "in each of the required samples (Minimum count in N samples)."
+        )
+        settings["min_count"] = st.session_state["prefilter_min_count"]
+    if settings["method"] == "samples":
+        st.sidebar.number_input(
+            "Minimum number of samples",
+            min_value=1,
+            step=1,
+            key="prefilter_min_samples"
+        )
+        settings["min_samples"] = st.session_state["prefilter_min_samples"]
+
+    return dict(settings)
@@ -0,0 +1,164 @@
+import weakref
+import numpy as np
+
+# Sort key for genes by absolute fold change (not a column of the results table)
+ABS_LFC = "|log2FoldChange|"
+
+# Sort key for genes by gene ID (the index of the results table)
+GENE_ID = "Gene ID"
+
+_indexes = {}   # id(results) -> (weak reference, results index)
+
+
+def results_index(results):
+    """
+    Returns the index of a DGE result table, building it on first use.
+
+    Genes are sorted once by adjusted p-value, so the significant genes for any
+    padj threshold are a prefix found by binary search. Sort orders of other
+    columns and the gene ID search index are added when first needed. The index
+    is built once per result table object.
+
+    Args:
+        results (pd.DataFrame): DGE result table from PyDESeq2 with columns "log2FoldChange" and "padj".
+
+    Returns:
+        dict: "order" (row positions sorted by padj, missing values last), "padj" (sorted padj values),
+              "lfc" (log2 fold changes in the same order) and lazily filled "sort_orders" and "gene_ids".
+    """
+    cached = _indexes.get(id(results))
+    if cached is not None and cached[0]() is results:
+        return cached[1]
+
+    padj = results["padj"].to_numpy(dtype=np.float64)
+    order = np.argsort(padj, kind="stable")
+    index = {
+        "order": order,
+        "padj": padj[order],
+        "lfc": results["log2FoldChange"].to_numpy(dtype=np.float64)[order],
+        "sort_orders": {"padj": order},
+        "gene_ids": None
+    }
+    _indexes[id(results)] = (weakref.ref(results, lambda _, i=id(results): _indexes.pop(i, None)), index)
+    return index
+
+
+def significant_positions(results, pval_threshold, lfc_threshold):
+    """
+    Finds the significantly up- and downregulated genes using the threshold index.
+
+    Args:
+        results (pd.DataFrame): DGE result table from PyDESeq2 with columns "log2FoldChange" and "padj".
+        pval_threshold (float): Maximum adjusted p-value (exclusive).
+        lfc_threshold (float): Minimum absolute log2 fold change (exclusive).
+
+    Returns:
+        tuple:
+            - np.ndarray: Row positions of upregulated genes, in table order.
+            - np.ndarray: Row positions of downregulated genes, in table order.
+    """
+    index = results_index(results)
+
+    # Genes with padj < threshold are the first n_significant genes of the sorted index
+    n_significant = np.searchsorted(index["padj"], pval_threshold, side="left")
+    lfc = index["lfc"][:n_significant]
+    order = index["order"][:n_significant]
+
+    return np.sort(order[lfc > lfc_threshold]), np.sort(order[lfc < -lfc_threshold])
+
+
+def sort_order(results, column, ascending=True):
+    """
+    Returns the row positions of a result table sorted by a column (missing values last).
+
+    Args:
+        results (pd.DataFrame): DGE result table.
+        column (str): Column name, ABS_LFC or GENE_ID.
+        ascending (bool): Sort direction.
+
+    Returns:
+        np.ndarray: Row positions in sorted order.
+    """
+    index = results_index(results)
+    if column not in index["sort_orders"]:
+        if column == GENE_ID:
+            index["sort_orders"][column] = _gene_id_index(results, index)[1]
+        else:
+            values = np.abs(results["log2FoldChange"]) if column == ABS_LFC else results[column]
+            index["sort_orders"][column] = np.argsort(values.to_numpy(dtype=np.float64), kind="stable")
+
+    order = index["sort_orders"][column]
+    if ascending:
+        return order
+
+    # Descending: reverse the sorted values, but keep missing values last
+    if column == GENE_ID:
+        return order[::-1]
+    values = np.abs(results["log2FoldChange"]) if column == ABS_LFC else results[column]
+    n_valid = len(order) - int(values.isna().sum())
+    return np.concatenate([order[:n_valid][::-1], order[n_valid:]])
+
+
+def search_genes(results, query):
+    """
+    Finds genes whose ID starts with the query (case-insensitive), by binary search.
+
+    Args:
+        results (pd.DataFrame): DGE result table (gene IDs as index).
+        query (str): Beginning of the gene ID.
+
+    Returns:
+        np.ndarray: Row positions of matching genes, in table order.
+    """
+    index = results_index(results)
+    sorted_ids, order = _gene_id_index(results, index)
+
+    query = query.strip().lower()
+    start = np.searchsorted(sorted_ids, query, side="left")
+    # All IDs with this prefix sort before the prefix followed by the highest code point
+    end = np.searchsorted(sorted_ids, query + "\U0010ffff", side="left")
+    return np.sort(order[start:end])
+
+
+def results_page(results, sort_by=None, ascending=True, query="", page=1, page_size=50):
+    """
+    Selects one page of a result table, optionally filtered by gene ID and sorted.
+
+    Only the rows of the requested page are copied.
+
+    Args:
+        results (pd.DataFrame): DGE result table.
+        sort_by (str, optional): Column name, ABS_LFC or GENE_ID; None keeps the table order.
+        ascending (bool): Sort direction.
+        query (str): Beginning of the gene ID to search for (case-insensitive); empty for all genes.
+        page (int): Page number (starting at 1).
+        page_size (int): Number of rows per page.
+
+    Returns:
+        tuple:
+            - pd.DataFrame: Rows of the requested page.
+            - int: Number of rows matching the search.
+    """
+    if query.strip():
+        positions = search_genes(results, query)
+        if sort_by is not None:
+            # Order the matches by their rank in the precomputed sort order
+            rank = np.empty(len(results), dtype=np.int64)
+            rank[sort_order(results, sort_by, ascending)] = np.arange(len(results))
+            positions = positions[np.argsort(rank[positions], kind="stable")]
+    elif sort_by is not None:
+        positions = sort_order(results, sort_by, ascending)
+    else:
+        positions = np.arange(len(results))
+
+    start = (page - 1) * page_size
+    return results.iloc[positions[start:start + page_size]], len(positions)
+
+
+def _gene_id_index(results, index):
+    # Sorted lower-case gene IDs and the row position of each
+    if index["gene_ids"] is None:
+        ids = results.index.astype(str).str.lower().to_numpy(dtype=str)
+        order = np.argsort(ids, kind="stable")
+        index["gene_ids"] = (ids[order], order)
+    return index["gene_ids"]
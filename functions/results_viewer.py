@@ -0,0 +1,54 @@
+import math
+import streamlit as st
+from functions.results_index import results_page, search_genes, ABS_LFC, GENE_ID
+
+# Rows per page offered in the viewer
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def results_viewer(results, key, column_config=None):
+    """
+    Shows a DGE result table page by page; only the visible page is sent to the browser.
+
+    Gene ID search and sorting use the precomputed results index.
+
+    Args:
+        results (pd.DataFrame): DGE result table (gene IDs as index).
+        key (str): Unique prefix for the widget keys of this viewer.
+        column_config (dict, optional): Column configuration passed to st.dataframe.
+    """
+    sort_options = ["Table order", GENE_ID, *results.columns, ABS_LFC]
+
+    search_col, sort_col, order_col, size_col, page_col = st.columns([3, 2, 2, 1, 1])
+    with search_col:
+        query = st.text_input("Search gene ID", key=f"{key}_search", placeholder="Beginning of the gene ID")
+    with sort_col:
+        sort_by = st.selectbox("Sort by", sort_options, key=f"{key}_sort")
+    with order_col:
+        order = st.radio("Order", ["Ascending", "Descending"], horizontal=True, key=f"{key}_order",
+                         disabled=sort_by == "Table order")
+    with size_col:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+
+    n_rows = len(search_genes(results, query)) if query.strip() else len(results)
+    n_pages = max(1, math.ceil(n_rows / page_size))
+
+    # Keep the selected page valid when the search or page size changes
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    with page_col:
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+
+    data, n_rows = results_page(
+        results,
+        sort_by=None if sort_by == "Table order" else sort_by,
+        ascending=order == "Ascending",
+        query=query,
+        page=page,
+        page_size=page_size
+    )
+
+    st.dataframe(data, use_container_width=True, column_config=column_config)
+    first = (page - 1) * page_size + 1 if n_rows else 0
+    st.caption(f"Rows {first}–{first + len(data) - 1 if n_rows else 0} of {n_rows}")
@@ -0,0 +1,305 @@
+import os
+import json
+import uuid
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pydeseq2.dds import DeseqDataSet
+from functions.instrumentation import instrumented
+
+# -------------------------------------------------------
+# Persistent store of finished DGE analyses ("runs").
+# Each run is saved in its own directory under a unique run ID:
+#   run.json          parameters, comparison labels and scalar fit results
+#   counts.parquet    count matrix used for the fit (after prefiltering)
+#   metadata.parquet  sample metadata
+#   model.npz         per-gene and per-sample fit results (dispersions, LFCs, size factors, ...)
+#   results/<n>.parquet  result table of each comparison
+# A run is reopened by rebuilding the fitted DeseqDataSet from these arrays, without refitting.
+# -------------------------------------------------------
+
+# Directory of the saved runs (saving is disabled if set to an empty string)
+RUN_STORE_DIR = os.environ.get("DGE_RUN_STORE_DIR", "dge_runs")
+
+# Maximum number of saved runs per owner; the oldest runs of the owner are deleted when a new run is saved
+# (0 keeps all runs). Runs without an owner share one limit.
+MAX_RUNS = int(os.environ.get("DGE_RUN_STORE_MAX", 50))
+
+# Version of the directory layout, stored with each run
+FORMAT_VERSION = 1
+
+# Per-sample fit results needed to compute contrasts; the other per-sample intermediates
+# (means, Cook's distances, hat matrix diagonals) are only used while fitting and are not saved
+SAMPLE_ARRAYS = ("size_factors", "replaceable")
+
+
+def new_run_id():
+    """
+    Creates a unique run ID, e.g. "20240131-142501-3fa2c1".
+
+    Returns:
+        str: Run ID (sortable by creation time).
+    """
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+@instrumented
+def save_run(dds, batch_results, count_matrix, metadata, factor, contrasts, prefilter_summary=None, name=None,
+             owner=None, store_dir=None):
+    """
+    Saves a finished DGE analysis to the run store.
+
+    If a run with the same fit and the same comparisons was saved before (and can be opened by the owner),
+    it is reused. Runs of the owner beyond MAX_RUNS are deleted, oldest first.
+
+    Args:
+        dds (DeseqDataSet): Fitted DESeq2 dataset object.
+        batch_results (dict): Comparison label -> results DataFrame, as returned by run_batch_dge.
+        count_matrix (pd.DataFrame): Raw count matrix (genes x samples) used for the fit.
+        metadata (pd.DataFrame): Sample metadata (samples as index) used for the fit.
+        factor (str): Design factor used for the fit.
+        contrasts (list of list of str): Evaluated contrasts, in the order of batch_results.
+        prefilter_summary (dict, optional): Effect of the low-count gene prefilter.
+        name (str, optional): Description shown in the list of runs, e.g. the count matrix file name.
+        owner (str, optional): User that saved the run; only the owner may open or delete it.
+                               Runs without an owner can be opened and deleted by everyone.
+        store_dir (str, optional): Directory of the run store. Default is RUN_STORE_DIR.
+
+    Returns:
+        str: Run ID, or None if the run store is disabled.
+    """
+    store_dir = RUN_STORE_DIR if store_dir is None else store_dir
+    if not store_dir:
+        return None
+
+    fit_key = dds.uns.get("fit_key")
+    if fit_key is not None:
+        for info in list_runs(owner, store_dir):
+            if info["fit_key"] == fit_key and info["comparisons"] == list(batch_results):
+                return info["id"]
+
+    run_id = new_run_id()
+    uns, uns_arrays = _split_uns(dds.uns)
+    info = {
+        "id": run_id,
+        "format": FORMAT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "name": name,
+        "owner": owner,
+        "factor": factor,
+        "contrasts": [list(map(str, contrast)) for contrast in contrasts],
+        "comparisons": list(batch_results),
+        "genes": int(dds.n_vars),
+        "samples": int(dds.n_obs),
+        "fit_key": fit_key,
+        "prefilter_summary": prefilter_summary,
+        "lfc_columns": dds.varm["LFC"].columns.tolist(),
+        "uns": uns,
+        # Genes whose counts are all zero after replacing Cook's outliers (only set by a refit)
+        "new_all_zeroes_genes": (dds.new_all_zeroes_genes.tolist()
+                                 if hasattr(dds, "new_all_zeroes_genes") else None)
+    }
+
+    arrays = {f"varm.{key}": np.asarray(value) for key, value in dds.varm.items()}
+    arrays.update({f"obsm.{key}": dds.obsm[key] for key in SAMPLE_ARRAYS if key in dds.obsm})
+    arrays.update({f"uns.{key}": value for key, value in uns_arrays.items()})
+
+    # Written to a temporary directory first, so a partially saved run is never listed
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_dir = os.path.join(store_dir, f".{run_id}.tmp")
+    os.makedirs(os.path.join(tmp_dir, "results"))
+    try:
+        # Saved as passed (same dtypes), so the fit key of the reopened run is unchanged
+        count_matrix.to_parquet(os.path.join(tmp_dir, "counts.parquet"))
+        metadata.to_parquet(os.path.join(tmp_dir, "metadata.parquet"))
+        np.savez_compressed(os.path.join(tmp_dir, "model.npz"), **arrays)
+        for i, results in enumerate(batch_results.values()):
+            results.to_parquet(os.path.join(tmp_dir, "results", f"{i}.parquet"))
+        with open(os.path.join(tmp_dir, "run.json"), "w", encoding="utf-8") as file:
+            json.dump(info, file, indent=2)
+        os.replace(tmp_dir, os.path.join(store_dir, run_id))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if MAX_RUNS > 0:
+        # Only runs of the same owner count towards the limit, so saving never deletes runs of other users
+        own_runs = [info for info in _read_runs(store_dir) if info.get("owner") == owner]
+        for info in own_runs[MAX_RUNS:]:
+            shutil.rmtree(os.path.join(store_dir, info["id"]), ignore_errors=True)
+
+    return run_id
+
+
+def list_runs(owner=None, store_dir=None):
+    """
+    Lists the saved runs that an owner may open, most recent first.
+
+    Args:
+        owner (str, optional): User listing the runs; runs saved without an owner are always listed.
+        store_dir (str, optional): Directory of the run store. Default is RUN_STORE_DIR.
+
+    Returns:
+        list of dict: Run information as saved in run.json ("id", "created", "name", "factor",
+                      "comparisons", "genes", "samples", ...).
+    """
+    store_dir = RUN_STORE_DIR if store_dir is None else store_dir
+    return [info for info in _read_runs(store_dir) if _is_owner(info.get("owner"), owner)]
+
+
+def _read_runs(store_dir):
+    # All saved runs of every owner, most recent first
+    if not store_dir or not os.path.isdir(store_dir):
+        return []
+
+    runs = []
+    for run_id in sorted(os.listdir(store_dir), reverse=True):
+        if run_id.startswith("."):
+            continue
+        try:
+            with open(os.path.join(store_dir, run_id, "run.json"), encoding="utf-8") as file:
+                runs.append(json.load(file))
+        except (OSError, ValueError):
+            # Not a run directory, or a run that could not be read
+            continue
+    return runs
+
+
+@instrumented
+def load_run(run_id, owner=None, store_dir=None):
+    """
+    Loads a saved run, rebuilding the fitted DeseqDataSet without refitting.
+
+    Args:
+        run_id (str): Run ID, as returned by save_run.
+        owner (str, optional): User opening the run.
+        store_dir (str, optional): Directory of the run store. Default is RUN_STORE_DIR.
+
+    Returns:
+        dict: {"info": run information, "count_matrix": counts used for the fit (genes x samples),
+               "metadata": sample metadata, "dds": fitted DeseqDataSet,
+               "batch_results": comparison label -> results DataFrame}.
+
+    Raises:
+        FileNotFoundError: If the run does not exist.
+        PermissionError: If the run was saved by another owner.
+    """
+    store_dir = RUN_STORE_DIR if store_dir is None else store_dir
+    run_dir = os.path.join(store_dir, run_id)
+
+    with open(os.path.join(run_dir, "run.json"), encoding="utf-8") as file:
+        info = json.load(file)
+    if not _is_owner(info.get("owner"), owner):
+        raise PermissionError(f"Run {run_id} was saved by another user.")
+    count_matrix = pd.read_parquet(os.path.join(run_dir, "counts.parquet"))
+    metadata = pd.read_parquet(os.path.join(run_dir, "metadata.parquet"))
+    batch_results = {
+        label: pd.read_parquet(os.path.join(run_dir, "results", f"{i}.parquet"))
+        for i, label in enumerate(info["comparisons"])
+    }
+    with np.load(os.path.join(run_dir, "model.npz"), allow_pickle=False) as model:
+        arrays = {key: model[key] for key in model.files}
+
+    return {
+        "info": info,
+        "count_matrix": count_matrix,
+        "metadata": metadata,
+        "dds": _rebuild_dds(info, count_matrix, metadata, arrays),
+        "batch_results": batch_results
+    }
+
+
+def delete_run(run_id, owner=None, store_dir=None):
+    """
+    Deletes a saved run.
+
+    Args:
+        run_id (str): Run ID.
+        owner (str, optional): User requesting the deletion.
+        store_dir (str, optional): Directory of the run store. Default is RUN_STORE_DIR.
+
+    Raises:
+        PermissionError: If the run was saved by another owner.
+    """
+    store_dir = RUN_STORE_DIR if store_dir is None else store_dir
+    run_dir = os.path.join(store_dir, run_id)
+    if not can_delete_run(run_id, owner, store_dir):
+        raise PermissionError(f"Run {run_id} was saved by another user.")
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def can_delete_run(run_id, owner=None, store_dir=None):
+    """
+    Checks whether a saved run may be deleted by an owner.
+
+    Runs saved without an owner may be deleted by anyone.
+
+    Args:
+        run_id (str): Run ID.
+        owner (str, optional): User requesting the deletion.
+        store_dir (str, optional): Directory of the run store. Default is RUN_STORE_DIR.
+
+    Returns:
+        bool: True if the run does not exist, has no owner, or belongs to the owner.
+    """
+    store_dir = RUN_STORE_DIR if store_dir is None else store_dir
+    try:
+        with open(os.path.join(store_dir, run_id, "run.json"), encoding="utf-8") as file:
+            run_owner = json.load(file).get("owner")
+    except (OSError, ValueError):
+        return True
+    return _is_owner(run_owner, owner)
+
+
+def _is_owner(run_owner, owner):
+    # Runs saved without an owner belong to everyone
+    return run_owner is None or run_owner == owner
+
+def _split_uns(uns):
+    # Scalars and small structures go to run.json, arrays and Series to model.npz
+    values, arrays = {}, {}
+    for key, value in uns.items():
+        if isinstance(value, (pd.Series, np.ndarray)) and np.ndim(value) > 0:
+            arrays[key] = np.asarray(value)
+        elif isinstance(value, np.generic) or (isinstance(value, np.ndarray) and value.ndim == 0):
+            values[key] = value.item()
+        else:
+            values[key] = value
+    return values, arrays
+
+
+def _rebuild_dds(info, count_matrix, metadata, arrays):
+    factor = info["factor"]
+    metadata = metadata.copy()
+    metadata[factor] = metadata[factor].astype(str)
+
+    dds = DeseqDataSet(
+        counts=count_matrix.T,
+        metadata=metadata,
+        design_factors=[factor],
+        quiet=True
+    )
+
+    for key, value in arrays.items():
+        part, name = key.split(".", 1)
+        if part == "varm":
+            dds.varm[name] = value
+        elif part == "obsm":
+            dds.obsm[name] = value
+        else:
+            dds.uns[name] = value
+    dds.uns.update(info["uns"])
+    dds.varm["LFC"] = pd.DataFrame(dds.varm["LFC"], index=dds.var_names, columns=info["lfc_columns"])
+    if "trend_coeffs" in dds.uns:
+        dds.uns["trend_coeffs"] = pd.Series(dds.uns["trend_coeffs"], index=["a0", "a1"])
+
+    # Attributes set while fitting, derived from the saved arrays
+    dds.layers["normed_counts"] = dds.X / dds.obsm["size_factors"][:, None]
+    dds.non_zero_idx = np.arange(dds.n_vars)[dds.varm["non_zero"]]
+    dds.non_zero_genes = dds.var_names[dds.varm["non_zero"]]
+    if info["new_all_zeroes_genes"] is not None:
+        dds.new_all_zeroes_genes = pd.Index(info["new_all_zeroes_genes"])
+    dds.uns["run_id"] = info["id"]
+
+    return dds
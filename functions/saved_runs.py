@@ -0,0 +1,133 @@
+import streamlit as st
+from functions.run_store import RUN_STORE_DIR, list_runs, load_run, delete_run, can_delete_run
+from functions.fit_cache import add_fitted_dds
+from functions.dge_analysis import cache_contrast_results
+from functions.normalized_counts import normalized_counts_from_dds
+from functions.average_counts import average_counts
+from functions.dataset_store import session_share, session_share_all
+
+
+def run_owner():
+    """
+    Identifies the owner of the runs saved by this session.
+
+    Without authentication there is no identity that outlives a session (the session ID changes
+    with every page reload), so runs are saved without an owner and are available to everyone.
+
+    Returns:
+        str or None: E-mail address of the logged-in user, or None if authentication is not configured.
+    """
+    if st.experimental_user.get("is_logged_in") and st.experimental_user.get("email"):
+        return f"user:{st.experimental_user['email']}"
+    return None
+
+
+def open_run(run_id):
+    """
+    Loads a saved DGE analysis into the session state, as if it had just been run.
+
+    Args:
+        run_id (str): Run ID from the run store.
+    """
+    run = load_run(run_id, run_owner())
+    info = run["info"]
+    factor = info["factor"]
+
+    # The reopened fit and its comparisons are reused (e.g. for trend tables) instead of recomputed
+    dds = add_fitted_dds(run["count_matrix"], run["metadata"], factor, run["dds"])
+    cache_contrast_results(dds, info["contrasts"], run["batch_results"])
+
+    # The run replaces the data of this session; results of the previous data are removed
+    st.session_state.pop("pca", None)
+    st.session_state["count_matrix"] = session_share(run["count_matrix"], "count_matrix")
+    st.session_state["count_matrix_name"] = info["name"]
+    st.session_state["metadata"] = session_share(run["metadata"], "metadata")
+    st.session_state["metadata_ready"] = True
+    st.session_state["factor"] = factor
+    st.session_state["dge_factor"] = factor
+
+    batch_results = session_share_all(run["batch_results"], "batch_results")
+    st.session_state["dds"] = session_share(dds, "dds")
+    st.session_state["batch_results"] = batch_results
+    st.session_state["comparison_label"] = next(iter(batch_results))
+    st.session_state["results"] = batch_results[st.session_state["comparison_label"]]
+    st.session_state["prefilter_summary"] = info["prefilter_summary"] or {"genes_before": info["genes"],
+                                                                          "genes_removed": 0}
+
+    normalized_counts = normalized_counts_from_dds(dds)
+    st.session_state["normalized_counts"] = session_share(normalized_counts, "normalized_counts")
+    st.session_state["average_counts"] = session_share(average_counts(normalized_counts, run["metadata"], factor),
+                                                       "average_counts")
+    st.session_state["run_id"] = run_id
+    st.session_state["dge_done"] = True
+
+
+def saved_runs_panel():
+    """
+    Lists the saved DGE analyses of the user and lets the user reopen or delete one.
+
+    With authentication, only the user that saved an analysis can see, reopen and delete it;
+    without authentication all analyses are shared. Deleting asks for a confirmation.
+    """
+    if not RUN_STORE_DIR:
+        st.caption("Saving analyses is disabled (DGE_RUN_STORE_DIR is empty).")
+        return
+
+    owner = run_owner()
+    runs = list_runs(owner)
+    if not runs:
+        st.caption("No saved analyses yet. Every finished DGE analysis is saved automatically.")
+        return
+
+    run_ids = [run["id"] for run in runs]
+    descriptions = {
+        run["id"]: (
+            f"{run['created'].replace('T', ' ')[:16]} · {run['name'] or 'count matrix'} · {run['factor']}: "
+            + ", ".join(label.replace("_", " ") for label in run["comparisons"][:3])
+            + (f" (+{len(run['comparisons']) - 3})" if len(run["comparisons"]) > 3 else "")
+            + f" · {run['genes']} genes x {run['samples']} samples"
+        )
+        for run in runs
+    }
+    run_id = st.selectbox(
+        "Saved analysis",
+        run_ids,
+        format_func=descriptions.get,
+        key="saved_run",
+        help="Reopening loads the count matrix (after the low-count prefilter), the metadata, "
+             "the fitted model and all comparisons, without fitting the model again."
+    )
+    st.caption(f"Run ID: {run_id}")
+
+    open_col, delete_col = st.columns(2)
+    with open_col:
+        # A background analysis of this session would overwrite the reopened results
+        if st.button("Open", key="saved_run_open", disabled="dge_job" in st.session_state):
+            with st.spinner("Opening analysis..."):
+                try:
+                    open_run(run_id)
+                except (OSError, ValueError, KeyError) as e:
+                    st.error(f"The analysis could not be opened: {e}")
+                    return
+            st.switch_page("dge.py")
+    with delete_col:
+        if st.button("Delete", key="saved_run_delete", disabled=not can_delete_run(run_id, owner),
+                     help="Only the user that saved an analysis can delete it."):
+            st.session_state["saved_run_confirm_delete"] = run_id
+
+    if st.session_state.get("saved_run_confirm_delete") == run_id:
+        st.warning(f"Delete the saved analysis {run_id}? This cannot be undone.")
+        confirm_col, keep_col = st.columns(2)
+        with confirm_col:
+            if st.button("Delete permanently", key="saved_run_delete_confirm", type="primary"):
+                del st.session_state["saved_run_confirm_delete"]
+                try:
+                    delete_run(run_id, owner)
+                except PermissionError as e:
+                    st.error(str(e))
+                    return
+                st.rerun()
+        with keep_col:
+            if st.button("Keep", key="saved_run_delete_cancel"):
+                del st.session_state["saved_run_confirm_delete"]
+                st.rerun()
@@ -0,0 +1,69 @@
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap, LogNorm
+
+# Above this number of genes, the Visualization page uses density rendering by default
+DENSITY_MIN_GENES = 10000
+
+# Resolution of the density image (bins along x and y)
+DENSITY_BINS = (300, 200)
+
+# Light to dark gray, so dense regions of not significant genes stay in the background
+_DENSITY_CMAP = LinearSegmentedColormap.from_list("density", ["#d9d9d9", "#404040"])
+
+
+def scatter_genes(ax, x, y, colors, density=False):
+    """
+    Draws genes of an MA or volcano plot, either as points or as a density image.
+
+    In density mode, not significant (gray) genes are binned into a 2D histogram
+    drawn as a single image and only significant genes are drawn as markers, so
+    the drawing cost does not grow with the number of not significant genes.
+
+    Args:
+        ax (matplotlib.axes.Axes): Axes to draw on.
+        x (array-like): X coordinates of the genes.
+        y (array-like): Y coordinates of the genes.
+        colors (np.ndarray): Color of each gene ("red", "blue" or "gray").
+        density (bool): Draw not significant genes as a density image.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if not density:
+        ax.scatter(x, y, c=colors, alpha=0.6)
+        return
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    background = finite & (colors == "gray")
+    foreground = finite & ~background
+
+    if finite.any():
+        # Bin over the range of all genes, so the markers lie inside the image
+        x_range = _padded_range(x[finite])
+        y_range = _padded_range(y[finite])
+        counts, _, _ = np.histogram2d(
+            x[background], y[background],
+            bins=DENSITY_BINS,
+            range=[x_range, y_range]
+        )
+        if counts.any():
+            ax.imshow(
+                np.ma.masked_equal(counts.T, 0),   # empty bins stay transparent
+                extent=(*x_range, *y_range),
+                origin="lower",
+                aspect="auto",
+                interpolation="nearest",
+                cmap=_DENSITY_CMAP,
+                norm=LogNorm(vmin=1, vmax=counts.max())
+            )
+        ax.set_xlim(x_range)
+        ax.set_ylim(y_range)
+
+    ax.scatter(x[foreground], y[foreground], c=colors[foreground], alpha=0.6)
+
+
+def _padded_range(values):
+    # Data range with a 5 % margin (and a non-zero width)
+    low, high = values.min(), values.max()
+    margin = 0.05 * (high - low) or 0.5
+    return low - margin, high + margin
@@ -1,6 +1,8 @@
 import streamlit as st
+from functions.instrumentation import instrumented
 
-def validate_metadata(count_matrix, metadata):
+@instrumented
+def validate_metadata(count_matrix, metadata, report=st.error):
     """
     Validates the structure and contents of the uploaded metadata.
 
@@ -12,27 +14,28 @@ def validate_metadata(count_matrix, metadata):
     Parameters:
         count_matrix (pd.DataFrame): The count matrix with samples as columns.
         metadata (pd.DataFrame): The metadata with sample names as index.
+        report (callable, optional): Called with the error message if a check fails.
+            Default is st.error; e.g. a logging function when used outside Streamlit.
 
     Returns:
-        bool: True if metadata is valid, False otherwise (Streamlit error is shown).
+        bool: True if metadata is valid, False otherwise (the error is reported).
     """
 
 
     # 1. Check for missing values (NaN or empty strings)
     if metadata.isnull().values.any() or (metadata == "").any().any():
-        st.error("Metadata contains missing values. Please fill in all cells before proceeding.")
+        report("Metadata contains missing values. Please fill in all cells before proceeding.")
         return False
 
     # 2. Check sample name match (index vs. count matrix columns)
     if not all(metadata.index == count_matrix.columns):
-        print(metadata.index)
-        st.error("Mismatch between sample names in count matrix and metadata! "
+        report("Mismatch between sample names in count matrix and metadata! "
                  "Ensure that column names in the count matrix match the index in metadata (first column).")
         return False
 
     # 3. Check that there is at least one annotation column
     if metadata.shape[1] < 1:
-        st.error("No condition colum detected. Metadata must contain at least one column with experimental conditions.")
+        report("No condition colum detected. Metadata must contain at least one column with experimental conditions.")
         return False
 
     return True
@@ -1,7 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from functions.scatter_genes import scatter_genes
+from functions.webgl_scatter import webgl_scatter_html
+from functions.instrumentation import instrumented
 
-def volcano_plot(results, pval_threshold, lfc_threshold, comp_label):
+@instrumented
+def volcano_plot(results, pval_threshold, lfc_threshold, comp_label, density=False):
     """
     Creates a volcano plot to visualize differential gene expression.
 
@@ -14,6 +18,7 @@ def volcano_plot(results, pval_threshold, lfc_threshold, comp_label):
         results (pd.DataFrame): PyDeSeq2 result table with columns "log2FoldChange" and "padj".
         pval_threshold (float): Adjusted p-value threshold.
         lfc_threshold (float): Log2 fold change threshold.
+        density (bool): Draw not significant genes as a density image (faster for many genes).
 
     Returns:
         matplotlib.figure.Figure: The volcano plot figure.
@@ -35,11 +40,12 @@ def volcano_plot(results, pval_threshold, lfc_threshold, comp_label):
     fig, ax = plt.subplots(figsize=(8, 6))
 
     # Scatter: log2FC on X-axis, -log10(padj) on Y-axis
-    ax.scatter(
+    scatter_genes(
+        ax,
         results["log2FoldChange"],
         -np.log10(padj_safe),
-        c=colors,
-        alpha=0.6
+        colors,
+        density=density
     )
 
     # Axis labels and title
@@ -76,3 +82,26 @@ def volcano_plot(results, pval_threshold, lfc_threshold, comp_label):
     ax.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1, 0.5))
 
     return fig
+
+
+@instrumented
+def interactive_volcano_plot(results, comp_label):
+    """
+    Creates an interactive (WebGL) volcano plot with hover tooltips, zoom and client-side thresholds.
+
+    Args:
+        results (pd.DataFrame): PyDeSeq2 result table with columns "baseMean", "log2FoldChange" and "padj".
+        comp_label (str): Comparison label shown in the title.
+
+    Returns:
+        str: HTML page to be shown with st.components.v1.html.
+    """
+    return webgl_scatter_html(
+        results,
+        x=results["log2FoldChange"],
+        y=-np.log10(results["padj"].clip(lower=1e-300)),
+        mode="volcano",
+        title=f"Volcano Plot ({comp_label.replace('_', ' ')})",
+        x_label="log2 Fold Change",
+        y_label="-log10 Adjusted p-value"
+    )
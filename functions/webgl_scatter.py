@@ -0,0 +1,66 @@
+import os
+import json
+import base64
+import numpy as np
+
+# Height of the interactive component in pixels (controls and plot)
+COMPONENT_HEIGHT = 520
+
+# Thresholds shown when the page is opened; they are changed in the browser only, so the page
+# (with all genes embedded) is built once per result table
+DEFAULT_PVAL_THRESHOLD = 0.05
+DEFAULT_LFC_THRESHOLD = 1.0
+
+_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "webgl_scatter.html")
+
+
+def webgl_scatter_html(results, x, y, mode, title, x_label, y_label):
+    """
+    Builds a self-contained HTML page with an interactive WebGL scatter plot of DGE results.
+
+    The data are embedded as typed arrays (base64); hover tooltips, zoom, pan and
+    recoloring for new thresholds run in the browser without rerunning the script.
+    Genes without finite coordinates are not shown.
+
+    Args:
+        results (pd.DataFrame): PyDeSeq2 result table with columns "baseMean", "log2FoldChange" and "padj".
+        x (array-like): X coordinate of each gene.
+        y (array-like): Y coordinate of each gene.
+        mode (str): "ma" (significance by padj only) or "volcano" (padj and |log2FC| thresholds).
+        title (str): Plot title.
+        x_label (str): X axis label.
+        y_label (str): Y axis label.
+
+    Returns:
+        str: HTML page, e.g. for st.components.v1.html.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    shown = np.isfinite(x) & np.isfinite(y)
+
+    config = {
+        "mode": mode,
+        "title": title,
+        "xLabel": x_label,
+        "yLabel": y_label,
+        "padjThreshold": DEFAULT_PVAL_THRESHOLD,
+        "lfcThreshold": DEFAULT_LFC_THRESHOLD,
+        "genes": results.index[shown].astype(str).tolist(),
+        "x": _encode(x[shown], np.float32),
+        "y": _encode(y[shown], np.float32),
+        "baseMean": _encode(results["baseMean"].to_numpy()[shown], np.float32),
+        "lfc": _encode(results["log2FoldChange"].to_numpy()[shown], np.float32),
+        # Double precision, so very small adjusted p-values are shown exactly
+        "padj": _encode(results["padj"].to_numpy()[shown], np.float64),
+    }
+
+    with open(_TEMPLATE_PATH, encoding="utf-8") as f:
+        template = f.read()
+
+    # "</" is escaped so gene IDs cannot end the script element
+    return template.replace("/*CONFIG*/", json.dumps(config).replace("</", "<\\/"))
+
+
+def _encode(values, dtype):
+    # Little-endian typed array as base64 (the byte order of JavaScript typed arrays on all common platforms)
+    return base64.b64encode(np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()).decode("ascii")
@@ -23,7 +23,7 @@ with st.expander("🧭 Recommended Workflow"):
 # Input Formats
 with st.expander("📁 Input File Formats"):
     st.markdown("### 🔸 Count Matrix (.csv)")
-    st.markdown("A CSV file where the first column contains gene identifiers and the first row contains sample names. Values represent raw read counts:")
+    st.markdown("A CSV or TSV file where the first column contains gene identifiers and the first row contains sample names. Values represent raw read counts. Large files can be uploaded gzip (`.gz`) or zstd (`.zst`) compressed; genes with zero counts in all samples are removed while reading:")
 
     # Use real example from uploaded file
     example_counts = pd.DataFrame({
@@ -58,7 +58,7 @@ with st.expander("🏠 Home"):
     st.markdown("""
     This is the main page of the application, where users upload input files:
 
-    - **Count matrix** (`.CSV`)
+    - **Count matrix** (`.CSV`/`.TSV`, optionally `.gz`/`.zst` compressed)
     - **Metadata** (`.CSV`)  
       The required format of these files and example tables are shown in the Input File Format section above.
 
@@ -79,6 +79,14 @@ with st.expander("🏠 Home"):
     In that case, you can fix the metadata either on the **Generate or Edit Metadata** page or by uploading a corrected file again.
 
     If both files are uploaded and valid, a success message confirms that you can proceed to the next steps.
+
+    **Open a saved analysis:**
+    Every finished DGE analysis is saved automatically under a unique run ID. In the **Open a saved analysis** section,
+    a previous analysis of yours can be selected and opened: the count matrix (after the low-count prefilter), the metadata,
+    the fitted model and all comparisons are loaded within seconds, without fitting the model again, and the
+    **Differential Gene Expression** page is shown. Saved analyses that are no longer needed can be deleted there
+    (after a confirmation). Only the most recent analyses of each user are kept (50 by default). With login,
+    every user sees only their own analyses; without login, all saved analyses are shared.
     """)
 
 
@@ -124,12 +132,21 @@ with st.expander("📊 Data Overview"):
     PCA is used to assess **sample similarity**, detect **batch effects**, or reveal **biological structure**.
 
     **Before creating the PCA plot:**
-    - You must select a **factor** (column from metadata) that will be used for normalization via PyDESeq2 (median-of-ratios normalization).
-      This does not affect differential analysis later.
+    - You can select a **transformation** applied to the counts after median-of-ratios normalization (DESeq2 size factors):
+      variance stabilizing transformation (VST), log2(x + 1) or none. This does not affect differential analysis later.
+    - You choose how many of the **most variable genes** are used for the PCA (500 by default, as in DESeq2).
     - You also choose a **coloring factor** which determines which factor is used for coloring of the dots in the PCA plot.
+      The coloring can be changed at any time without recomputing the PCA.
+    - The **gene prefilter** removes low-count genes (minimum total count, or minimum count in N samples) before normalization.
+      It is shared with the Differential Gene Expression page.
     These inputs are selected in the sidebar on the left of the screen. The PCA plot will show after clicking the button below in the sidebar.
 
     Each sample is shown as a dot labeled with its name and colored by the selected factor. A legend appears beside the plot for reference.
+    Above the plot, any pair of the first principal components can be selected for the axes; the axis labels show the
+    share of variance explained by each component. The **scree plot** below shows the explained variance of all computed components.
+    **Sample labels** can show all samples, only outliers (samples far from the other samples of their group), selected samples
+    or none. By default all samples are labeled in experiments with up to 50 samples and only outliers in larger ones;
+    with many labels, labels that would overlap are left out.
     """)
 
 
@@ -144,7 +161,25 @@ with st.expander("🧬 Differential Gene Expression"):
         - One is selected as the **reference condition**
         - The other as the **experimental condition**
 
+    - A **comparison mode**:
+        - `Single comparison`: the experimental condition against the reference condition
+        - `All pairs`: every pair of categories of the condition column
+        - `All vs reference`: every category against the reference condition
+
+    - A **gene prefilter** (same settings as on the Data Overview page): genes with a total count below the minimum,
+      or with fewer than N samples reaching the minimum count, are removed before fitting. Such genes cannot be
+      significant, and removing them shortens the model fit. The number of removed genes and the estimated time saved
+      are shown above the results.
+
     Once selected, press the **Run DGE Analysis** button to start the analysis.
+    In the batch modes, the model is fitted only once and all comparisons are computed from it in parallel.
+    The model is fitted in the background: a progress bar is shown, the rest of the application can be used in the meantime
+    and a running analysis can be stopped with the **Cancel analysis** button. If the same data were already analyzed with the same
+    condition column, the saved model is reused and only the comparisons are computed.
+    The comparison shown on this page and on the **Visualization** page can then be switched with the **Show comparison** selector.
+    The finished analysis is saved under the run ID shown below the results title and can be reopened later on the **Home** page.
+    After editing the metadata, parts of the previous model are reused: the size factors always, and the dispersion estimates
+    if the samples are still grouped the same way (e.g. when a condition was only renamed), which makes the new fit much faster.
 
     ### 🔹 Output includes:
     - Full DGE result table with:
@@ -154,9 +189,10 @@ with st.expander("🧬 Differential Gene Expression"):
         - `stat`: test statistic value used for hypothesis testing (Wald test).
         - `p-value`: raw (unadjusted) p-value testing the null hypothesis that there is no difference in expression.
         - `adjusted p-value (padj)`: p-value adjusted for multiple testing using the Benjamini-Hochberg method; used to identify statistically significant differentially expressed genes.
-    - An interactive data table with options to:
-        - Search by gene
-        - Sort by any column
+    - An interactive data table, shown page by page, with options to:
+        - Search by gene (beginning of the gene ID, case-insensitive)
+        - Sort by any column, by gene ID or by absolute log2 fold change
+        - Choose the number of rows per page
         - Expand to fullscreen
     - A downloadable CSV with all results
 
@@ -192,13 +228,23 @@ with st.expander("🖼️ Visualization"):
       Combines log2FC (X-axis) and –log10 adjusted p-value (Y-axis) to highlight both change in expression and statistical significance.  
       Threshold lines are shown for both log2FC and padj. Genes are categorized similarly as in the MA plot.
 
+      Both plots offer two **rendering** modes: `Points` draws every gene as a dot, `Density` draws not significant
+      genes as a shaded density image (darker = more genes) and only significant genes as dots. `Density` is
+      selected by default for results with more than 10 000 genes, as it keeps plots fast for large data sets.
+      The `Interactive` mode draws all genes in the browser: hover over a gene to see its ID, baseMean, log2FC and padj,
+      scroll to zoom, drag to pan and double-click to reset the view. In this mode the thresholds are set in the
+      controls of the plot itself (starting at padj 0.05 and |log2FC| 1), which recolor the genes immediately.
+
     - **Heatmap**  
       Two options are available:
         1. **Top N genes:** Genes with the strongest expression change or statistical significance (selected by `padj` or `log2FC`). The number of shown genes can be changed.
         2. **Custom list:** User uploads a `.txt` file with one gene per line. The example of such file is in **Input File Formats** section.
 
-      Heatmaps are generated using normalized and averaged (by condition) read counts. Data are standardized using Z-score.  
+      Heatmaps are generated using normalized and averaged (by condition) read counts, or the normalized counts of
+      individual samples (option **Columns**; a color bar marks the condition of each sample). Data are standardized using Z-score.  
       Optional clustering (UPGMA method using Euclidean distance) can be toggled for both rows and columns.
+      Clustering results are reused when only the appearance of the heatmap changes, so heatmaps of several thousand genes
+      can be clustered; above 100 genes only a subset of gene labels is shown.
 
     ### 📈 Expression Trend Table
 
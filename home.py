@@ -2,6 +2,9 @@ import streamlit as st
 import pandas as pd
 from functions.validate_metadata import validate_metadata
 from functions.detect_delimiter import detect_delimiter
+from functions.ingest import load_count_matrix
+from functions.dataset_store import session_share  # Data shared by all sessions
+from functions.saved_runs import saved_runs_panel  # Reopen saved analyses
 
 st.set_page_config(layout="wide")
 
@@ -20,16 +23,27 @@ if "dge_done" not in st.session_state:
 # -------- Upload count matrix --------
 with col1:
     count_matrix_file = st.file_uploader(
-        "Upload Count Matrix (CSV)",
-        type=["csv"],
-        help="Upload a CSV file with raw gene expression counts. Rows should represent genes, and columns should represent samples. The first column must contain gene names."
+        "Upload Count Matrix (CSV/TSV, optionally gzip or zstd compressed)",
+        type=["csv", "tsv", "txt", "gz", "zst"],
+        help="Upload a CSV or TSV file with raw gene expression counts. Rows should represent genes, and columns should represent samples. The first column must contain gene names. Large files can be uploaded compressed (.gz or .zst)."
     )
 
-# If count matrix is uploaded, load and store it
+# If count matrix is uploaded, load and store it (parsed only once per file content)
 if count_matrix_file:
-    delimiter = detect_delimiter(count_matrix_file)
-    count_matrix = pd.read_csv(count_matrix_file, index_col=0, delimiter=delimiter)
-    st.session_state["count_matrix"] = count_matrix
+    try:
+        with st.spinner("Reading count matrix..."):
+            count_matrix = load_count_matrix(count_matrix_file)
+    except ValueError as e:
+        with col1:
+            st.error(f"The count matrix could not be read: {e}")
+    else:
+        st.session_state["count_matrix"] = session_share(count_matrix, "count_matrix")
+        st.session_state["count_matrix_name"] = count_matrix_file.name
+
+        removed = count_matrix.attrs.get("removed_zero_rows", 0)
+        if removed:
+            with col1:
+                st.caption(f"{removed} genes with zero counts in all samples were removed.")
 
 # -------- Upload metadata --------
 if "count_matrix" in st.session_state and "metadata" not in st.session_state:
@@ -55,8 +69,8 @@ if "count_matrix" in st.session_state and "metadata" not in st.session_state:
                 st.session_state["metadata_to_edit"] = metadata
                 st.stop()
 
-            # Save to session state
-            st.session_state["metadata"] = metadata
+            # Save to session state (the same table of another session is reused)
+            st.session_state["metadata"] = session_share(metadata, "metadata")
             st.session_state["metadata_ready"] = True
             st.session_state["dge_done"] = False
 
@@ -64,3 +78,8 @@ if "count_matrix" in st.session_state and "metadata" not in st.session_state:
 
 elif "count_matrix" in st.session_state and "metadata" in st.session_state:
     st.success("Files successfully uploaded.")
+
+
+# -------- Reopen a saved analysis --------
+with st.expander("Open a saved analysis"):
+    saved_runs_panel()
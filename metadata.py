@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from functions.validate_metadata import validate_metadata
+from functions.dataset_store import session_share  # Data shared by all sessions
 
 st.set_page_config(layout="wide")
 
@@ -64,7 +65,7 @@ if "count_matrix" in st.session_state:
             metadata = edited.set_index("SampleID")
             if not validate_metadata(st.session_state["count_matrix"], metadata):
                 st.stop()
-            st.session_state["metadata"] = metadata
+            st.session_state["metadata"] = session_share(metadata, "metadata")
             st.session_state["metadata_ready"] = True
             st.session_state["dge_done"] = False
             st.success("Metadata saved successfully.")
@@ -123,7 +124,7 @@ if "count_matrix" in st.session_state:
                     metadata = edited.set_index(edited.columns[0])
                     if not validate_metadata(st.session_state["count_matrix"], metadata):
                         st.stop()
-                    st.session_state["metadata"] = metadata
+                    st.session_state["metadata"] = session_share(metadata, "metadata")
                     st.session_state["metadata_ready"] = True
                     st.session_state["dge_done"] = False
                     st.success("Metadata updated successfully.")
@@ -1,6 +1,8 @@
 import streamlit as st
-from functions.pca import pca  # Custom function to compute and plot PCA
-from functions.normalized_counts import extract_normalized_counts  # Custom function for normalization
+from functions.pca import compute_pca, plot_pca, plot_scree  # PCA computation and plots
+from functions.figure_cache import cached_figure  # Rendered plots shared between reruns
+from functions.normalized_counts import size_factor_normalization  # Fast median-of-ratios normalization
+from functions.prefilter import filtered_counts, prefilter_sidebar  # Low-count gene prefilter
 
 # Set Streamlit page layout to wide
 st.set_page_config(layout="wide")
@@ -14,38 +16,113 @@ if "count_matrix" in st.session_state and "metadata" in st.session_state:
     # --- Sidebar options for PCA ---
     st.sidebar.write("## PCA Settings")
 
-    # Select design factor for normalization (used only for visualization)
-    factor = st.sidebar.selectbox(
-        "Design factor for normalization",
-        options=st.session_state["metadata"].columns,
-        help="This factor will only be used for normalization and PCA visualization. "
-             "You will choose the design factor for differential expression analysis separately."
+    # Select transformation applied to normalized counts before PCA
+    transformations = {"VST": "vst", "log2(x + 1)": "log", "None": None}
+    transformation = st.sidebar.selectbox(
+        "Transformation of normalized counts",
+        options=list(transformations),
+        help="Counts are normalized with DESeq2 median-of-ratios size factors. "
+             "The variance stabilizing transformation (VST) or log transformation reduces "
+             "the influence of highly expressed genes on the PCA."
+    )
+
+    # Select number of most variable genes used for the PCA
+    top_gene_options = {"500": 500, "1000": 1000, "2000": 2000, "5000": 5000, "All genes": None}
+    top_genes = st.sidebar.selectbox(
+        "Most variable genes used",
+        options=list(top_gene_options),
+        help="The PCA is computed from the genes with the highest variance across samples "
+             "(500 is the DESeq2 default). Fewer genes make the PCA faster and less noisy."
     )
 
     # Select metadata column to color the PCA samples by
     selected_factor = st.sidebar.selectbox(
         "Color samples by",
         options=st.session_state["metadata"].columns,
-        help="This will determine the sample coloring in the PCA plot."
+        help="This will determine the sample coloring in the PCA plot. Changing it does not recompute the PCA."
     )
 
-    # Generate PCA plot on button click
+    # Remove low-count genes (same settings as on the DGE page)
+    prefilter_settings = prefilter_sidebar()
+
+    # Settings the PCA depends on (coloring and shown components are applied to a computed PCA)
+    pca_settings = (transformation, top_genes, tuple(sorted(prefilter_settings.items())))
+
+    # Compute PCA on button click; the decomposition is kept for all plots below
     if st.sidebar.button("Create PCA plot"):
         with st.spinner("Creating PCA..."):
-            # Normalize counts using the selected design factor
-            normalized_counts = extract_normalized_counts(
-                st.session_state["count_matrix"],
-                st.session_state["metadata"],
-                factor
+            count_matrix, prefilter_summary = filtered_counts(st.session_state["count_matrix"], prefilter_settings)
+
+            # Normalize counts using size factors only (no full DESeq2 fit needed)
+            try:
+                normalized_counts = size_factor_normalization(
+                    count_matrix,
+                    transform=transformations[transformation]
+                )
+            except ValueError as e:
+                st.error(f"The counts could not be normalized: {e}")
+                st.stop()
+
+            st.session_state["pca"] = {
+                "result": compute_pca(normalized_counts, n_top_genes=top_gene_options[top_genes]),
+                "settings": pca_settings,
+                "prefilter_summary": prefilter_summary
+            }
+
+    # --- PCA Section ---
+    if "pca" in st.session_state:
+        st.write("### Principal Component Analysis (PCA)")
+        pca_state = st.session_state["pca"]
+        pca_result = pca_state["result"]
+
+        if pca_state["settings"] != pca_settings:
+            st.info("The PCA settings have changed. Click 'Create PCA plot' to recompute the PCA.")
+        if pca_state["prefilter_summary"]["genes_removed"]:
+            st.caption(f"Prefilter removed {pca_state['prefilter_summary']['genes_removed']} of "
+                       f"{pca_state['prefilter_summary']['genes_before']} genes.")
+
+        # Any pair of computed components can be shown without recomputing
+        n_components = pca_result["scores"].shape[1]
+        components = list(range(1, n_components + 1))
+        x_col, y_col, label_col = st.columns(3)
+        with x_col:
+            pc_x = st.selectbox("X axis", components, index=0, format_func=lambda i: f"PC{i}", key="pc_x")
+        with y_col:
+            pc_y = st.selectbox("Y axis", components, index=min(1, n_components - 1), format_func=lambda i: f"PC{i}", key="pc_y")
+        with label_col:
+            # Labeling every sample is slow and unreadable for large experiments
+            label_modes = {
+                "Automatic": "auto",
+                "All samples": "all",
+                "Outliers only": "outliers",
+                "Selected samples": "selected",
+                "None": "none"
+            }
+            label_mode = st.selectbox(
+                "Sample labels",
+                list(label_modes),
+                key="pca_labels",
+                help="Automatic labels all samples in small experiments (up to 50 samples) and only outliers "
+                     "(samples far from the other samples of their group) in larger ones."
             )
 
-            # --- PCA Section ---
-            st.write("### Principal Component Analysis (PCA)")
-            st.pyplot(pca(
-                normalized_counts,
-                st.session_state["metadata"],
-                selected_factor
-            ))
+        selected_samples = []
+        if label_modes[label_mode] == "selected":
+            selected_samples = st.multiselect("Samples to label", pca_result["scores"].index.tolist(), key="pca_selected_samples")
+
+        st.image(cached_figure(
+            plot_pca,
+            pca_result,
+            st.session_state["metadata"],
+            selected_factor,
+            pc_x=pc_x,
+            pc_y=pc_y,
+            labels=label_modes[label_mode],
+            selected_samples=selected_samples
+        ), use_container_width=True)
+
+        with st.expander("Show/hide explained variance (scree plot)"):
+            st.image(cached_figure(plot_scree, pca_result), use_container_width=True)
 
     # --- Total Reads Section ---
     st.write("### Total Reads per Sample")
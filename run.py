@@ -1,4 +1,8 @@
 import streamlit as st
+from functions.memory_usage import session_memory_usage  # Memory report of the session
+from functions.instrumentation import recording  # Timing and memory instrumentation
+from functions.diagnostics import session_recorder, diagnostics_panel  # Diagnostics of the analysis steps
+from functions.dataset_store import store_usage, stored_ids  # Data shared by all sessions
 
 # -------------------------------------------------------
 # Main navigation file to run a multi-page Streamlit app
@@ -47,5 +51,24 @@ pgs = st.navigation(
     pages=[home_page, metadata_page, overview_page, dge_page, visualization_page, help_page]
 )
 
-# --- Run selected page ---
-pgs.run()
+# --- Memory and diagnostics of this session (computed only while shown, not on every rerun) ---
+# Drawn before the page runs, so pages that end with st.stop() still show them; they reflect the
+# state after the previous script run
+if st.sidebar.toggle("Show memory usage and diagnostics", key="show_memory_usage"):
+    with st.sidebar.expander("Session memory usage", expanded=True):
+        usage = session_memory_usage(st.session_state, stored_ids())
+        st.write(f"Total: {usage.loc[~usage['Shared'], 'Size (MB)'].sum():.1f} MB "
+                 f"(+ {usage.loc[usage['Shared'], 'Size (MB)'].sum():.1f} MB shared with other sessions)")
+        shared = store_usage()
+        st.caption(f"Shared by all sessions: {shared['entries']} tables, {shared['referenced_mb']:.1f} MB in use, "
+                   f"{shared['unreferenced_mb']:.1f} MB kept for reuse")
+        st.dataframe(usage, hide_index=True,
+                     column_config={"Size (MB)": st.column_config.NumberColumn(format="%.2f")})
+
+    # Time and memory of the analysis steps of this session
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        diagnostics_panel()
+
+# --- Run selected page (timings of the analysis steps are recorded for the diagnostics) ---
+with recording(session_recorder()):
+    pgs.run()
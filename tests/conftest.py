@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+# Tests import the app modules (functions/, benchmarks/) from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_counts
+from functions import fit_cache, dge_analysis
+
+
+@pytest.fixture
+def dataset():
+    """
+    Small synthetic dataset: (count matrix, metadata, factor).
+    """
+    count_matrix, metadata, _ = synthetic_counts(n_genes=300, n_samples=6, n_conditions=2, seed=1)
+    return count_matrix, metadata, "condition"
+
+
+@pytest.fixture(autouse=True)
+def empty_fit_cache(monkeypatch):
+    """
+    Starts every test with empty in-memory caches and without the disk tier of the fit cache.
+    """
+    monkeypatch.setattr(fit_cache, "CACHE_DIR", None)
+    fit_cache.clear_cache()
+    dge_analysis.clear_cache()
+    yield
+    fit_cache.clear_cache()
+    dge_analysis.clear_cache()
@@ -0,0 +1,66 @@
+import gc
+import pandas as pd
+import pytest
+from functions import dataset_store
+from functions.dataset_store import StoreOwner, share, share_all, release, store_usage
+
+
+@pytest.fixture(autouse=True)
+def empty_store(monkeypatch):
+    monkeypatch.setattr(dataset_store, "_entries", dataset_store.OrderedDict())
+    monkeypatch.setattr(dataset_store, "_slots", {})
+
+
+def table(value=1):
+    return pd.DataFrame({"s1": [value, 2, 3], "s2": [4, 5, 6]}, index=["g1", "g2", "g3"])
+
+
+def refs():
+    return [entry["refs"] for entry in dataset_store._entries.values()]
+
+
+def test_same_content_is_stored_once():
+    first, second = StoreOwner(), StoreOwner()
+
+    stored = share(table(), first, "count_matrix")
+
+    assert share(table(), second, "count_matrix") is stored
+    assert refs() == [2]
+    assert not stored["s1"].to_numpy().flags.writeable
+
+
+def test_replacing_and_releasing_a_slot_updates_the_references(monkeypatch):
+    monkeypatch.setattr(dataset_store, "MAX_UNREFERENCED_MB", 1024)
+    owner = StoreOwner()
+
+    share(table(1), owner, "count_matrix")
+    share(table(2), owner, "count_matrix")
+    assert refs() == [0, 1]
+
+    release(owner, "count_matrix")
+    assert refs() == [0, 0]
+    assert store_usage()["referenced_mb"] == 0
+
+
+def test_unreferenced_entries_are_evicted_above_the_limit(monkeypatch):
+    monkeypatch.setattr(dataset_store, "MAX_UNREFERENCED_MB", 0)
+    owner = StoreOwner()
+
+    share_all({"a": table(1), "b": table(2)}, owner, "batch_results")
+    assert refs() == [1, 1]
+
+    share(table(3), owner, "batch_results")
+    assert refs() == [1]
+
+
+def test_references_of_a_collected_owner_are_released(monkeypatch):
+    monkeypatch.setattr(dataset_store, "MAX_UNREFERENCED_MB", 1024)
+    owner, other = StoreOwner(), StoreOwner()
+    share(table(), owner, "count_matrix")
+    share(table(), other, "count_matrix")
+
+    del owner
+    gc.collect()
+
+    assert store_usage()["entries"] == 1
+    assert refs() == [1]
@@ -0,0 +1,116 @@
+import threading
+import pandas as pd
+import pytest
+from functions import fit_cache
+from functions.fit_cache import fit_key, get_fitted_dds, get_normalized_counts, is_fit_cached
+
+
+def test_fit_key_depends_on_content_only(dataset):
+    count_matrix, metadata, factor = dataset
+
+    # Same content in new objects, and other metadata columns, do not change the key
+    other_metadata = metadata.copy()
+    other_metadata["batch"] = "b1"
+    assert fit_key(count_matrix, metadata, factor) == fit_key(count_matrix.copy(), other_metadata, factor)
+
+
+def test_fit_key_changes_with_inputs(dataset):
+    count_matrix, metadata, factor = dataset
+    key = fit_key(count_matrix, metadata, factor)
+
+    changed_counts = count_matrix.copy()
+    changed_counts.iloc[0, 0] += 1
+    renamed = metadata.replace({factor: {"C1": "control"}})
+    renamed_factor = metadata.rename(columns={factor: "group"})
+
+    assert fit_key(changed_counts, metadata, factor) != key
+    assert fit_key(count_matrix, renamed, factor) != key
+    assert fit_key(count_matrix, renamed_factor, "group") != key
+
+
+def test_fit_is_reused(dataset):
+    count_matrix, metadata, factor = dataset
+
+    dds = get_fitted_dds(count_matrix, metadata, factor)
+
+    assert is_fit_cached(count_matrix.copy(), metadata.copy(), factor)
+    assert get_fitted_dds(count_matrix.copy(), metadata.copy(), factor) is dds
+    assert dds.uns["fit_key"] == fit_key(count_matrix, metadata, factor)
+
+
+def test_fit_hashes_the_count_matrix_once(dataset, monkeypatch):
+    count_matrix, metadata, factor = dataset
+    hashed = []
+    original_hash = fit_cache.hash_dataframe
+    monkeypatch.setattr(fit_cache, "hash_dataframe", lambda df: hashed.append(df is count_matrix) or original_hash(df))
+
+    get_fitted_dds(count_matrix, metadata, factor)
+
+    assert sum(hashed) == 1
+
+
+def test_concurrent_requests_fit_once(dataset, monkeypatch):
+    count_matrix, metadata, factor = dataset
+    fits = []
+    original_fit = fit_cache.fit_dds
+    monkeypatch.setattr(fit_cache, "fit_dds", lambda *args, **kwargs: fits.append(1) or original_fit(*args, **kwargs))
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_fitted_dds(count_matrix, metadata, factor)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fits) == 1
+    assert len({id(dds) for dds in results}) == 1
+    assert fit_cache._key_locks == {}
+
+
+def test_failed_fit_releases_its_lock(dataset, monkeypatch):
+    count_matrix, metadata, factor = dataset
+
+    def failing_fit(*args, **kwargs):
+        raise RuntimeError("fit failed")
+
+    monkeypatch.setattr(fit_cache, "fit_dds", failing_fit)
+    with pytest.raises(RuntimeError):
+        get_fitted_dds(count_matrix, metadata, factor)
+
+    assert fit_cache._key_locks == {}
+    assert not is_fit_cached(count_matrix, metadata, factor)
+
+
+def test_least_recently_used_fit_is_evicted(dataset, monkeypatch):
+    count_matrix, metadata, factor = dataset
+    first = count_matrix.iloc[:100]
+    second = count_matrix.iloc[100:200]
+    third = count_matrix.iloc[200:]
+
+    get_fitted_dds(first, metadata, factor)
+    get_fitted_dds(second, metadata, factor)
+    # Room for about two fits
+    entry_bytes = max(entry["nbytes"] for entry in fit_cache._cache.values())
+    monkeypatch.setattr(fit_cache, "MAX_CACHE_MB", 2.5 * entry_bytes / 1024 ** 2)
+
+    get_fitted_dds(first, metadata, factor)   # first is now the most recently used
+    get_fitted_dds(third, metadata, factor)
+
+    assert is_fit_cached(first, metadata, factor)
+    assert not is_fit_cached(second, metadata, factor)
+    assert is_fit_cached(third, metadata, factor)
+
+
+def test_normalized_counts_are_added_to_the_entry_size(dataset):
+    count_matrix, metadata, factor = dataset
+
+    get_fitted_dds(count_matrix, metadata, factor)
+    entry = fit_cache._cache[fit_key(count_matrix, metadata, factor)]
+    nbytes = entry["nbytes"]
+    normalized_counts = get_normalized_counts(count_matrix, metadata, factor)
+
+    assert isinstance(normalized_counts, pd.DataFrame)
+    assert normalized_counts.shape == count_matrix.shape
+    assert entry["nbytes"] == nbytes + normalized_counts.memory_usage(deep=False).sum()
+    assert get_normalized_counts(count_matrix, metadata, factor) is normalized_counts
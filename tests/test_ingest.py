@@ -0,0 +1,83 @@
+import io
+import gzip
+import numpy as np
+import pandas as pd
+import pytest
+from functions import ingest
+from functions.ingest import read_count_matrix, compact_counts
+
+
+def csv_bytes(count_matrix, sep=","):
+    return count_matrix.to_csv(sep=sep).encode()
+
+
+@pytest.fixture
+def count_matrix():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 1000, size=(250, 4))
+    counts[::7] = 0   # genes without counts
+    return pd.DataFrame(counts, index=pd.Index([f"g{i}" for i in range(250)], name="GeneID"),
+                        columns=["s1", "s2", "s3", "s4"])
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 16, 1000])
+def test_chunks_give_the_same_matrix(count_matrix, chunk_rows):
+    parsed = read_count_matrix(io.BytesIO(csv_bytes(count_matrix)), chunk_rows=chunk_rows)
+
+    expected = count_matrix[count_matrix.to_numpy().any(axis=1)]
+    pd.testing.assert_frame_equal(parsed, expected.astype(np.uint32))
+    assert parsed.attrs["removed_zero_rows"] == len(count_matrix) - len(expected)
+
+
+def test_compressed_and_tab_separated_files(count_matrix):
+    plain = read_count_matrix(io.BytesIO(csv_bytes(count_matrix)), chunk_rows=32)
+    compressed = read_count_matrix(io.BytesIO(gzip.compress(csv_bytes(count_matrix, sep="\t"))), chunk_rows=32)
+
+    pd.testing.assert_frame_equal(compressed, plain)
+
+
+def test_zstd_compressed_file_is_decompressed_once(count_matrix, monkeypatch):
+    zstandard = pytest.importorskip("zstandard")
+    opened = []
+    original_open = ingest._open_decompressed
+    monkeypatch.setattr(ingest, "_open_decompressed", lambda file: opened.append(1) or original_open(file))
+
+    data = zstandard.ZstdCompressor().compress(csv_bytes(count_matrix, sep=";"))
+    parsed = read_count_matrix(io.BytesIO(data), chunk_rows=32)
+
+    expected = count_matrix[count_matrix.to_numpy().any(axis=1)]
+    pd.testing.assert_frame_equal(parsed, expected.astype(np.uint32))
+    assert len(opened) == 1
+
+
+def test_fractional_counts_after_integer_chunks(count_matrix):
+    count_matrix = count_matrix.astype(np.float64)
+    count_matrix.iloc[-1, 0] = 0.5
+
+    parsed = read_count_matrix(io.BytesIO(csv_bytes(count_matrix)), chunk_rows=16)
+
+    expected = count_matrix[count_matrix.to_numpy().any(axis=1)]
+    pd.testing.assert_frame_equal(parsed, expected, check_dtype=False)
+    assert parsed.iloc[-1, 0] == 0.5
+
+
+@pytest.mark.parametrize("content", [b"", b"GeneID,s1,s2\n", b"GeneID,s1,s2\ng1,0,0\n"])
+def test_files_without_counts_are_rejected(content):
+    with pytest.raises(ValueError):
+        read_count_matrix(io.BytesIO(content))
+
+
+def test_integer_counts_are_stored_as_uint32():
+    count_matrix = pd.DataFrame({"s1": [0, 5], "s2": [7.0, 2 ** 32 - 1]})
+
+    compact = compact_counts(count_matrix)
+
+    assert (compact.dtypes == np.uint32).all()
+    assert compact.to_numpy().tolist() == [[0, 7], [5, 2 ** 32 - 1]]
+
+
+@pytest.mark.parametrize("values", [[[-1, 2]], [[0.5, 2]], [[2 ** 32, 2]]])
+def test_other_values_are_kept(values):
+    count_matrix = pd.DataFrame(values, columns=["s1", "s2"])
+
+    assert compact_counts(count_matrix) is count_matrix
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+from functions.normalized_counts import size_factors
+
+
+def test_poscounts_uses_genes_with_small_geometric_means():
+    # Every gene has a zero count, and every positive geometric mean is <= 1
+    count_matrix = pd.DataFrame([[1, 0, 1], [0, 1, 1], [1, 1, 0]], columns=["s1", "s2", "s3"])
+
+    sf = size_factors(count_matrix)
+
+    assert np.isfinite(sf).all()
+    assert sf == pytest.approx([1.0, 1.0, 1.0])
+
+
+def test_sample_without_counts_is_rejected():
+    count_matrix = pd.DataFrame([[1, 0, 2], [0, 0, 1]], columns=["s1", "s2", "s3"])
+
+    with pytest.raises(ValueError, match="s2"):
+        size_factors(count_matrix)
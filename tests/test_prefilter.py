@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from functions.prefilter import prefilter_genes, filtered_counts
+
+
+@pytest.fixture
+def count_matrix():
+    return pd.DataFrame(
+        [[0, 0, 0, 0], [3, 3, 3, 0], [10, 0, 0, 0], [5, 5, 0, 0], [20, 30, 40, 50]],
+        index=["none", "low", "single", "pair", "high"],
+        columns=["s1", "s2", "s3", "s4"]
+    ).astype(np.uint32)
+
+
+def test_minimum_total_count(count_matrix):
+    filtered, summary = prefilter_genes(count_matrix, method="total", min_count=10)
+
+    assert filtered.index.tolist() == ["single", "pair", "high"]
+    assert summary == {"genes_before": 5, "genes_removed": 2}
+
+
+def test_minimum_count_in_samples(count_matrix):
+    filtered, summary = prefilter_genes(count_matrix, method="samples", min_count=3, min_samples=3)
+
+    assert filtered.index.tolist() == ["low", "high"]
+    assert summary == {"genes_before": 5, "genes_removed": 3}
+
+
+def test_total_count_does_not_overflow():
+    count_matrix = pd.DataFrame([[2 ** 31, 2 ** 31]], columns=["s1", "s2"]).astype(np.uint32)
+
+    filtered, _ = prefilter_genes(count_matrix, method="total", min_count=2 ** 32)
+
+    assert len(filtered) == 1
+
+
+def test_unfiltered_matrix_is_returned_as_is(count_matrix):
+    assert prefilter_genes(count_matrix, method=None)[0] is count_matrix
+    assert prefilter_genes(count_matrix, method="total", min_count=0)[0] is count_matrix
+
+
+def test_unknown_method_is_rejected(count_matrix):
+    with pytest.raises(ValueError):
+        prefilter_genes(count_matrix, method="mean")
+
+
+def test_filtered_matrix_is_reused_until_the_settings_change(count_matrix):
+    state = {}
+    settings = {"method": "total", "min_count": 10, "min_samples": 3}
+
+    first, _ = filtered_counts(count_matrix, settings, state)
+    assert filtered_counts(count_matrix, dict(settings), state)[0] is first
+
+    changed, _ = filtered_counts(count_matrix, {**settings, "min_count": 1}, state)
+    assert changed is not first
+    assert changed.index.tolist() == ["low", "single", "pair", "high"]
+    assert filtered_counts(count_matrix, settings, state)[0] is first
+
+
+def test_sessions_sharing_a_matrix_keep_their_own_results(count_matrix):
+    states = [{}, {}]
+    settings = [{"method": "total", "min_count": 10, "min_samples": 3},
+                {"method": "samples", "min_count": 3, "min_samples": 3}]
+
+    first = [filtered_counts(count_matrix, s, state)[0] for s, state in zip(settings, states)]
+    again = [filtered_counts(count_matrix, s, state)[0] for s, state in zip(settings, states)]
+
+    assert all(a is b for a, b in zip(first, again))
+
+
+def test_results_of_another_matrix_are_not_reused(count_matrix):
+    state = {}
+    settings = {"method": "total", "min_count": 10, "min_samples": 3}
+    filtered_counts(count_matrix, settings, state)
+
+    other = count_matrix.copy()
+    other.iloc[0] = 100
+
+    assert filtered_counts(other, settings, state)[0].index.tolist() == ["none", "single", "pair", "high"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from functions.results_index import significant_positions, sort_order, search_genes, results_page, ABS_LFC, GENE_ID
+
+
+@pytest.fixture
+def results():
+    return pd.DataFrame(
+        {
+            "baseMean": [10.0, 200.0, 50.0, 5.0, 80.0, 0.0],
+            "log2FoldChange": [2.0, -3.0, 0.5, 1.5, -1.2, np.nan],
+            "padj": [0.001, 0.02, 0.0001, np.nan, 0.04, np.nan]
+        },
+        index=["GeneB", "geneA", "Gene10", "gene2", "ABC1", "Gene1"]
+    )
+
+
+@pytest.mark.parametrize("pval_threshold, lfc_threshold", [(0.05, 1.0), (0.03, 0.0), (0.01, 1.0), (1e-5, 0.0)])
+def test_significant_genes_match_the_boolean_masks(results, pval_threshold, lfc_threshold):
+    up, down = significant_positions(results, pval_threshold, lfc_threshold)
+
+    significant = results["padj"] < pval_threshold
+    expected_up = np.flatnonzero(significant & (results["log2FoldChange"] > lfc_threshold))
+    expected_down = np.flatnonzero(significant & (results["log2FoldChange"] < -lfc_threshold))
+    assert up.tolist() == expected_up.tolist()
+    assert down.tolist() == expected_down.tolist()
+
+
+@pytest.mark.parametrize("column, ascending, expected", [
+    ("padj", True, [2, 0, 1, 4, 3, 5]),
+    ("padj", False, [4, 1, 0, 2, 3, 5]),
+    (ABS_LFC, True, [2, 4, 3, 0, 1, 5]),
+    (ABS_LFC, False, [1, 0, 3, 4, 2, 5]),
+    (GENE_ID, True, [4, 5, 2, 3, 1, 0]),
+    (GENE_ID, False, [0, 1, 3, 2, 5, 4])
+])
+def test_sort_order_keeps_missing_values_last(results, column, ascending, expected):
+    assert sort_order(results, column, ascending).tolist() == expected
+
+
+@pytest.mark.parametrize("query, expected", [("gene1", [2, 5]), (" GENE", [0, 1, 2, 3, 5]), ("xyz", [])])
+def test_gene_search_by_prefix(results, query, expected):
+    assert search_genes(results, query).tolist() == expected
+
+
+def test_page_of_sorted_search_results(results):
+    page, n_matches = results_page(results, sort_by="padj", query="gene", page=2, page_size=2)
+
+    assert page.index.tolist() == ["geneA", "gene2"]
+    assert n_matches == 5
+
+
+def test_page_in_table_order(results):
+    page, n_matches = results_page(results, page=3, page_size=2)
+
+    assert page.index.tolist() == ["ABC1", "Gene1"]
+    assert n_matches == 6
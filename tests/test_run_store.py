@@ -0,0 +1,99 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from functions import run_store
+from functions.dge_analysis import run_batch_dge
+from functions.fit_cache import get_fitted_dds
+from functions.run_store import save_run, list_runs, load_run, delete_run, can_delete_run
+
+
+@pytest.fixture
+def fitted(dataset):
+    count_matrix, metadata, factor = dataset
+    contrasts = [[factor, "C2", "C1"]]
+    dds = get_fitted_dds(count_matrix, metadata, factor)
+    return count_matrix, metadata, factor, contrasts, dds, run_batch_dge(dds, contrasts)
+
+
+@pytest.fixture(autouse=True)
+def ordered_run_ids(monkeypatch):
+    # Run IDs of runs saved within the same second are ordered by creation
+    counter = itertools.count()
+    monkeypatch.setattr(run_store, "new_run_id", lambda: f"20240101-000000-{next(counter):06d}")
+
+
+def save(fitted, store_dir, owner=None, label="C2_vs_C1"):
+    count_matrix, metadata, factor, contrasts, dds, batch_results = fitted
+    # A new comparison label makes the run differ from the runs saved before
+    batch_results = {label: batch_results["C2_vs_C1"]}
+    return save_run(dds, batch_results, count_matrix, metadata, factor, contrasts, owner=owner,
+                    store_dir=str(store_dir))
+
+
+def test_saved_run_is_reopened_unchanged(fitted, tmp_path):
+    count_matrix, metadata, factor, contrasts, dds, batch_results = fitted
+
+    run_id = save(fitted, tmp_path, owner="user:a")
+    run = load_run(run_id, "user:a", store_dir=str(tmp_path))
+
+    pd.testing.assert_frame_equal(run["count_matrix"], count_matrix)
+    pd.testing.assert_frame_equal(run["metadata"], metadata)
+    pd.testing.assert_frame_equal(run["batch_results"]["C2_vs_C1"], batch_results["C2_vs_C1"])
+    assert run["info"]["factor"] == factor
+    np.testing.assert_allclose(run["dds"].obsm["size_factors"], dds.obsm["size_factors"])
+    np.testing.assert_allclose(run["dds"].varm["dispersions"], dds.varm["dispersions"])
+    pd.testing.assert_frame_equal(run["dds"].varm["LFC"], dds.varm["LFC"])
+
+    # The rebuilt dataset gives the same comparison without refitting
+    recomputed = run_batch_dge(run["dds"], contrasts)["C2_vs_C1"]
+    pd.testing.assert_frame_equal(recomputed, batch_results["C2_vs_C1"])
+
+
+def test_same_run_is_saved_once(fitted, tmp_path):
+    first = save(fitted, tmp_path, owner="user:a")
+
+    assert save(fitted, tmp_path, owner="user:a") == first
+    assert len(list_runs("user:a", str(tmp_path))) == 1
+
+
+def test_runs_are_only_available_to_their_owner(fitted, tmp_path):
+    store_dir = str(tmp_path)
+    own_run = save(fitted, tmp_path, owner="user:a")
+    shared_run = save(fitted, tmp_path, owner=None, label="shared")
+
+    assert [run["id"] for run in list_runs("user:a", store_dir)] == [shared_run, own_run]
+    assert [run["id"] for run in list_runs("user:b", store_dir)] == [shared_run]
+
+    with pytest.raises(PermissionError):
+        load_run(own_run, "user:b", store_dir=store_dir)
+    assert not can_delete_run(own_run, "user:b", store_dir)
+    with pytest.raises(PermissionError):
+        delete_run(own_run, "user:b", store_dir)
+
+    assert can_delete_run(shared_run, "user:b", store_dir)
+    delete_run(own_run, "user:a", store_dir)
+    assert [run["id"] for run in list_runs("user:a", store_dir)] == [shared_run]
+
+
+def test_run_limit_applies_per_owner(fitted, tmp_path, monkeypatch):
+    store_dir = str(tmp_path)
+    monkeypatch.setattr(run_store, "MAX_RUNS", 2)
+
+    other_run = save(fitted, tmp_path, owner="user:b")
+    own_runs = [save(fitted, tmp_path, owner="user:a", label=f"run{i}") for i in range(3)]
+
+    assert [run["id"] for run in list_runs("user:a", store_dir)] == own_runs[:0:-1]
+    assert [run["id"] for run in list_runs("user:b", store_dir)] == [other_run]
+
+
+def test_runs_without_owner_are_pruned_without_runs_of_users(fitted, tmp_path, monkeypatch):
+    store_dir = str(tmp_path)
+    monkeypatch.setattr(run_store, "MAX_RUNS", 1)
+
+    user_run = save(fitted, tmp_path, owner="user:a")
+    save(fitted, tmp_path, owner=None, label="first")
+    shared_run = save(fitted, tmp_path, owner=None, label="second")
+
+    assert [run["id"] for run in list_runs(None, store_dir)] == [shared_run]
+    assert [run["id"] for run in list_runs("user:a", store_dir)] == [shared_run, user_run]
@@ -1,9 +1,13 @@
 import streamlit as st
-from functions.maplot import ma_plot
-from functions.volcano_plot import volcano_plot
-from functions.clustermap import plot_heatmap
+import streamlit.components.v1 as components
+from functions.maplot import ma_plot, interactive_ma_plot
+from functions.volcano_plot import volcano_plot, interactive_volcano_plot
+from functions.clustermap import plot_heatmap, MAX_HEATMAP_GENES
 from functions.clustermap_custom import custom_heatmap
 from functions.expression_trends import expression_trends
+from functions.scatter_genes import DENSITY_MIN_GENES
+from functions.webgl_scatter import COMPONENT_HEIGHT
+from functions.figure_cache import cached_figure, cached_html  # Rendered plots shared between reruns
 from natsort import natsorted
 
 # Set page layout to wide and title
@@ -13,6 +17,28 @@ st.title("DGE Data Visualization")
 # Proceed only if DGE results exist in session state
 if "results" in st.session_state:
 
+    # Rendering of MA and volcano plots: density images by default for many genes
+    rendering_modes = ["Points", "Density", "Interactive"]
+    default_rendering = int(len(st.session_state["results"]) > DENSITY_MIN_GENES)
+    rendering_help = ("Points draws every gene as a marker. Density draws not significant genes as a "
+                      "shaded density image and only significant genes as markers, which is much faster "
+                      "for tens of thousands of genes. Interactive draws all genes in the browser (WebGL) "
+                      "with gene details on hover, zoom and thresholds that can be changed above the plot.")
+
+    # Heatmap columns: condition averages, or individual samples when normalized counts are available
+    heatmap_columns = ["Condition averages"]
+    if "normalized_counts" in st.session_state:
+        heatmap_columns.append("Individual samples")
+    heatmap_columns_help = ("Condition averages shows the mean normalized expression of each condition. "
+                            "Individual samples shows the normalized counts of every sample, with a color bar "
+                            "marking the condition of each sample.")
+
+    def heatmap_data(columns):
+        # Expression table and sample conditions (by the factor of the analysis) passed to the heatmap functions
+        if columns == "Individual samples":
+            return st.session_state["normalized_counts"], st.session_state["metadata"][st.session_state["dge_factor"]]
+        return st.session_state["average_counts"], None
+
     # Create 4 tabs for different visualizations
     tab1, tab2, tab3, tab4 = st.tabs([
         "MA Plot",
@@ -24,52 +50,100 @@ if "results" in st.session_state:
     # ---------------- TAB 1: MA PLOT ----------------
     with tab1:
         st.write("## Settings")
-        # Adjusted p-value threshold input for MA plot
-        pval_threshold_ma = st.number_input(
-            "padj-value Threshold",
-            min_value=0.000001,
-            max_value=1.0,
-            value=0.05,
-            step=0.001,
-            format="%.5g",
-            key="pval_ma",
-            help="Only genes with adjusted p-value (padj) below this threshold will be highlighted."
+        rendering_ma = st.radio(
+            "Rendering",
+            rendering_modes,
+            index=default_rendering,
+            horizontal=True,
+            key="rendering_ma",
+            help=rendering_help
         )
-        # Plot MA plot
-        st.pyplot(ma_plot(st.session_state["results"], pval_threshold=pval_threshold_ma, comp_label=st.session_state["comparison_label"]))
-
-    # ---------------- TAB 2: VOLCANO PLOT ----------------
-    with tab2:
-        st.write("## Settings")
-        col1, col2 = st.columns(2)
-        with col1:
-            # Fold change threshold input
-            lfc_threshold = st.slider(
-                "log2 Fold Change threshold",
-                0.0, 5.0, 1.0,
-                step=0.1,
-                key="lfc_volcano",
-                help="Minimum absolute value of log2 fold change to highlight significant genes."
+        if rendering_ma == "Interactive":
+            # Thresholds are changed in the browser, without rerunning the script
+            # (the page is built once per result table)
+            components.html(
+                cached_html(
+                    interactive_ma_plot,
+                    st.session_state["results"],
+                    comp_label=st.session_state["comparison_label"]
+                ),
+                height=COMPONENT_HEIGHT
             )
-        with col2:
-            # Adjusted p-value threshold input
-            pval_threshold_volcano = st.number_input(
+        else:
+            # Adjusted p-value threshold input for MA plot
+            pval_threshold_ma = st.number_input(
                 "padj-value Threshold",
                 min_value=0.000001,
                 max_value=1.0,
                 value=0.05,
                 step=0.001,
                 format="%.5g",
-                key="pval_volcano",
-                help="Only genes with adjusted p-value (padj) below this threshold will be considered significant."
+                key="pval_ma",
+                help="Only genes with adjusted p-value (padj) below this threshold will be highlighted."
             )
-        # Plot volcano plot
-        st.pyplot(volcano_plot(
-            st.session_state["results"],
-            pval_threshold=pval_threshold_volcano,
-            lfc_threshold=lfc_threshold,
-            comp_label=st.session_state["comparison_label"]
-        ))
+            # Plot MA plot (redrawn only when its inputs change)
+            st.image(cached_figure(
+                ma_plot,
+                st.session_state["results"],
+                pval_threshold=pval_threshold_ma,
+                comp_label=st.session_state["comparison_label"],
+                density=rendering_ma == "Density"
+            ), use_container_width=True)
+
+    # ---------------- TAB 2: VOLCANO PLOT ----------------
+    with tab2:
+        st.write("## Settings")
+        rendering_volcano = st.radio(
+            "Rendering",
+            rendering_modes,
+            index=default_rendering,
+            horizontal=True,
+            key="rendering_volcano",
+            help=rendering_help
+        )
+        if rendering_volcano == "Interactive":
+            # Thresholds are changed in the browser, without rerunning the script
+            # (the page is built once per result table)
+            components.html(
+                cached_html(
+                    interactive_volcano_plot,
+                    st.session_state["results"],
+                    comp_label=st.session_state["comparison_label"]
+                ),
+                height=COMPONENT_HEIGHT
+            )
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                # Fold change threshold input
+                lfc_threshold = st.slider(
+                    "log2 Fold Change threshold",
+                    0.0, 5.0, 1.0,
+                    step=0.1,
+                    key="lfc_volcano",
+                    help="Minimum absolute value of log2 fold change to highlight significant genes."
+                )
+            with col2:
+                # Adjusted p-value threshold input
+                pval_threshold_volcano = st.number_input(
+                    "padj-value Threshold",
+                    min_value=0.000001,
+                    max_value=1.0,
+                    value=0.05,
+                    step=0.001,
+                    format="%.5g",
+                    key="pval_volcano",
+                    help="Only genes with adjusted p-value (padj) below this threshold will be considered significant."
+                )
+            # Plot volcano plot (redrawn only when its inputs change)
+            st.image(cached_figure(
+                volcano_plot,
+                st.session_state["results"],
+                pval_threshold=pval_threshold_volcano,
+                lfc_threshold=lfc_threshold,
+                comp_label=st.session_state["comparison_label"],
+                density=rendering_volcano == "Density"
+            ), use_container_width=True)
 
     # ---------------- TAB 3: HEATMAP WITH TOP GENES ----------------
     with tab3:
@@ -78,9 +152,11 @@ if "results" in st.session_state:
         top_n = st.slider(
             "Select Top N Genes for Heatmap",
             min_value=5,
-            max_value=100,
+            max_value=MAX_HEATMAP_GENES,
             value=20,
-            help="Choose number of the most significant genes (based on padj and fold change) to be shown in the heatmap."
+            step=5,
+            help="Choose number of the most significant genes (based on padj and fold change) to be shown in the heatmap. "
+                 "Above 100 genes only a subset of gene labels is shown."
         )
 
         cluster_col, select_col = st.columns(2)
@@ -94,9 +170,16 @@ if "results" in st.session_state:
             )
             col_clustering = st.checkbox(
                 "Enable column clustering",
-                help="Cluster conditions based on expression similarity.",
+                help="Cluster conditions or samples based on expression similarity.",
                 key="col"
             )
+            columns = st.radio(
+                "Columns",
+                heatmap_columns,
+                horizontal=True,
+                key="heatmap_columns",
+                help=heatmap_columns_help
+            )
 
         with select_col:
             st.write("### Gene Selection Method")
@@ -109,22 +192,25 @@ if "results" in st.session_state:
                      "- adjusted p-value: most statistically significant"
             )
 
-        # Create heatmap with top N selected genes
-        heatmap = plot_heatmap(
+        # Create heatmap with top N selected genes (redrawn only when its inputs change)
+        expression, conditions = heatmap_data(columns)
+        heatmap = cached_figure(
+            plot_heatmap,
             st.session_state["results"],
-            st.session_state["average_counts"],
+            expression,
             top_n,
             row_clustering,
             col_clustering,
             ranking,
-            comp_label=st.session_state["comparison_label"]
+            comp_label=st.session_state["comparison_label"],
+            conditions=conditions
         )
 
         # Plot heatmap if exists
         if heatmap is None:
             st.warning("No genes passed the default thresholds for being considered differentially expressed (adjusted p-value < 0.05 and |log2 fold change| > 1).")
         else:
-            st.pyplot(heatmap)
+            st.image(heatmap, use_container_width=True)
 
     # ---------------- TAB 4: HEATMAP WITH CUSTOM GENES ----------------
     with tab4:
@@ -151,9 +237,16 @@ if "results" in st.session_state:
             )
             col_clustering_custom = st.checkbox(
                 "Enable column clustering",
-                help="Cluster conditions based on expression similarity.",
+                help="Cluster conditions or samples based on expression similarity.",
                 key="custom_col"
             )
+            columns_custom = st.radio(
+                "Columns",
+                heatmap_columns,
+                horizontal=True,
+                key="custom_heatmap_columns",
+                help=heatmap_columns_help
+            )
 
         if selected_genes_file:
             # Read gene list from file
@@ -161,12 +254,15 @@ if "results" in st.session_state:
             st.session_state["custom_genes"] = genes
 
         if "custom_genes" in st.session_state:
-            # Create heatmap from user-specified gene list
-            fig, missing_genes = custom_heatmap(
+            # Create heatmap from user-specified gene list (redrawn only when its inputs change)
+            expression, conditions = heatmap_data(columns_custom)
+            fig, missing_genes = cached_figure(
+                custom_heatmap,
                 st.session_state["custom_genes"],
-                st.session_state["average_counts"],
+                expression,
                 row_clustering_custom,
-                col_clustering_custom
+                col_clustering_custom,
+                conditions=conditions
             )
 
             # Plot heatmap if figure exists
@@ -178,13 +274,13 @@ if "results" in st.session_state:
             else:
                 if missing_genes:
                     st.warning(f"The following genes were not found and were ignored: {', '.join(missing_genes)}")
-                st.pyplot(fig)
+                st.image(fig, use_container_width=True)
 
                 # ----------- Expression trends section ------------
                 st.write("## Expression Trends")
 
                 # Get available condition levels from metadata
-                available_conditions = st.session_state["metadata"][st.session_state["factor"]].astype(
+                available_conditions = st.session_state["metadata"][st.session_state["dge_factor"]].astype(
                     str).unique().tolist()
                 default_order = natsorted(available_conditions)  # Use natural sorting for default suggestion
 
@@ -228,7 +324,7 @@ if "results" in st.session_state:
                         table = expression_trends(
                             genes=st.session_state["custom_genes"],
                             condition_order=ordered_conditions,
-                            factor=st.session_state["factor"],
+                            factor=st.session_state["dge_factor"],
                             padj_threshold=padj_threshold,
                             l2fc_threshold=l2fc_threshold,
                             dds=st.session_state["dds"]